@@ -1,13 +1,16 @@
 # app.py
-import os, json
+import os, json, multiprocessing, re, shutil, tempfile, time, zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from urllib.parse import unquote
 from flask import (
     Flask,
     request,
     send_file,
-    render_template_string,
+    render_template,
     abort,
     jsonify,
-    url_for
+    stream_with_context,
 )
 from sello_monarca.sello import sell, verify
 from sello_monarca.llaves import cargar_llave_privada, cargar_llave_publica
@@ -15,8 +18,18 @@ import datetime as dt
 from zoneinfo import ZoneInfo
 
 from hashlib import sha256
-from sello_monarca.sello import verify, META_KEY
-from datetime import timedelta
+from PyPDF2.errors import PdfReadError
+from sello_monarca.sello import verify, verificar_meta, verificar_contenido, META_KEY, PERFILES
+from sello_monarca.indice import IndiceDocumentos, fila_de_pdf, fila_de_almacen
+from sello_monarca.cache import CacheVerificacion, clave_documento
+from sello_monarca.almacen import AlmacenLocal
+from sello_monarca.sharepoint import SalidaSharePoint, ClienteGraph, DestinoGraph, DestinoArchivos
+from sello_monarca.paginas import RecursosEstaticos, comprimir, fecha_legible, huella, huella_directorio
+from sello_monarca.ejecutor import EjecutorSellado, ColaLlena
+from sello_monarca import metricas
+from sello_monarca.utils import base64_a_bytes
+from sello_monarca.trabajos import ColaTrabajos, Reintentar, PENDIENTE, PROCESANDO, ERROR
+from sello_monarca.idempotencia import RegistroIdempotencia, ClaveReutilizada, EnCurso, huella_peticion
 
 from dotenv import load_dotenv
 
@@ -27,11 +40,29 @@ load_dotenv(override=True)
 PRIVATE_KEY_ENV = os.getenv("PRIVATE_KEY_PEM")
 PUBLIC_KEY_ENV  = os.getenv("PUBLIC_KEY_PEM")
 
-from sello_monarca.llaves import cargar_llave_privada_desde_env,  cargar_llave_publica_desde_env
+from sello_monarca.llaves import cargar_llave_privada_desde_env,  cargar_llave_publica_desde_env, RegistroLlaves
 
-PRIVATE_KEY = cargar_llave_privada_desde_env(PRIVATE_KEY_ENV, password=b"secreto")
+# SELLO_ROLE=verify: réplica sólo de verificación pública (/v, /verify,
+# /file, /download). No descifra la llave privada, no arranca los trabajos
+# ni la salida a SharePoint y nunca importa ReportLab/qrcode (la portada
+# sólo se genera al sellar); las rutas de sellado responden 404.
+SELLO_ROLE = os.getenv("SELLO_ROLE", "all")
+if SELLO_ROLE not in ("all", "verify"):
+    raise ValueError(f"SELLO_ROLE debe ser 'all' o 'verify', no {SELLO_ROLE!r}")
+SOLO_VERIFICAR = SELLO_ROLE == "verify"
+
+PRIVATE_KEY = None if SOLO_VERIFICAR else cargar_llave_privada_desde_env(PRIVATE_KEY_ENV, password=b"secreto")
 PUBLIC_KEY  = cargar_llave_publica_desde_env(PUBLIC_KEY_ENV)
 
+# Llaves públicas por kid: la actual y las anteriores a una rotación
+# (*.pem en PUBLIC_KEYS_DIR), para que los sellos viejos sigan verificando
+# mientras `python -m sello_monarca.refirma` los pasa a la llave nueva
+LLAVES_PUBLICAS = RegistroLlaves([PUBLIC_KEY])
+if PRIVATE_KEY is not None:
+    LLAVES_PUBLICAS.agregar(PRIVATE_KEY.public_key())
+if os.getenv("PUBLIC_KEYS_DIR"):
+    LLAVES_PUBLICAS.cargar_directorio(os.getenv("PUBLIC_KEYS_DIR"))
+
 # Resto de variables
 SP_SITE      = os.getenv("SP_SITE")
 SP_DOC_LIB   = os.getenv("SP_DOC_LIB")
@@ -40,11 +71,354 @@ API_BASE_URL = os.getenv("API_BASE_URL", "http://127.0.0.1:5000")
 TZ           = os.getenv("TZ", "America/Monterrey")
 SAVE_LOCAL = os.getenv("SAVE_LOCAL", "0") == "1" # Si es 1, guarda PDFs en disco local
 
-# Crear carpeta local para PDFs
-STORAGE_DIR = "storage"
+# Carpeta local para PDFs: relativa a este archivo y no al directorio de
+# trabajo con que se arranque el servidor
+STORAGE_DIR = os.path.abspath(os.getenv(
+    "STORAGE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "storage")))
 os.makedirs(STORAGE_DIR, exist_ok=True)
 
+# PDFs sellados: repartidos por doc_id, escritura atómica y originales
+# deduplicados (ver sello_monarca/almacen.py)
+ALMACEN = AlmacenLocal(STORAGE_DIR, sincronizar=os.getenv("STORAGE_FSYNC", "1") == "1")
+
+# Índice SQLite de documentos sellados (evita parsear PDFs en /v y /download)
+INDICE = IndiceDocumentos(os.getenv("INDEX_DB", os.path.join(STORAGE_DIR, "indice.sqlite3")))
+
+# Caché de verificaciones para /v (VERIFY_CACHE_DB activa el nivel compartido en disco)
+CACHE_VERIFICACION = CacheVerificacion(
+    capacidad=int(os.getenv("VERIFY_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("VERIFY_CACHE_TTL", "300")),
+    ruta_disco=os.getenv("VERIFY_CACHE_DB") or None,
+)
+
+# PDFs recibidos: se vuelcan a disco por bloques y se sellan desde ahí (mmap)
+SPOOL_DIR = os.getenv("JOBS_SPOOL", os.path.join(STORAGE_DIR, "spool"))
+if not SOLO_VERIFICAR:
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+
+# Histogramas por etapa en /metrics (Prometheus). METRICS_DIR lo comparten
+# todos los workers de gunicorn y del pool; sin él no se mide nada.
+METRICS_DIR = os.getenv("METRICS_DIR") or None
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "10"))
+if METRICS_DIR:
+    metricas.activar(METRICS_DIR, METRICS_INTERVAL)
+
+# Sellado en un pool de procesos (SELLO_WORKERS=0 sella en el hilo de la petición).
+# Con la cola llena /sign y /sign-json responden 503. SELLO_MAX_MEMORIA_MB
+# limita la memoria de cada worker del pool y X-Peak-RSS-KB informa el pico
+# del worker; con SELLO_WORKERS=0 no hay límite ni cabecera.
+# SELLO_PERFIL=compacto sella la versión compacta del original (object
+# streams, Flate, recursos repetidos fusionados; ver compacto.py) en lugar
+# de anexar el sello a sus bytes. La compactación es en memoria: originales
+# de más de compacto.MAX_ENTRADA (16 MiB) se sellan incrementales para no
+# romper el límite de memoria.
+SELLO_PERFIL = os.getenv("SELLO_PERFIL", "incremental")
+if SELLO_PERFIL not in PERFILES:
+    raise ValueError(f"SELLO_PERFIL debe ser uno de {PERFILES}, no {SELLO_PERFIL!r}")
+EJECUTOR = EjecutorSellado(
+    PRIVATE_KEY_ENV,
+    password=b"secreto",
+    workers=int(os.getenv("SELLO_WORKERS", "0")),
+    cola_max=int(os.getenv("SELLO_COLA_MAX", "16")),
+    espera=float(os.getenv("SELLO_COLA_ESPERA", "0")),
+    llave=PRIVATE_KEY,
+    max_memoria_mb=int(os.getenv("SELLO_MAX_MEMORIA_MB", "0")),
+    metricas_dir=METRICS_DIR,
+    metricas_intervalo=METRICS_INTERVAL,
+    perfil=SELLO_PERFIL,
+)
+
+def _respuesta_cola_llena():
+    return jsonify({"error": "Servidor ocupado, intenta de nuevo"}), 503, {"Retry-After": "5"}
+
+def _guardar_sellado(pdf_sellado_bytes: bytes, doc_id: str) -> dict:
+    """Guarda el PDF en el almacén y devuelve su fila para el índice."""
+    fila = fila_de_pdf(pdf_sellado_bytes)
+    meta = json.loads(fila["meta_json"])
+    with metricas.etapa("escritura"):
+        ALMACEN.guardar_bytes(doc_id, pdf_sellado_bytes,
+                              meta.get("content_sha256"), meta.get("content_length"))
+    return fila
+
+_BLOQUE_CUERPO = 1 << 20
+
+def _volcar_a_spool(origen) -> str:
+    """
+    Escribe en SPOOL_DIR un archivo temporal con `origen` (bytes o un
+    archivo/stream que se copia por bloques) y devuelve su ruta.
+    """
+    fd, ruta = tempfile.mkstemp(suffix=".pdf", dir=SPOOL_DIR)
+    with os.fdopen(fd, "wb") as f:
+        if isinstance(origen, (bytes, bytearray, memoryview)):
+            f.write(origen)
+        else:
+            shutil.copyfileobj(origen, f, _BLOQUE_CUERPO)
+    return ruta
+
+def _sellar_y_guardar(ruta_entrada: str, user_meta: dict, url_root: str):
+    """
+    Sella el PDF de `ruta_entrada` escribiendo directo en un temporal del
+    almacén, lo publica con ALMACEN.guardar() y lo registra en el índice.
+    Devuelve (doc_id, pico de RSS en KiB del sellado o None sin pool).
+    """
+    with ALMACEN.temporal() as ruta_tmp:
+        doc_id, sha_archivo, pico_kb = EJECUTOR.sellar_archivo(ruta_entrada, ruta_tmp, user_meta,
+                                                               base_url=url_root + "v/")
+        tam = os.path.getsize(ruta_tmp)
+        # El sha se calculó mientras se escribía: no se vuelve a leer el archivo
+        fila = fila_de_pdf(ruta_tmp, size=tam, sha=sha_archivo)
+        meta = json.loads(fila["meta_json"])
+        with metricas.etapa("escritura"):
+            ALMACEN.guardar(doc_id, ruta_tmp, meta.get("content_sha256"), meta.get("content_length"))
+    with metricas.etapa("indice"):
+        INDICE.registrar(fila)
+    if SHAREPOINT is not None:
+        SHAREPOINT.encolar([fila])
+    app.logger.info("sellado %s: %d bytes, pico RSS %s KiB", doc_id, tam, pico_kb)
+    return doc_id, pico_kb
+
+def _cabeceras_respuesta(pico_kb, repetida: bool) -> dict:
+    """X-Peak-RSS-KB (sólo si se midió en un worker del pool) e Idempotent-Replayed."""
+    cabeceras = {"Idempotent-Replayed": str(repetida).lower()}
+    if pico_kb is not None:
+        cabeceras["X-Peak-RSS-KB"] = str(pico_kb)
+    return cabeceras
+
+def _fila_indexada(doc_id: str):
+    """
+    Fila del índice del documento, o None si no existe o no está sellado.
+    Si el documento es anterior al índice se lee del PDF una sola vez y se
+    registra; uno sin /CM_META (o dañado) no se registra.
+    """
+    fila = INDICE.obtener(doc_id)
+    if fila is None and ALMACEN.version(doc_id) is not None:
+        try:
+            fila = fila_de_almacen(ALMACEN, doc_id)
+        except FileNotFoundError:
+            return None
+        except (ValueError, PdfReadError) as e:
+            app.logger.warning("documento %s sin sello legible: %s", doc_id, e)
+            return None
+        INDICE.registrar(fila)
+    return fila
+
+# Los sellados no cambian: el navegador (y el visor del iframe de /v) los
+# guarda FILE_CACHE_MAX_AGE segundos sin volver a preguntar
+FILE_CACHE_MAX_AGE = int(os.getenv("FILE_CACHE_MAX_AGE", str(365 * 24 * 3600)))
+
+def _enviar_pdf(doc_id: str, **kwargs):
+    """
+    send_file() del documento con ETag fuerte (sha256 del archivo, del
+    índice), Cache-Control immutable, 304 con If-None-Match y rangos de
+    bytes. Por ruta si está completo en disco (gunicorn usa sendfile), si
+    no como stream del almacén.
+    """
+    fila = _fila_indexada(doc_id)
+    if fila is None:
+        abort(404)
+    etag = fila["sha256"]
+
+    # Revalidación: se responde sin abrir el archivo
+    if etag and request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+        resp.set_etag(etag)
+    else:
+        ruta = ALMACEN.ruta_local(doc_id)
+        if ruta is not None:
+            resp = send_file(ruta, mimetype="application/pdf", etag=etag or True, **kwargs)
+        else:
+            try:
+                resp = send_file(ALMACEN.abrir(doc_id), mimetype="application/pdf",
+                                 conditional=False, etag=False, **kwargs)
+                tamano = ALMACEN.tamano(doc_id)
+            except FileNotFoundError:
+                abort(404)
+            if etag:
+                resp.set_etag(etag)
+            resp.content_length = tamano
+            resp.make_conditional(request, accept_ranges=True, complete_length=tamano)
+        resp.accept_ranges = "bytes"
+    resp.cache_control.no_cache = None
+    resp.cache_control.public = True
+    resp.cache_control.max_age = FILE_CACHE_MAX_AGE
+    resp.cache_control.immutable = True
+    return resp
+
+def _sellar_subida(ruta_entrada: str, user_meta: dict, url_root: str):
+    """_sellar_y_guardar() para una petición: borra la entrada y traduce errores a respuestas."""
+    try:
+        return _sellar_y_guardar(ruta_entrada, user_meta, url_root), None
+    except ColaLlena:
+        return None, _respuesta_cola_llena()
+    except MemoryError:
+        return None, (jsonify({"error": "El documento excede el límite de memoria del sellado"}), 413)
+    finally:
+        os.remove(ruta_entrada)
+
+# Reintentos de /sign y /sign-json (Power Automate repite la petición tras
+# un timeout): misma Idempotency-Key, o mismo PDF y metadatos, dentro de
+# IDEMPOTENCY_TTL segundos devuelve el documento ya sellado
+IDEMPOTENCIA = None if SOLO_VERIFICAR else RegistroIdempotencia(
+    os.getenv("IDEMPOTENCY_DB", os.path.join(STORAGE_DIR, "idempotencia.sqlite3")),
+    ventana=float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600))),
+    espera=float(os.getenv("IDEMPOTENCY_WAIT", "120")),
+)
+
+def _reclamar_idempotencia(ruta_entrada: str, user_meta: dict, modo: str, vigente=None):
+    """
+    Reserva la clave de la petición. Devuelve (clave, resultado previo o
+    None, respuesta de error o None); con resultado previo o error borra la
+    entrada, que ya no se va a sellar.
+    - vigente: función resultado -> bool; un resultado previo no vigente se
+      descarta y la petición se procesa de nuevo.
+    """
+    llave = request.headers.get("Idempotency-Key", "").strip()
+    if len(llave) > 255:
+        os.remove(ruta_entrada)
+        return None, None, (jsonify({"error": "Idempotency-Key demasiado larga"}), 400)
+    huella_pdf = huella_peticion(ruta_entrada, user_meta)
+    clave = f"{modo}:{llave or 'sha256:' + huella_pdf}"
+    previo = error = None
+    try:
+        previo = IDEMPOTENCIA.reclamar(clave, huella_pdf)
+        if previo is not None and vigente is not None and not vigente(previo):
+            IDEMPOTENCIA.olvidar(clave, previo)
+            previo = IDEMPOTENCIA.reclamar(clave, huella_pdf)
+    except ClaveReutilizada:
+        error = jsonify({"error": "Idempotency-Key ya usada con otro documento"}), 422
+    except EnCurso:
+        error = jsonify({"error": "La misma petición sigue en curso"}), 409, {"Retry-After": "5"}
+    if previo is not None or error is not None:
+        os.remove(ruta_entrada)
+    return clave, previo, error
+
+def _sellar_una_vez(ruta_entrada: str, user_meta: dict, url_root: str, modo: str):
+    """
+    _sellar_subida() idempotente. Devuelve ((doc_id, pico_kb), repetida,
+    error); con repetida=True el documento ya estaba sellado y no se selló
+    otra vez.
+    """
+    clave, previo, error = _reclamar_idempotencia(ruta_entrada, user_meta, modo)
+    if error is not None:
+        return None, False, error
+    if previo is not None:
+        return (previo["doc_id"], previo["pico_kb"]), True, None
+    try:
+        sellado, error = _sellar_subida(ruta_entrada, user_meta, url_root)
+    except BaseException:
+        IDEMPOTENCIA.liberar(clave)
+        raise
+    if error is not None:
+        IDEMPOTENCIA.liberar(clave)
+    else:
+        IDEMPOTENCIA.completar(clave, {"doc_id": sellado[0], "pico_kb": sellado[1]})
+    return sellado, False, error
+
+def _trabajo_vigente(previo: dict) -> bool:
+    """Un reintento de ?async=1 recibe el trabajo anterior salvo que haya fallado o ya no exista."""
+    trabajo = TRABAJOS.obtener(previo["job_id"])
+    return trabajo is not None and trabajo["estado"] != ERROR
+
+def _cabeceras_sellado(doc_id: str, user_meta: dict, url_root: str) -> dict:
+    """Cabeceras que espera el Flow de Power Automate en /sign-json."""
+    orig_name = user_meta["original_filename"]
+    return {
+        "Content-Type":       "application/pdf",
+        "X-Doc-ID":            doc_id,
+        "X-Verify-URL":        url_root + f"v/{doc_id}",
+        "X-Uploader":          user_meta["uploader"],
+        "X-Area":              user_meta["area"],
+        "X-Original-Filename": orig_name,
+        "X-Uploaded-At":       dt.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "X-Download-Name":     f"{os.path.splitext(orig_name)[0]}_sellado.pdf",
+        "Content-Disposition": f'attachment; filename="{doc_id}.pdf"'
+    }
+
+def _procesar_trabajo(ruta_pdf: str, user_meta: dict, url_root: str) -> dict:
+    try:
+        doc_id, _ = _sellar_y_guardar(ruta_pdf, user_meta, url_root)
+    except ColaLlena:
+        raise Reintentar()
+    return {"headers": _cabeceras_sellado(doc_id, user_meta, url_root)}
+
+# Trabajos asíncronos de /sign-json?async=1: estado en SQLite y PDFs de
+# entrada en un spool, así sobreviven a un reinicio del worker. Una réplica
+# de verificación no los atiende (ni crea su base)
+TRABAJOS = None if SOLO_VERIFICAR else ColaTrabajos(
+    os.getenv("JOBS_DB", os.path.join(STORAGE_DIR, "trabajos.sqlite3")),
+    SPOOL_DIR,
+    _procesar_trabajo,
+    hilos=int(os.getenv("JOBS_HILOS", str(max(EJECUTOR.workers, 1)))),
+)
+def _destino_sharepoint():
+    """DestinoGraph con SP_SITE/SP_DOC_LIB/SP_LIST, DestinoArchivos con SP_LOCAL_DIR, o None."""
+    if os.getenv("SP_LOCAL_DIR"):
+        return DestinoArchivos(os.getenv("SP_LOCAL_DIR"))
+    if not (SP_SITE and SP_DOC_LIB and SP_LIST):
+        return None
+    cliente = ClienteGraph(
+        os.getenv("SP_TENANT_ID", ""),
+        os.getenv("SP_CLIENT_ID", ""),
+        os.getenv("SP_CLIENT_SECRET", ""),
+        base_url=os.getenv("SP_GRAPH_URL", "https://graph.microsoft.com/v1.0"),
+        token_url=os.getenv("SP_TOKEN_URL") or None,
+    )
+    return DestinoGraph(cliente, SP_SITE, SP_DOC_LIB, SP_LIST, carpeta=os.getenv("SP_CARPETA", ""))
+
+def _abrir_para_sharepoint(doc_id: str):
+    return ALMACEN.abrir(doc_id), ALMACEN.tamano(doc_id)
+
+# Copia de cada documento sellado en SharePoint, en segundo plano (sin
+# SP_* configurado no se encola nada)
+_DESTINO_SP = None if SOLO_VERIFICAR else _destino_sharepoint()
+SHAREPOINT = SalidaSharePoint(
+    os.getenv("SP_OUTBOX_DB", os.path.join(STORAGE_DIR, "sharepoint.sqlite3")),
+    _DESTINO_SP,
+    _abrir_para_sharepoint,
+    paralelo=int(os.getenv("SP_CONEXIONES", "4")),
+) if _DESTINO_SP is not None else None
+
+# Los hijos del pool de sellado (spawn) re-importan este módulo: no deben tomar trabajos
+if multiprocessing.parent_process() is None and not SOLO_VERIFICAR:
+    TRABAJOS.iniciar()
+    if SHAREPOINT is not None:
+        SHAREPOINT.iniciar()
+
 app = Flask(__name__, static_folder="static", static_url_path="/static")
+if EJECUTOR.max_memoria_mb and not EJECUTOR.workers:
+    app.logger.warning("SELLO_MAX_MEMORIA_MB sólo aplica con SELLO_WORKERS > 0; se ignora")
+# USE_X_SENDFILE=1 delega el envío de los PDFs al servidor web (Apache, lighttpd)
+app.config["USE_X_SENDFILE"] = os.getenv("USE_X_SENDFILE", "0") == "1"
+
+_RUTAS_SELLADO = {"sign_document", "sign_json", "sign_batch", "estado_trabajo"}
+
+if SOLO_VERIFICAR:
+    @app.before_request
+    def _solo_verificacion():
+        if request.endpoint in _RUTAS_SELLADO:
+            return jsonify({"error": "Este servidor sólo verifica documentos"}), 404
+
+if metricas.activo():
+    # Sólo se registran con METRICS_DIR: desactivadas no cuestan nada por petición
+    @app.before_request
+    def _iniciar_cronometro():
+        request.environ["sello.inicio"] = time.perf_counter()
+
+    @app.after_request
+    def _observar_peticion(resp):
+        inicio = request.environ.get("sello.inicio")
+        if inicio is not None:
+            metricas.observar("sello_http_segundos", time.perf_counter() - inicio,
+                              ruta=request.url_rule.rule if request.url_rule else "desconocida",
+                              metodo=request.method, estado=str(resp.status_code))
+        return resp
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Histogramas de todos los procesos en formato de texto de Prometheus."""
+    if not metricas.activo():
+        abort(404)
+    return metricas.exportar(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
 
 @app.route("/health", methods=["GET"])
 def health():
@@ -68,25 +442,18 @@ def sign_document():
     # Nombre “amigable” para la descarga, pero NO usarlo para almacenamiento
     download_name = f"{name_root}_sellado{ext}"
 
-    # 2. Leer bytes PDF y metadata (JSON) de usuario
-    pdf_bytes = uploaded_file.read()
+    # 2. Volcar el PDF a disco (por bloques) y leer la metadata (JSON) de usuario
     user_meta = json.loads(request.form["meta"])
+    ruta_entrada = _volcar_a_spool(uploaded_file.stream)
     # Guardamos el nombre original dentro de la metadata
     user_meta["original_filename"] = original_name
 
-    # 3. Generar sello usando la función sell()
-    #    La función sell() devuelve (pdf_final_bytes, doc_id)
-    pdf_sellado_bytes, doc_id = sell(
-        pdf_bytes,
-        user_meta,
-        PRIVATE_KEY,
-        base_url=request.url_root + "v/"
-    )
-
-    # 4. Guardar el PDF sellado con nombre único = {doc_id}.pdf
-    save_path = os.path.join(STORAGE_DIR, f"{doc_id}.pdf")
-    with open(save_path, "wb") as f:
-        f.write(pdf_sellado_bytes)
+    # 3. Sellar y guardar con nombre único = {doc_id}.pdf (un reintento
+    #    devuelve el doc_id del primer sellado)
+    sellado, repetida, error = _sellar_una_vez(ruta_entrada, user_meta, request.url_root, "sign")
+    if error:
+        return error
+    doc_id, pico_kb = sellado
 
     # 5. Devolver JSON con campos:
     #    - doc_id         (para verificación)
@@ -97,42 +464,67 @@ def sign_document():
         "verify_url": request.url_root + f"v/{doc_id}",
         "download_url": request.url_root + f"download/{doc_id}",
         "download_name": download_name
-    }), 200
+    }), 200, _cabeceras_respuesta(pico_kb, repetida)
 
-import base64, re
+_TIPOS_BINARIOS = ("application/pdf", "application/octet-stream")
+
+def _campo_binario(nombre: str, cabecera: str):
+    """Metadato del modo binario: parámetro de query o cabecera X-* (percent-encoded)."""
+    valor = request.args.get(nombre)
+    if valor is None and cabecera in request.headers:
+        valor = unquote(request.headers[cabecera])
+    if valor is None:
+        raise KeyError(nombre)
+    return valor
 
 @app.route("/sign-json", methods=["POST"])
 def sign_json():
-    if not request.is_json:
-        return jsonify({"error": "Solo se acepta JSON"}), 400
-    
-    data = request.get_json()
-
-    # Campos requeridos
-    try:
-        file_b64   = data["file_base64"]
-        uploader   = data["uploader"]
-        area       = data["area"]
-        orig_name  = data["original_filename"]
-    except KeyError as e:
-        return jsonify({"error": f"Falta campo {e}"}), 400
-
-
-    # 1) Decodifica el PDF
-    try:
-        # a) quita prefijos tipo "data:application/pdf;base64,"
-        if file_b64.startswith("data:"):
-            file_b64 = file_b64.split(",", 1)[1]
-
-        # b) elimina blancos y saltos (\s incluye \r \n \t y espacios)
-        file_b64_clean = re.sub(r"\s+", "", file_b64)
-
-        # c) decodifica; validate=True obliga a que sean caracteres base64 válidos
-        pdf_bytes = base64.b64decode(file_b64_clean, validate=True)
-
-    except Exception as e:
-        print("B64 error:", e)          # aparecerá en los logs de Render
-        return jsonify({"error": "base64 inválido"}), 400
+    """
+    Dos formas de enviar el PDF:
+    - JSON: { file_base64, uploader, area, original_filename }
+    - Binario: cuerpo application/pdf u application/octet-stream y los
+      metadatos en la query (?uploader=&area=&original_filename=) o en las
+      cabeceras X-Uploader, X-Area, X-Original-Filename.
+    La respuesta es la misma en ambos casos.
+    """
+    if request.mimetype in _TIPOS_BINARIOS:
+        try:
+            uploader  = _campo_binario("uploader", "X-Uploader")
+            area      = _campo_binario("area", "X-Area")
+            orig_name = _campo_binario("original_filename", "X-Original-Filename")
+        except KeyError as e:
+            return jsonify({"error": f"Falta campo {e}"}), 400
+        # El cuerpo va directo a disco, sin pasar por form/JSON
+        ruta_entrada = _volcar_a_spool(request.stream)
+        if os.path.getsize(ruta_entrada) == 0:
+            os.remove(ruta_entrada)
+            return jsonify({"error": "Cuerpo vacío"}), 400
+
+    elif request.is_json:
+        # cache=False: el texto base64 se libera en cuanto se decodifica
+        data = request.get_json(cache=False)
+
+        # Campos requeridos
+        try:
+            file_b64   = data["file_base64"]
+            uploader   = data["uploader"]
+            area       = data["area"]
+            orig_name  = data["original_filename"]
+        except KeyError as e:
+            return jsonify({"error": f"Falta campo {e}"}), 400
+
+        # 1) Decodifica el PDF por bloques (prefijo "data:", blancos y saltos incluidos)
+        try:
+            pdf_bytes = base64_a_bytes(file_b64)
+            del data, file_b64
+        except Exception as e:
+            print("B64 error:", e)          # aparecerá en los logs de Render
+            return jsonify({"error": "base64 inválido"}), 400
+        ruta_entrada = _volcar_a_spool(pdf_bytes)
+        del pdf_bytes
+
+    else:
+        return jsonify({"error": "Solo se acepta JSON o un PDF binario"}), 400
 
     user_meta = {
         "uploader": uploader,
@@ -140,332 +532,385 @@ def sign_json():
         "original_filename": orig_name
     }
 
-    # 2) Firma
-    pdf_sellado_bytes, doc_id = sell(
-        pdf_bytes,
-        user_meta,
-        PRIVATE_KEY,
-        base_url=request.url_root + "v/"
-    )
+    # Modo trabajo: responde de inmediato y el sellado corre en segundo plano
+    # (un reintento recibe el job_id del primero, salvo que haya fallado)
+    if request.args.get("async") == "1":
+        clave, previo, error = _reclamar_idempotencia(ruta_entrada, user_meta, "sign-json-async",
+                                                      vigente=_trabajo_vigente)
+        if error:
+            return error
+        if previo is not None:
+            job_id = previo["job_id"]
+        else:
+            try:
+                job_id = TRABAJOS.encolar(ruta_entrada, user_meta, request.url_root)
+            except BaseException:
+                IDEMPOTENCIA.liberar(clave)
+                raise
+            IDEMPOTENCIA.completar(clave, {"job_id": job_id})
+        status_url = request.url_root + f"jobs/{job_id}"
+        return jsonify({"job_id": job_id, "estado": "pendiente", "status_url": status_url}), 202, {
+            "Location": status_url,
+            "Idempotent-Replayed": str(previo is not None).lower(),
+        }
+
+    # 2) Firma (o el documento ya sellado si es un reintento); la respuesta
+    #    se envía desde el archivo guardado
+    sellado, repetida, error = _sellar_una_vez(ruta_entrada, user_meta, request.url_root, "sign-json")
+    if error:
+        return error
+    doc_id, pico_kb = sellado
+
+    resp = _enviar_pdf(doc_id)
+    resp.headers.update(_cabeceras_sellado(doc_id, user_meta, request.url_root))
+    resp.headers.update(_cabeceras_respuesta(pico_kb, repetida))
+    return resp
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def estado_trabajo(job_id):
+    """
+    Estado de un trabajo de /sign-json?async=1.
+    - pendiente/procesando: 202 con Retry-After
+    - listo: JSON con las mismas cabeceras X-* que /sign-json; con
+      ?formato=pdf devuelve el PDF sellado igual que el modo síncrono
+    - error: JSON con el mensaje
+    """
+    trabajo = TRABAJOS.obtener(job_id)
+    if trabajo is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+
+    estado = trabajo["estado"]
+    if estado in (PENDIENTE, PROCESANDO):
+        return jsonify({"job_id": job_id, "estado": estado}), 202, {"Retry-After": "2"}
+    if estado == ERROR:
+        return jsonify({"job_id": job_id, "estado": estado, "error": trabajo["error"]}), 200
+
+    headers = trabajo["resultado"]["headers"]
+    if request.args.get("formato") == "pdf":
+        resp = _enviar_pdf(headers["X-Doc-ID"])
+        resp.headers.update(headers)
+        return resp
+    return jsonify({
+        "job_id": job_id,
+        "estado": estado,
+        "doc_id": headers["X-Doc-ID"],
+        "verify_url": headers["X-Verify-URL"],
+        "download_url": request.url_root + f"download/{headers['X-Doc-ID']}",
+        "headers": headers,
+    }), 200
 
-    # 4. Guardar el PDF sellado con nombre único = {doc_id}.pdf
-    save_path = os.path.join(STORAGE_DIR, f"{doc_id}.pdf")
-    with open(save_path, "wb") as f:
-        f.write(pdf_sellado_bytes)
 
-    # 3) Cabezeras para el Flow
-    headers = {
-        "Content-Type":       "application/pdf",          #  ← NUEVO
-        "X-Doc-ID":            doc_id,
-        "X-Verify-URL":        request.url_root + f"v/{doc_id}",
-        "X-Uploader":          uploader,
-        "X-Area":              area,
-        "X-Original-Filename": orig_name,
-        "X-Uploaded-At":       dt.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
-        "X-Download-Name":     f"{os.path.splitext(orig_name)[0]}_sellado.pdf",
-        "Content-Disposition": f'attachment; filename="{doc_id}.pdf"'
-    }
-
-    return pdf_sellado_bytes, 200, headers
+MAX_LOTE = int(os.getenv("SIGN_BATCH_MAX", "500"))
 
+def _pdfs_del_lote():
+    """
+    [(nombre, bytes)] de la petición de /sign-batch: varios campos "files"
+    o un "zip" con los PDFs (se ignoran carpetas y archivos que no son .pdf).
+    """
+    if "zip" in request.files:
+        pdfs = []
+        with zipfile.ZipFile(request.files["zip"].stream) as zf:
+            for info in zf.infolist():
+                nombre = os.path.basename(info.filename)
+                if info.is_dir() or info.filename.startswith("__MACOSX/") \
+                        or not nombre.lower().endswith(".pdf"):
+                    continue
+                if len(pdfs) > MAX_LOTE:
+                    break
+                pdfs.append((nombre, zf.read(info)))
+        return pdfs
+    return [(f.filename or "documento.pdf", f.read()) for f in request.files.getlist("files")[:MAX_LOTE + 1]]
+
+@app.route("/sign-batch", methods=["POST"])
+def sign_batch():
+    """
+    Sella varios PDFs con una sola firma (raíz de Merkle). Recibe multipart:
+    - files: varios PDFs, o zip: un .zip con los PDFs
+    - meta: JSON común a todos { uploader, area, ... }
+    Cada documento guarda su prueba de inclusión en /CM_META["merkle"].
+    """
+    if "meta" not in request.form:
+        return jsonify({"error": "Faltan metadatos"}), 400
+    try:
+        meta_comun = json.loads(request.form["meta"])
+        pdfs = _pdfs_del_lote()
+    except (ValueError, zipfile.BadZipFile):
+        return jsonify({"error": "meta o zip inválido"}), 400
+    if not pdfs:
+        return jsonify({"error": "No se recibió ningún PDF"}), 400
+    if len(pdfs) > MAX_LOTE:
+        return jsonify({"error": f"Máximo {MAX_LOTE} documentos por lote"}), 400
+
+    documentos = [(pdf, {**meta_comun, "original_filename": nombre}) for nombre, pdf in pdfs]
+    try:
+        sellados = EJECUTOR.sellar_lote(documentos, base_url=request.url_root + "v/")
+    except ColaLlena:
+        return _respuesta_cola_llena()
+
+    filas = [_guardar_sellado(pdf, doc_id) for pdf, doc_id in sellados]
+    INDICE.registrar_varios(filas)
+    if SHAREPOINT is not None:
+        SHAREPOINT.encolar(filas)
+
+    resultados = []
+    for (nombre, _), (_, doc_id) in zip(pdfs, sellados):
+        name_root, ext = os.path.splitext(nombre)
+        resultados.append({
+            "doc_id": doc_id,
+            "original_filename": nombre,
+            "verify_url": request.url_root + f"v/{doc_id}",
+            "download_url": request.url_root + f"download/{doc_id}",
+            "download_name": f"{name_root}_sellado{ext}",
+        })
+    return jsonify({"count": len(resultados), "documents": resultados}), 200
+
+
+def _verificar_pdf(pdf, modo: str):
+    """(es_valido, meta) de un PDF subido en modo "metadatos" o "contenido"."""
+    es_valido, meta = verify(pdf, LLAVES_PUBLICAS)
+    if es_valido and modo == "contenido":
+        # Si el archivo es idéntico al que se guardó al sellar basta comparar
+        # con el sha del índice, sin revisar la sección anexada
+        fila = INDICE.obtener(str(meta.get("id")))
+        with metricas.etapa("verificar_contenido"):
+            es_valido = verificar_contenido(pdf, meta, fila["sha256"] if fila else None)
+    return es_valido, meta
+
+# /verify con varios archivos: se verifican en hilos (leer /CM_META y
+# comprobar la firma es sobre todo E/S y OpenSSL) y cada resultado se
+# envía como una línea NDJSON en cuanto termina
+VERIFY_WORKERS = int(os.getenv("VERIFY_WORKERS", str(min(8, os.cpu_count() or 1))))
+MAX_VERIFICACION = int(os.getenv("VERIFY_BATCH_MAX", "1000"))
+_VERIFICADORES = ThreadPoolExecutor(VERIFY_WORKERS, thread_name_prefix="verificar")
+
+def _pdfs_a_verificar():
+    """
+    (zipfile o None, [(nombre, abrir)]) de la petición de /verify: campos
+    "file"/"files" o un "zip" con los PDFs. abrir() devuelve el stream o los
+    bytes del PDF; los del zip se descomprimen en el hilo que los verifica.
+    """
+    if "zip" in request.files:
+        zf = zipfile.ZipFile(request.files["zip"].stream)
+        archivos = []
+        for info in zf.infolist():
+            nombre = os.path.basename(info.filename)
+            if info.is_dir() or info.filename.startswith("__MACOSX/") \
+                    or not nombre.lower().endswith(".pdf"):
+                continue
+            if len(archivos) > MAX_VERIFICACION:
+                break
+            archivos.append((nombre, partial(zf.read, info)))
+        return zf, archivos
+    subidos = request.files.getlist("file") + request.files.getlist("files")
+    return None, [(f.filename or "documento.pdf", (lambda f=f: f.stream))
+                  for f in subidos[:MAX_VERIFICACION + 1]]
+
+def _verificar_uno(indice: int, nombre: str, abrir, modo: str) -> dict:
+    resultado = {"index": indice, "filename": nombre, "mode": modo}
+    try:
+        es_valido, meta = _verificar_pdf(abrir(), modo)
+    except Exception as e:
+        app.logger.info("verificación de %s: %s", nombre, e)
+        resultado.update(valid=False, error="No se pudo leer el PDF")
+    else:
+        resultado.update(valid=es_valido, meta=meta)
+    return resultado
+
+def _resultados_ndjson(zf, archivos, modo: str):
+    """Una línea JSON por archivo en orden de término y al final {"done": true, ...}."""
+    futuros = [_VERIFICADORES.submit(_verificar_uno, i, nombre, abrir, modo)
+               for i, (nombre, abrir) in enumerate(archivos)]
+    validos = 0
+    try:
+        for futuro in as_completed(futuros):
+            resultado = futuro.result()
+            validos += resultado["valid"]
+            yield json.dumps(resultado, ensure_ascii=False) + "\n"
+    finally:
+        # Si el cliente se desconecta no se verifica lo que falta
+        for futuro in futuros:
+            futuro.cancel()
+        if zf is not None:
+            zf.close()
+    yield json.dumps({"done": True, "total": len(futuros), "valid": validos}) + "\n"
 
 @app.route("/verify", methods=["POST"])
 def verify_document():
     """
     Recibe multipart/form-data:
     - file: PDF que incluye metadata + firma + página QR
-    Devuelve JSON { valid: true/false, meta: {...} }
+    - modo (form o query, opcional): "metadatos" (por defecto) sólo verifica
+      la firma de /CM_META; "contenido" además comprueba el hash del
+      documento original y que sólo se le anexó el sello
+    Devuelve JSON { valid: true/false, mode: ..., meta: {...} }
+
+    Con varios archivos (campos "files" o "file" repetidos, o un "zip") la
+    respuesta es application/x-ndjson: una línea por archivo según termina,
+    { index, filename, valid, mode, meta } (o "error" si no se pudo leer), y
+    una última { done: true, total, valid }.
     """
+    modo = request.values.get("modo", "metadatos")
+    if modo not in ("metadatos", "contenido"):
+        return jsonify({"error": "modo debe ser 'metadatos' o 'contenido'"}), 400
+
+    if "files" in request.files or "zip" in request.files or len(request.files.getlist("file")) > 1:
+        try:
+            zf, archivos = _pdfs_a_verificar()
+        except zipfile.BadZipFile:
+            return jsonify({"error": "zip inválido"}), 400
+        if not archivos or len(archivos) > MAX_VERIFICACION:
+            if zf is not None:
+                zf.close()
+            return jsonify({"error": f"Envía entre 1 y {MAX_VERIFICACION} PDFs"}), 400
+        return app.response_class(
+            stream_with_context(_resultados_ndjson(zf, archivos, modo)),
+            mimetype="application/x-ndjson",
+            headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+        )
+
     if "file" not in request.files:
         return jsonify({"error": "Falta archivo"}), 400
-    
-    pdf_bytes = request.files["file"].read()
-    es_valido, meta = verify(pdf_bytes, PUBLIC_KEY)
-    return jsonify({"valid": es_valido, "meta": meta})
-    
+    # Werkzeug ya vuelca a disco las subidas grandes: se verifica sobre el stream (mmap)
+    es_valido, meta = _verificar_pdf(request.files["file"].stream, modo)
+    return jsonify({"valid": es_valido, "mode": modo, "meta": meta})
+
+def _meta_indexada(doc_id: str) -> dict:
+    """Metadatos firmados del documento desde el índice (ver _fila_indexada)."""
+    fila = _fila_indexada(doc_id)
+    if fila is None:
+        raise FileNotFoundError(doc_id)
+    return json.loads(fila["meta_json"])
+
+def _verificacion_cacheada(doc_id: str, version: str):
+    """(es_valido, meta) para /v, memorizado por doc_id + versión del archivo."""
+    def calcular():
+        fila = _fila_indexada(doc_id)
+        if fila is None:
+            return [False, {}]          # sin sello: NO VÁLIDO, como verify()
+        meta = json.loads(fila["meta_json"])
+        return [verificar_meta(meta, LLAVES_PUBLICAS), meta]
+
+    es_valido, meta = CACHE_VERIFICACION.obtener_o_calcular(
+        clave_documento(doc_id, version), calcular
+    )
+    return es_valido, dict(meta)
+
+_RE_SHA256 = re.compile(r"[0-9a-fA-F]{64}")
+
+@app.route("/verify-hash/<sha256>", methods=["GET"])
+def verify_hash(sha256):
+    """
+    Verificación sin subir el archivo: el cliente (/verify-ui, Web Crypto)
+    manda el SHA-256 del PDF y se busca en el índice, donde se guardó el del
+    archivo sellado al sellarlo. Si coincide, el archivo es idéntico byte a
+    byte al sellado (equivale a modo=contenido). 404 si no se conoce: el
+    cliente debe subirlo a /verify.
+    """
+    if not _RE_SHA256.fullmatch(sha256):
+        return jsonify({"error": "sha256 debe ser 64 caracteres hexadecimales"}), 400
+    fila = INDICE.buscar_sha256(sha256)
+    if fila is None:
+        return jsonify({"error": "Huella desconocida", "known": False}), 404
+    es_valido, meta = _verificacion_cacheada(fila["doc_id"], "sha256:" + fila["sha256"])
+    return jsonify({"valid": es_valido, "mode": "hash", "known": True, "meta": meta})
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """Contadores de hits/misses de la caché de verificación (para dimensionarla)."""
+    return jsonify(CACHE_VERIFICACION.estadisticas())
+
+# Páginas públicas: HTML en templates/ (compilado una vez por proceso), CSS,
+# JS y logos servidos desde memoria con gzip precalculado en /assets
+RECURSOS = RecursosEstaticos(app.static_folder)
+VERSION_PAGINAS = huella(huella_directorio(app.template_folder), huella_directorio(app.static_folder))
+PAGE_CACHE_MAX_AGE = int(os.getenv("PAGE_CACHE_MAX_AGE", "60"))
+
+@app.template_global()
+def recurso_url(nombre: str) -> str:
+    """URL versionada de un archivo de static/ (cacheable para siempre)."""
+    return f"{request.script_root}/assets/{nombre}?v={RECURSOS.version(nombre)}"
+
+def _respuesta_html(html: str, etag: str):
+    """HTML con ETag (304 si coincide) y gzip si el cliente lo acepta."""
+    resp = _respuesta_comprimida(html.encode("utf-8"), None, etag, "text/html; charset=utf-8")
+    # Se puede reutilizar unos segundos; después se revalida con el ETag
+    resp.cache_control.public = True
+    resp.cache_control.max_age = PAGE_CACHE_MAX_AGE
+    return resp
+
+def _respuesta_comprimida(datos: bytes, comprimidos, etag: str, mimetype: str):
+    """`datos` (o su gzip, precalculado o no) con ETag y 304 si If-None-Match coincide."""
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    else:
+        acepta_gzip = "gzip" in request.accept_encodings
+        if comprimidos is None:
+            comprimidos = comprimir(datos, acepta_gzip)
+        if comprimidos is not None and acepta_gzip:
+            resp = app.response_class(comprimidos, mimetype=mimetype)
+            resp.content_encoding = "gzip"
+        else:
+            resp = app.response_class(datos, mimetype=mimetype)
+    resp.set_etag(etag)
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+@app.route("/assets/<nombre>")
+def recurso_estatico(nombre):
+    """CSS/JS/logos de static/ desde memoria; con ?v= en la URL no caducan."""
+    try:
+        recurso = RECURSOS.obtener(nombre)
+    except (FileNotFoundError, IsADirectoryError):
+        abort(404)
+    resp = _respuesta_comprimida(recurso.datos, recurso.gzip, recurso.etag, recurso.mimetype)
+    resp.cache_control.public = True
+    if request.args.get("v") == recurso.etag:
+        resp.cache_control.max_age = FILE_CACHE_MAX_AGE
+        resp.cache_control.immutable = True
+    else:
+        resp.cache_control.max_age = PAGE_CACHE_MAX_AGE
+    return resp
+
 @app.route("/v/<doc_id>")
 def verificacion_publica(doc_id):
     """
-    Muestra una página profesional y limpia para verificar un PDF sellado.
+    Página pública de verificación de un PDF sellado (la del QR).
     - Oculta la firma, muestra solo los campos relevantes.
-    - Logos con márgenes, tarjeta blanca centrada.
-    - Fecha en hora de Monterrey (UTC-5).
+    - Fecha en hora de Monterrey (TZ), mes en español.
+    - ETag por documento + versión del archivo + resultado + plantillas:
+      una revalidación responde 304 sin renderizar.
     """
-    # 1) Ruta de disco al PDF por doc_id
-    pdf_path = os.path.join(STORAGE_DIR, f"{doc_id}.pdf")
-    if not os.path.exists(pdf_path):
+    # 1) El documento debe existir en el almacén
+    version = ALMACEN.version(doc_id)
+    if version is None:
         return "Documento no encontrado", 404
 
-    # 2) Leer el PDF y extraer metadata + verificación
-    with open(pdf_path, "rb") as f:
-        pdf_bytes = f.read()
-    es_valido, meta = verify(pdf_bytes, PUBLIC_KEY)
+    # 2) Metadata desde el índice + verificación de la firma (sin abrir el PDF),
+    #    memorizada mientras el archivo no cambie
+    es_valido, meta = _verificacion_cacheada(doc_id, version)
+
+    anio = dt.datetime.utcnow().year
+    etag = huella(doc_id, version, es_valido, anio, VERSION_PAGINAS)
+    if request.if_none_match.contains(etag):
+        return _respuesta_html("", etag)
 
-    # 3) Montar el nombre original y generar nombre de descarga si lo necesitas
+    # 3) Nombre de descarga a partir del original
     original = meta.get("original_filename", doc_id)
     base, ext = os.path.splitext(original)
     download_name = f"{base}_sellado{ext}"
 
-    # 4) Formatear la fecha en hora de Monterrey (UTC-5), mes en español
-    raw_iso = meta.get("uploaded_at", "")
-    fecha_amigable = raw_iso  # fallback si algo falla
-    try:
-        # Parseamos la cadena ISO "2025-05-30T23:12:35Z"
-        dt_utc = dt.datetime.strptime(raw_iso, "%Y-%m-%dT%H:%M:%SZ")
-        # Restamos 5 horas para zona Monterrey
-        dt_mty = dt_utc - timedelta(hours=6)
-        meses = [
-            "enero", "febrero", "marzo", "abril", "mayo", "junio",
-            "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"
-        ]
-        dia = dt_mty.day
-        mes = meses[dt_mty.month - 1]
-        ano = dt_mty.year
-        hora = dt_mty.hour
-        minuto = dt_mty.minute
-        fecha_amigable = f"{dia} {mes} {ano}, {hora:02d}:{minuto:02d} (MTY)"
-    except Exception:
-        pass
-
-    # 5) Rutas a los logos (debes tener estos archivos en static/)
-    logo_tec  = url_for('static', filename='logo_tec.png')
-    logo_casa = url_for('static', filename='logo_casa_monarca.png')
-
-    # 6) Construir solo los metadatos que queremos mostrar (sin signature ni verify_url)
-    metadatos_mostrar = {
-        "Área": meta.get("area", "—"),
-        "Document ID": meta.get("id", doc_id),
-        "Nombre original": meta.get("original_filename", "—"),
-        "Subido por": meta.get("uploader", "—"),
-        "Fecha": fecha_amigable
-    }
-
-    # 7) HTML + CSS inline: diseño limpio, tarjeta centrada
-    html = f"""
-    <!DOCTYPE html>
-    <html lang="es">
-      <head>
-        <meta charset="UTF-8" />
-        <meta name="viewport" content="width=device-width, initial-scale=1" />
-        <title>Verificación Casa Monarca</title>
-        <style>
-          * {{
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-          }}
-          html, body {{
-            background: #f0f2f5;
-            font-family: 'Segoe UI', sans-serif;
-            color: #2c2c2c;
-          }}
-          a {{
-            text-decoration: none;
-            color: inherit;
-          }}
-
-          header {{
-            background: white;
-            padding: 15px 40px;
-            display: flex;
-            align-items: center;
-            justify-content: space-between;
-            border-bottom: 1px solid #e0e0e0;
-            flex-wrap: wrap;
-          }}
-          header img {{
-            height: 45px;
-            max-width: 100px;
-            object-fit: contain;
-            margin: 5px 10px;
-          }}
-          header h2 {{
-            font-size: 1.3rem;
-            color: #1a1a1a;
-            letter-spacing: 0.05em;
-            text-align: center;
-            flex-grow: 1;
-          }}
-
-          main {{
-            display: flex;
-            justify-content: center;
-            margin: 40px 20px;
-            width: 100%;
-            padding: 0 10px;
-          }}
-          .tarjeta {{
-            background: white;
-            width: 100%;
-            max-width: 700px;
-            border-radius: 8px;
-            box-shadow: 0 4px 12px rgba(0,0,0,0.08);
-            overflow: hidden;
-          }}
-          .tarjeta .contenido {{
-            padding: 25px 30px;
-          }}
-
-          .tarjeta h1 {{
-            font-size: 1.6rem;
-            margin-bottom: 25px;
-            text-align: center;
-          }}
-          .estado {{
-            display: block;
-            text-align: center;
-            margin: 0 auto 20px auto;
-            padding: 10px 16px;
-            border-radius: 4px;
-            font-weight: bold;
-            font-size: 1rem;
-          }}
-          .estado.valido {{
-            background: #d4edda;
-            color: #155724;
-          }}
-          .estado.invalido {{
-            background: #f8d7da;
-            color: #721c24;
-          }}
-
-          .tabla-meta {{
-            width: 100%;
-            border-collapse: collapse;
-            margin: 20px 0 30px;
-            display: block;
-            overflow-x: auto;
-            white-space: nowrap;
-          }}
-          .tabla-meta th, .tabla-meta td {{
-            border: 1px solid #d0d0d0;
-            padding: 10px 12px;
-            text-align: left;
-          }}
-          .tabla-meta th {{
-            background: #00539c;
-            color: white;
-            font-weight: normal;
-            width: 35%;
-          }}
-          .tabla-meta td {{
-            background: #fafafa;
-          }}
-
-          .visor-pdf {{
-            width: 100%;
-            max-width: 100%;
-            height: 500px;
-            border: 1px solid #ccc;
-            border-radius: 4px;
-            margin-bottom: 25px;
-          }}
-
-          .boton-descarga {{
-            display: flex;
-            justify-content: center;
-            margin-bottom: 20px;
-          }}
-          .boton-descarga a {{
-            background: #FF584D;
-            color: white;
-            padding: 12px 28px;
-            border-radius: 4px;
-            font-size: 1rem;
-            font-weight: bold;
-            transition: background 0.2s;
-            text-align: center;
-          }}
-          .boton-descarga a:hover {{
-            background: #e74c3c;
-          }}
-
-          footer {{
-            text-align: center;
-            padding: 15px 0;
-            font-size: 0.85rem;
-            color: #666;
-            background: #fafafa;
-          }}
-
-          @media (max-width: 600px) {{
-            html, body {{
-              overflow-x: hidden;
-              font-size: 0.95rem;
-            }}
-            header {{
-              flex-direction: column;
-              align-items: center;
-              gap: 5px;
-              padding: 20px 10px;
-            }}
-            header img {{
-              height: 40px;
-            }}
-            header h2 {{
-              font-size: 1.1rem;
-              margin: 5px 0;
-            }}
-            .tarjeta .contenido {{
-              padding: 20px 15px;
-              font-size: 0.95rem;
-            }}
-            .tarjeta h1 {{
-              font-size: 1.3rem;
-            }}
-            .tabla-meta th,
-            .tabla-meta td {{
-              font-size: 0.85rem;
-            }}
-            .boton-descarga a {{
-              width: 100%;
-              padding: 12px;
-            }}
-          }}
-        </style>
-      </head>
-      <body>
-        <header>
-          <img src="{logo_tec}" alt="Logo TECNOLOGICO DE MONTERREY" />
-          <h2>SELLO MONARCA</h2>
-          <img src="{logo_casa}" alt="Logo CASA MONARCA" />
-        </header>
-
-        <main>
-          <div class="tarjeta">
-            <div class="contenido">
-              <h1>Verificación de Documento</h1>
-              <div class="estado {'valido' if es_valido else 'invalido'}">
-                {'✅ VÁLIDO' if es_valido else '❌ NO VÁLIDO'}
-              </div>
-
-              <table class="tabla-meta">
-                <tbody>
-                  {"".join([
-                    f"<tr><th>{campo}</th><td>{valor}</td></tr>"
-                    for campo, valor in metadatos_mostrar.items()
-                  ])}
-                </tbody>
-              </table>
-
-              <iframe class="visor-pdf" src="/file/{doc_id}"></iframe>
-
-              <div class="boton-descarga">
-                <a href="/download/{doc_id}" download="{download_name}">
-                  📥 Descargar "{download_name}"
-                </a>
-              </div>
-            </div>
-          </div>
-        </main>
-
-        <footer>
-          &copy; {dt.datetime.utcnow().year} CASA MONARCA • TECNOLOGICO DE MONTERREY
-        </footer>
-      </body>
-    </html>
-    """
-    return html
+    # 4) Solo los metadatos que queremos mostrar (sin signature ni verify_url)
+    metadatos = (
+        ("Área", meta.get("area", "—")),
+        ("Document ID", meta.get("id", doc_id)),
+        ("Nombre original", meta.get("original_filename", "—")),
+        ("Subido por", meta.get("uploader", "—")),
+        ("Fecha", fecha_legible(meta.get("uploaded_at", ""), TZ)),
+    )
+    html = render_template("verificacion.html", es_valido=es_valido, metadatos=metadatos,
+                           doc_id=doc_id, download_name=download_name, anio=anio)
+    return _respuesta_html(html, etag)
 
 
 @app.route("/file/<doc_id>")
@@ -474,326 +919,44 @@ def serve_pdf(doc_id):
     Sirve el PDF (sin forzar nombre). El nombre correcto para descarga
     se manejará en /download/<doc_id>.
     """
-    pdf_path = os.path.join(STORAGE_DIR, f"{doc_id}.pdf")
-    if not os.path.exists(pdf_path):
-        abort(404)
-    return send_file(pdf_path, mimetype="application/pdf")
+    return _enviar_pdf(doc_id)
 
 @app.route("/download/<doc_id>")
 def download_pdf(doc_id):
     """
     Envía el PDF forzando la descarga con nombre amigable.
     """
-    pdf_path = os.path.join(STORAGE_DIR, f"{doc_id}.pdf")
-    if not os.path.exists(pdf_path):
+    if ALMACEN.version(doc_id) is None:
         abort(404)
 
-    # Leer los metadatos para obtener el nombre original
-    with open(pdf_path, "rb") as f:
-        pdf_bytes = f.read()
-    _, meta = verify(pdf_bytes, PUBLIC_KEY)
+    # Nombre original desde el índice
+    try:
+        meta = _meta_indexada(doc_id)
+    except FileNotFoundError:
+        abort(404)
 
     original = meta.get("original_filename", doc_id)
     base, ext = os.path.splitext(original)
     download_name = f"{base}_sellado{ext}"
 
-    return send_file(
-        pdf_path,
-        mimetype="application/pdf",
-        as_attachment=True,
-        download_name=download_name
-    )
+    return _enviar_pdf(doc_id, as_attachment=True, download_name=download_name)
+
+_PAGINA_VERIFICAR = {}
 
 @app.route("/verify-ui")
 def verify_ui():
     """
     Página Drag & Drop (o clic) para verificar un PDF sellado.
     - Permite arrastrar el archivo o hacer clic para abrir selector.
-    - Muestra ✅ VÁLIDO o ❌ NO VÁLIDO con tabla de metadatos.
-    """
-    # URL de tu endpoint /verify
-    verify_api_url = request.url_root.rstrip("/") + "/verify"
-
-    html = f"""
-    <!DOCTYPE html>
-    <html lang="es">
-      <head>
-        <meta charset="UTF-8" />
-        <meta name="viewport" content="width=device-width, initial-scale=1" />
-        <title>Verificar PDF Sellado</title>
-        <style>
-          /* Reset básico */
-          * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-          body {{
-            background: #f0f2f5;
-            font-family: 'Segoe UI', sans-serif;
-            color: #2c2c2c;
-          }}
-
-          /* Header blanco */
-          header {{
-            background: white;
-            padding: 15px 40px;
-            display: flex;
-            align-items: center;
-            justify-content: space-between;
-            border-bottom: 1px solid #e0e0e0;
-          }}
-          header img {{
-            height: 45px;
-            margin: 0 10px;
-          }}
-          header h2 {{
-            font-size: 1.3rem;
-            color: #1a1a1a;
-            letter-spacing: 0.05em;
-          }}
-
-          /* Contenedor principal centrado */
-          main {{
-            display: flex;
-            justify-content: center;
-            margin: 40px 20px;
-          }}
-          .tarjeta {{
-            background: white;
-            width: 100%;
-            max-width: 700px;
-            border-radius: 8px;
-            box-shadow: 0 4px 12px rgba(0,0,0,0.08);
-            overflow: hidden;
-          }}
-          .tarjeta .contenido {{
-            padding: 25px 30px;
-          }}
-
-          /* Título y subtítulo */
-          .tarjeta h1 {{
-            font-size: 1.6rem;
-            margin-bottom: 5px;
-            text-align: center;
-          }}
-          .tarjeta p.subtitulo {{
-            font-size: 1rem;
-            color: #555;
-            margin-bottom: 20px;
-            text-align: center;
-          }}
-
-          /* Drop Zone con estado híbrido */
-          #dropZone {{
-            height: 200px;
-            border: 3px dashed #ccc;
-            border-radius: 8px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            color: #777;
-            font-size: 1.1rem;
-            transition: border-color 0.2s, color 0.2s, background 0.2s;
-            margin-bottom: 25px;
-            cursor: pointer;
-            user-select: none;
-            background: #fafafa;
-          }}
-          #dropZone.dragover {{
-            border-color: #00539c;
-            color: #00539c;
-            background: #e8f0fe;
-          }}
-
-          /* Input file oculto (se dispara al hacer clic en el dropZone) */
-          input[type="file"] {{
-            display: none;
-          }}
-
-          /* Estado de validación */
-          .estado {{
-            display: inline-block;
-            padding: 10px 16px;
-            border-radius: 4px;
-            font-weight: bold;
-            font-size: 1rem;
-            margin-bottom: 20px;
-            text-align: center;
-          }}
-          .valido {{
-            background: #d4edda;
-            color: #155724;
-          }}
-          .invalido {{
-            background: #f8d7da;
-            color: #721c24;
-          }}
-
-          /* Tabla de metadatos */
-          .tabla-meta {{
-            width: 100%;
-            border-collapse: collapse;
-            margin: 20px 0 30px;
-          }}
-          .tabla-meta th, .tabla-meta td {{
-            border: 1px solid #d0d0d0;
-            padding: 10px 12px;
-            text-align: left;
-          }}
-          .tabla-meta th {{
-            background: #00539c;
-            color: white;
-            font-weight: normal;
-            width: 35%;
-          }}
-          .tabla-meta td {{ background: #fafafa; }}
-
-          /* Pie de página */
-          footer {{
-            text-align: center;
-            padding: 15px 0;
-            font-size: 0.85rem;
-            color: #666;
-            background: #fafafa;
-            margin-top: 40px;
-          }}
-        </style>
-      </head>
-
-      <body>
-        <!-- Header con logos -->
-        <header>
-          <img src="{url_for('static', filename='logo_tec.png')}" alt="Logo TECNOLOGICO DE MONTERREY" />
-          <h2>SELLO MONARCA</h2>
-          <img src="{url_for('static', filename='logo_casa_monarca.png')}" alt="Logo CASA MONARCA" />
-        </header>
-
-        <!-- Contenedor principal -->
-        <main>
-          <div class="tarjeta">
-            <div class="contenido">
-              <h1>Arrastra o haz clic para subir tu PDF</h1>
-              <p class="subtitulo">Sólo archivos .pdf válidos</p>
-
-              <!-- Drop Zone híbrido -->
-              <div id="dropZone">
-                📁 Selecciona o arrastra aquí tu PDF
-              </div>
-
-              <!-- Input file oculto -->
-              <input type="file" id="fileInput" accept="application/pdf" />
-
-              <!-- Resultado (estado + metadatos) -->
-              <div id="result"></div>
-            </div>
-          </div>
-        </main>
-
-        <!-- Pie de página -->
-        <footer>
-          &copy; {dt.datetime.utcnow().year} CASA MONARCA • TECNOLOGICO DE MONTERREY
-        </footer>
-
-        <script>
-          const dropZone = document.getElementById('dropZone');
-          const resultDiv = document.getElementById('result');
-          const fileInput = document.getElementById('fileInput');
-          const apiURL = "{verify_api_url}";
-
-          // Función que maneja un archivo PDF: lo envía a /verify y muestra el resultado
-          async function handleFile(file) {{
-            // Validar tipo
-            if (!file || file.type !== "application/pdf") {{
-              resultDiv.innerHTML = "<p style='color:red; font-weight:bold;'>Por favor, sube un archivo PDF válido.</p>";
-              return;
-            }}
-
-            resultDiv.innerHTML = "<p>Verificando el documento…</p>";
-
-            const formData = new FormData();
-            formData.append("file", file);
-
-            try {{
-              const resp = await fetch(apiURL, {{
-                method: "POST",
-                body: formData
-              }});
-              const data = await resp.json();
-
-              if (data.valid) {{
-                // Construir tabla de metadatos formateada
-                let html = "<div class='estado valido'>✅ VÁLIDO</div>";
-                html += "<table class='tabla-meta'><tbody>";
-
-                // Los campos que mostraremos
-                const campos = {{
-                  "Área": data.meta.area || "—",
-                  "Document ID": data.meta.id || "—",
-                  "Nombre original": data.meta.original_filename || "—",
-                  "Subido por": data.meta.uploader || "—",
-                  // Formatear fecha UTC->MTY
-                  "Fecha": (() => {{
-                    const raw = data.meta.uploaded_at || "";
-                    try {{
-                      const dtUtc = new Date(raw);
-                      dtUtc.setHours(dtUtc.getHours());
-                      const meses = [
-                        "enero","febrero","marzo","abril","mayo","junio",
-                        "julio","agosto","septiembre","octubre","noviembre","diciembre"
-                      ];
-                      const d = dtUtc.getDate();
-                      const m = meses[dtUtc.getMonth()];
-                      const a = dtUtc.getFullYear();
-                      const h = String(dtUtc.getHours()).padStart(2, "0");
-                      const mi = String(dtUtc.getMinutes()).padStart(2, "0");
-                      return `${{d}} ${{m}} ${{a}}, ${{h}}:${{mi}} (MTY)`;
-                    }} catch {{
-                      return raw;
-                    }}
-                  }})()
-                }};
-
-                for (const [k,v] of Object.entries(campos)) {{
-                  html += `<tr><th>${{k}}</th><td>${{v}}</td></tr>`;
-                }}
-                html += "</tbody></table>";
-                resultDiv.innerHTML = html;
-              }} else {{
-                resultDiv.innerHTML = "<div class='estado invalido'>❌ NO VÁLIDO</div>";
-              }}
-            }} catch (err) {{
-              console.error(err);
-              resultDiv.innerHTML = "<p style='color:red; font-weight:bold;'>Error al conectar con el servidor.</p>";
-            }}
-          }}
-
-          // Drag & drop: cambiar estilo al pasar archivo
-          dropZone.addEventListener('dragover', e => {{
-            e.preventDefault();
-            dropZone.classList.add('dragover');
-          }});
-          dropZone.addEventListener('dragleave', () => {{
-            dropZone.classList.remove('dragover');
-          }});
-          dropZone.addEventListener('drop', e => {{
-            e.preventDefault();
-            dropZone.classList.remove('dragover');
-            const file = e.dataTransfer.files[0];
-            handleFile(file);
-          }});
-
-          // Al hacer clic en dropZone, abre fileInput
-          dropZone.addEventListener('click', () => {{
-            fileInput.click();
-          }});
-
-          // Cuando seleccionan archivo con fileInput
-          fileInput.addEventListener('change', () => {{
-            const file = fileInput.files[0];
-            handleFile(file);
-          }});
-        </script>
-      </body>
-    </html>
-    """
-    return html
+    - Muestra ✅ VÁLIDO o ❌ NO VÁLIDO con tabla de metadatos (static/verificar.js).
+    No tiene nada por petición: se renderiza una vez por año y raíz de la app.
+    """
+    anio = dt.datetime.utcnow().year
+    clave = (request.script_root, anio)
+    html = _PAGINA_VERIFICAR.get(clave)
+    if html is None:
+        html = _PAGINA_VERIFICAR[clave] = render_template("verificar.html", anio=anio)
+    return _respuesta_html(html, huella("verify-ui", *clave, VERSION_PAGINAS))
 
 
 if __name__ == "__main__":
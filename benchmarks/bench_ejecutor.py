@@ -0,0 +1,59 @@
+# benchmarks/bench_ejecutor.py
+"""
+Prueba de carga del ejecutor de sellado: N hilos clientes sellan en paralelo
+contra EjecutorSellado con distinto número de procesos worker.
+
+Uso:
+    python benchmarks/bench_ejecutor.py [--workers 0 1 2 4] [--documentos 64] [--paginas 20]
+
+Requiere PRIVATE_KEY_PEM en el entorno (o en .env), como app.py. El rendimiento
+(documentos/s) debe crecer casi linealmente con los workers hasta el número
+de núcleos; workers=0 es el sellado en el hilo (limitado por el GIL).
+"""
+import argparse, os, sys, time
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from dotenv import load_dotenv
+
+from bench_sello import pdf_sintetico
+from sello_monarca.ejecutor import EjecutorSellado
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4])
+    ap.add_argument("--documentos", type=int, default=64)
+    ap.add_argument("--paginas", type=int, default=20)
+    args = ap.parse_args()
+
+    load_dotenv(os.path.join(RAIZ, ".env"))
+    pem = os.getenv("PRIVATE_KEY_PEM")
+    original = pdf_sintetico(args.paginas)
+    meta = {"uploader": "bench", "area": "bench", "original_filename": "bench.pdf"}
+
+    print(f"núcleos: {os.cpu_count()}  documentos: {args.documentos}  entrada: {len(original) / 1024:.1f} KB")
+    print(f"{'workers':>8} {'docs/s':>8} {'ms/doc':>8}")
+    for n in args.workers:
+        clientes = max(n, 1) * 2
+        ejecutor = EjecutorSellado(pem, password=b"secreto", workers=n,
+                                   cola_max=args.documentos, espera=60)
+        try:
+            # Calentamiento: arranque de procesos, carga de llave y plantilla
+            with ThreadPoolExecutor(clientes) as hilos:
+                list(hilos.map(lambda _: ejecutor.sellar(original, meta, "https://x/v/"), range(clientes)))
+
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(clientes) as hilos:
+                list(hilos.map(lambda _: ejecutor.sellar(original, meta, "https://x/v/"),
+                               range(args.documentos)))
+            total = time.perf_counter() - t0
+        finally:
+            ejecutor.cerrar()
+        print(f"{n:>8} {args.documentos / total:>8.1f} {total * 1000 / args.documentos:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
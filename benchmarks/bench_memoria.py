@@ -0,0 +1,114 @@
+# benchmarks/bench_memoria.py
+"""
+Memoria pico al sellar un PDF grande desde disco.
+
+Genera en un directorio temporal un PDF de --mb MiB (una página con muchos
+streams de contenido) y lo sella con sellar_en() en un proceso nuevo, de
+archivo a archivo, con el perfil incremental ("archivo") y el compacto
+("compacto"). Reporta el pico de RSS (VmHWM) y falla si alguno supera
+--limite-mb. Con --comparar también mide sell() sobre bytes en memoria.
+
+Uso:
+    python benchmarks/bench_memoria.py [--mb 500] [--limite-mb 200] [--comparar]
+"""
+import argparse, os, subprocess, sys, tempfile, time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+_BLOQUE = 1024 * 1024
+
+
+def pdf_grande(ruta: str, mb: int) -> None:
+    """PDF válido de ~`mb` MiB: una página cuyo /Contents son `mb` streams de 1 MiB."""
+    linea = b"% " + b"x" * 61 + b"\n"
+    relleno = linea * (_BLOQUE // len(linea))
+    offsets = {}
+    with open(ruta, "wb") as f:
+        def obj(num, cuerpo):
+            offsets[num] = f.tell()
+            f.write(b"%d 0 obj\n" % num)
+            f.write(cuerpo)
+            f.write(b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        contenidos = list(range(4, 4 + mb))
+        obj(1, b"<</Type/Catalog/Pages 2 0 R>>")
+        obj(2, b"<</Type/Pages/Kids[3 0 R]/Count 1>>")
+        obj(3, b"<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]/Contents["
+            + b" ".join(b"%d 0 R" % n for n in contenidos) + b"]>>")
+        for n in contenidos:
+            offsets[n] = f.tell()
+            f.write(b"%d 0 obj\n<</Length %d>>\nstream\n" % (n, len(relleno)))
+            f.write(relleno)
+            f.write(b"\nendstream\nendobj\n")
+
+        xref = f.tell()
+        total = 4 + mb
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % total)
+        for n in range(1, total):
+            f.write(b"%010d 00000 n \n" % offsets[n])
+        f.write(b"trailer\n<</Size %d/Root 1 0 R>>\nstartxref\n%d\n%%%%EOF\n" % (total, xref))
+
+
+def _medir(modo: str, entrada: str, salida: str) -> None:
+    """Se ejecuta en un proceso nuevo: sella y escribe el pico de RSS en stdout."""
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from sello_monarca import memoria
+    from sello_monarca.sello import sell, sellar_en, verify
+
+    llave = ec.generate_private_key(ec.SECP256R1())
+    meta = {"uploader": "bench", "area": "bench", "original_filename": "grande.pdf"}
+    memoria.reiniciar_pico()
+    base = memoria.pico_rss_kb()
+    t0 = time.perf_counter()
+    if modo in ("archivo", "compacto"):
+        perfil = "incremental" if modo == "archivo" else "compacto"
+        with open(salida, "wb") as out:
+            sellar_en(entrada, out, meta, llave, perfil=perfil)
+    else:
+        with open(entrada, "rb") as f:
+            datos = f.read()
+        pdf, _ = sell(datos, meta, llave)
+        with open(salida, "wb") as out:
+            out.write(pdf)
+    segundos = time.perf_counter() - t0
+    pico = memoria.pico_rss_kb()
+    valido, _ = verify(salida, llave.public_key())
+    print(f"{pico} {base} {segundos:.2f} {int(valido)}")
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == "--medir":
+        _medir(*sys.argv[2:])
+        return
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--mb", type=int, default=500)
+    ap.add_argument("--limite-mb", type=int, default=200)
+    ap.add_argument("--comparar", action="store_true", help="mide también sell() con bytes en memoria")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        entrada = os.path.join(tmp, "grande.pdf")
+        salida = os.path.join(tmp, "sellado.pdf")
+        pdf_grande(entrada, args.mb)
+        print(f"entrada: {os.path.getsize(entrada) / _BLOQUE:.0f} MiB")
+        print(f"{'modo':>8} {'pico RSS MiB':>13} {'inicial MiB':>12} {'s':>6} {'válido':>7}")
+
+        excedido = False
+        for modo in ["archivo", "compacto"] + (["memoria"] if args.comparar else []):
+            r = subprocess.run([sys.executable, os.path.abspath(__file__), "--medir", modo, entrada, salida],
+                               capture_output=True, text=True, check=True)
+            pico, base, segundos, valido = r.stdout.split()
+            pico_mb = int(pico) / 1024
+            print(f"{modo:>8} {pico_mb:>13.1f} {int(base) / 1024:>12.1f} {segundos:>6} {'sí' if valido == '1' else 'no':>7}")
+            if modo != "memoria":
+                excedido = excedido or pico_mb > args.limite_mb or valido != "1"
+
+    if excedido:
+        sys.exit(f"El sellado desde archivo superó {args.limite_mb} MiB o no verificó")
+
+
+if __name__ == "__main__":
+    main()
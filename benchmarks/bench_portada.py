@@ -0,0 +1,47 @@
+# benchmarks/bench_portada.py
+"""
+Mide la generación de la portada QR (qr_handler.generar_pagina_qr_bytes).
+
+La primera llamada construye la plantilla (logo, título y textos fijos como
+form XObject); las siguientes sólo dibujan QR, URL, ID y fecha. Se comparan
+los modos de QR: "vector" (rectángulos PDF) y "raster" (imagen 1-bit con PIL).
+
+Uso:
+    python benchmarks/bench_portada.py [--repeticiones 200]
+"""
+import argparse, os, sys, time, uuid
+from statistics import median
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from sello_monarca import qr_handler
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--repeticiones", type=int, default=200)
+    args = ap.parse_args()
+
+    qr_handler._plantilla.cache_clear()
+    t0 = time.perf_counter()
+    qr_handler.generar_pagina_qr_bytes("https://mi-app.com/v/inicial", "inicial")
+    frio = (time.perf_counter() - t0) * 1000
+
+    print(f"plantilla (primera llamada): {frio:.2f} ms")
+    print(f"{'modo':>8} {'ms/portada':>11} {'KB/portada':>11} {'KB variable':>11}")
+    for modo in qr_handler.MODOS_QR:
+        tiempos, tamanos = [], []
+        for _ in range(args.repeticiones):
+            doc_id = str(uuid.uuid4())
+            t0 = time.perf_counter()
+            pdf = qr_handler.generar_pagina_qr_bytes(f"https://mi-app.com/v/{doc_id}", doc_id, modo_qr=modo)
+            tiempos.append((time.perf_counter() - t0) * 1000)
+            tamanos.append(len(pdf))
+        # Parte variable: portada completa menos la plantilla compartida
+        plantilla = sum(len(c) for _, c in qr_handler._plantilla())
+        print(f"{modo:>8} {median(tiempos):>11.2f} {median(tamanos) / 1024:>11.2f} "
+              f"{(median(tamanos) - plantilla) / 1024:>11.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# benchmarks/bench_sello.py
+"""
+Compara el sellado por actualización incremental contra la re-escritura
+completa del documento, para PDFs sintéticos de distinto número de páginas.
+
+Uso:
+    python benchmarks/bench_sello.py [--paginas 1 10 100 200] [--repeticiones 5]
+
+Con la actualización incremental el tiempo debe crecer con el tamaño de la
+sección anexada (constante: portada + /Info), no con el tamaño de la entrada.
+"""
+import argparse, json, os, sys, time
+from io import BytesIO
+from statistics import median
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from reportlab.pdfgen import canvas
+
+from sello_monarca.sello import META_KEY, _sellar_reescritura
+from sello_monarca.incremental import anexar_pagina_y_metadatos
+from sello_monarca.qr_handler import generar_pagina_qr_bytes
+
+
+def pdf_sintetico(paginas: int) -> bytes:
+    """PDF de texto con `paginas` páginas."""
+    buf = BytesIO()
+    c = canvas.Canvas(buf)
+    for i in range(paginas):
+        for linea in range(40):
+            c.drawString(72, 760 - linea * 17, f"Página {i + 1}, línea {linea + 1} " + "lorem ipsum " * 6)
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def cronometrar(fn, repeticiones: int) -> float:
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn()
+        tiempos.append(time.perf_counter() - t0)
+    return median(tiempos) * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--paginas", type=int, nargs="+", default=[1, 10, 100, 200])
+    ap.add_argument("--repeticiones", type=int, default=5)
+    args = ap.parse_args()
+
+    portada = generar_pagina_qr_bytes("https://mi-app.com/v/00000000-0000-0000-0000-000000000000")
+
+    meta_json = json.dumps({"id": "bench", "signature": "x" * 96}, separators=(",", ":"))
+    print(f"{'páginas':>8} {'entrada KB':>11} {'anexado KB':>11} {'incremental ms':>15} {'re-escritura ms':>16}")
+    for n in args.paginas:
+        original = pdf_sintetico(n)
+        sellado = anexar_pagina_y_metadatos(original, portada, {META_KEY: meta_json})
+        t_inc = cronometrar(lambda: anexar_pagina_y_metadatos(original, portada, {META_KEY: meta_json}),
+                            args.repeticiones)
+        t_rw = cronometrar(lambda: _sellar_reescritura(original, portada, meta_json), args.repeticiones)
+        print(f"{n:>8} {len(original) / 1024:>11.1f} {(len(sellado) - len(original)) / 1024:>11.1f} "
+              f"{t_inc:>15.2f} {t_rw:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# benchmarks/bench_sharepoint.py
+"""
+Rendimiento y reintentos de la publicación en SharePoint, sin conexión.
+
+Levanta un servidor Graph falso en localhost (token, subida simple, sesión
+de carga por trozos y $batch) que responde 429 con probabilidad --fallos
+y tarda --latencia s por petición. Guarda --documentos PDFs sintéticos en
+un almacén temporal, los encola en SalidaSharePoint y mide documentos/s,
+peticiones, conexiones TCP abiertas y reintentos. Al final comprueba que
+cada PDF llegó íntegro y que cada elemento de la lista se creó una vez.
+
+Con --archivos usa DestinoArchivos (el sustituto en disco) en lugar del
+servidor falso.
+
+Uso:
+    python benchmarks/bench_sharepoint.py [--documentos 200] [--kb 200] [--fallos 0.1]
+                                          [--latencia 0.01] [--paralelo 1 4 8] [--archivos]
+"""
+import argparse, json, os, random, sys, tempfile, threading, time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from sello_monarca.almacen import AlmacenLocal
+from sello_monarca.sharepoint import (ClienteGraph, DestinoArchivos, DestinoGraph,
+                                      SalidaSharePoint, ERROR, LISTO)
+
+
+class GraphFalso(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, fallos: float, latencia: float):
+        super().__init__(("127.0.0.1", 0), _Manejador)
+        self.fallos = fallos
+        self.latencia = latencia
+        self.archivos = {}
+        self.elementos = Counter()
+        self.sesiones = {}
+        self.conexiones = 0
+        self.respuestas = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"       # keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.conexiones += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, status: int, datos=None, cabeceras=None):
+        cuerpo = json.dumps(datos).encode() if datos is not None else b""
+        self.send_response(status)
+        for k, v in (cabeceras or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+        with self.server.lock:
+            self.server.respuestas[status] += 1
+
+    def _cuerpo(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _saturado(self) -> bool:
+        time.sleep(self.server.latencia)
+        return random.random() < self.server.fallos
+
+    def do_POST(self):
+        ruta = urlsplit(self.path).path
+        cuerpo = self._cuerpo()
+        if ruta == "/token":
+            return self._responder(200, {"access_token": "falso", "expires_in": 3600})
+        if self._saturado():
+            return self._responder(429, {"error": {"message": "throttled"}}, {"Retry-After": "0"})
+        if ruta.endswith(":/createUploadSession"):
+            nombre = unquote(ruta.split("root:/", 1)[1][:-len(":/createUploadSession")])
+            sesion = str(len(self.server.sesiones))
+            self.server.sesiones[sesion] = (nombre, bytearray())
+            return self._responder(200, {"uploadUrl": f"{self.server.url}/sesion/{sesion}"})
+        if ruta == "/v1.0/$batch":
+            respuestas = []
+            for p in json.loads(cuerpo)["requests"]:
+                if random.random() < self.server.fallos:
+                    respuestas.append({"id": p["id"], "status": 429, "body": {"error": {"message": "throttled"}}})
+                    continue
+                with self.server.lock:
+                    self.server.elementos[p["body"]["fields"]["DocId"]] += 1
+                respuestas.append({"id": p["id"], "status": 201, "body": {"id": p["id"]}})
+            return self._responder(200, {"responses": respuestas})
+        self._responder(404, {"error": {"message": ruta}})
+
+    def do_PUT(self):
+        ruta = urlsplit(self.path).path
+        cuerpo = self._cuerpo()
+        if self._saturado():
+            return self._responder(503, {"error": {"message": "unavailable"}})
+        if ruta.endswith(":/content"):
+            nombre = unquote(ruta.split("root:/", 1)[1][:-len(":/content")])
+            self.server.archivos[nombre] = cuerpo
+            return self._responder(201, {"id": nombre, "webUrl": f"{self.server.url}/f/{nombre}"})
+        if ruta.startswith("/sesion/"):
+            nombre, datos = self.server.sesiones[ruta.rsplit("/", 1)[1]]
+            inicio, resto = self.headers["Content-Range"].split(" ")[1].split("-")
+            fin, total = resto.split("/")
+            del datos[int(inicio):]
+            datos += cuerpo
+            if int(fin) + 1 < int(total):
+                return self._responder(202, {"nextExpectedRanges": [f"{int(fin) + 1}-"]})
+            self.server.archivos[nombre] = bytes(datos)
+            return self._responder(201, {"id": nombre, "webUrl": f"{self.server.url}/f/{nombre}"})
+        self._responder(404, {"error": {"message": ruta}})
+
+
+def _filas(almacen: AlmacenLocal, n: int, kb: int):
+    filas = {}
+    for i in range(n):
+        doc_id = f"bench{i:06d}"
+        datos = os.urandom(kb * 1024)
+        almacen.guardar_bytes(doc_id, datos)
+        filas[doc_id] = {"doc_id": doc_id, "original_filename": f"{doc_id}.pdf", "uploader": "bench",
+                         "area": "bench", "sha256": "x", "meta_json": "{}", "_datos": datos}
+    return filas
+
+
+def _correr(tmp: str, filas: dict, almacen: AlmacenLocal, destino, paralelo: int) -> float:
+    ruta_db = os.path.join(tmp, f"salida-{paralelo}-{time.monotonic_ns()}.sqlite3")
+    salida = SalidaSharePoint(ruta_db, destino, lambda d: (almacen.abrir(d), almacen.tamano(d)),
+                              paralelo=paralelo, espera_base=0.01, espera_max=0.05, max_intentos=50)
+    salida.encolar([{k: v for k, v in f.items() if k != "_datos"} for f in filas.values()])
+    t0 = time.perf_counter()
+    salida.iniciar()
+    while True:
+        estados = salida.estado()
+        if estados.get(LISTO, 0) + estados.get(ERROR, 0) == len(filas):
+            break
+        time.sleep(0.02)
+    total = time.perf_counter() - t0
+    salida.detener()
+    if estados.get(ERROR):
+        sys.exit(f"{estados[ERROR]} documentos quedaron en error")
+    return total
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--documentos", type=int, default=200)
+    ap.add_argument("--kb", type=int, default=200, help="tamaño de cada PDF (> 4096 usa sesiones de carga)")
+    ap.add_argument("--fallos", type=float, default=0.1)
+    ap.add_argument("--latencia", type=float, default=0.01)
+    ap.add_argument("--paralelo", type=int, nargs="+", default=[1, 4, 8])
+    ap.add_argument("--archivos", action="store_true", help="usa DestinoArchivos en lugar del servidor falso")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        almacen = AlmacenLocal(os.path.join(tmp, "storage"), sincronizar=False)
+        filas = _filas(almacen, args.documentos, args.kb)
+        print(f"documentos: {args.documentos} x {args.kb} KiB  fallos: {args.fallos:.0%}  latencia: {args.latencia}s")
+
+        if args.archivos:
+            print(f"{'paralelo':>8} {'docs/s':>8}")
+            for n in args.paralelo:
+                destino = DestinoArchivos(os.path.join(tmp, f"sp-{n}"), fallos=args.fallos, latencia=args.latencia)
+                total = _correr(tmp, filas, almacen, destino, n)
+                with open(os.path.join(tmp, f"sp-{n}", "lista.jsonl")) as f:
+                    creados = Counter(json.loads(l)["fields"]["DocId"] for l in f)
+                assert set(creados) == set(filas) and max(creados.values()) == 1
+                print(f"{n:>8} {len(filas) / total:>8.1f}")
+            return
+
+        print(f"{'paralelo':>8} {'docs/s':>8} {'peticiones':>11} {'conexiones':>11} {'reintentos':>11}")
+        for n in args.paralelo:
+            servidor = GraphFalso(args.fallos, args.latencia)
+            threading.Thread(target=servidor.serve_forever, daemon=True).start()
+            cliente = ClienteGraph("t", "c", "s", base_url=servidor.url + "/v1.0",
+                                   token_url=servidor.url + "/token", espera_base=0.01, reintentos=6)
+            destino = DestinoGraph(cliente, "sitio", "biblioteca", "lista")
+            try:
+                total = _correr(tmp, filas, almacen, destino, n)
+            finally:
+                cliente.cerrar()
+                servidor.shutdown()
+                servidor.server_close()
+            for doc_id, f in filas.items():
+                assert servidor.archivos[f"{doc_id}.pdf"] == f["_datos"], doc_id
+            assert set(servidor.elementos) == set(filas) and max(servidor.elementos.values()) == 1
+            e = cliente.estadisticas
+            print(f"{n:>8} {len(filas) / total:>8.1f} {e['peticiones']:>11} "
+                  f"{servidor.conexiones:>11} {e['reintentos']:>11}")
+
+
+if __name__ == "__main__":
+    main()
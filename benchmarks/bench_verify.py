@@ -0,0 +1,51 @@
+# benchmarks/bench_verify.py
+"""
+Compara la lectura de /CM_META con lector_rapido (cola del archivo) contra
+PdfReader completo, para PDFs sellados de distinto número de páginas.
+
+Uso:
+    python benchmarks/bench_verify.py [--paginas 1 100 1000 3000] [--repeticiones 20]
+"""
+import argparse, json, os, sys, time
+from io import BytesIO
+from statistics import median
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from PyPDF2 import PdfReader
+
+from bench_sello import pdf_sintetico
+from sello_monarca.sello import META_KEY
+from sello_monarca.incremental import anexar_pagina_y_metadatos
+from sello_monarca.lector_rapido import leer_meta
+from sello_monarca.qr_handler import generar_pagina_qr_bytes
+
+
+def cronometrar(fn, repeticiones: int) -> float:
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn()
+        tiempos.append(time.perf_counter() - t0)
+    return median(tiempos) * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--paginas", type=int, nargs="+", default=[1, 100, 1000, 3000])
+    ap.add_argument("--repeticiones", type=int, default=20)
+    args = ap.parse_args()
+
+    portada = generar_pagina_qr_bytes("https://mi-app.com/v/bench", "bench")
+    meta_json = json.dumps({"id": "bench", "signature": "x" * 96}, separators=(",", ":"))
+    print(f"{'páginas':>8} {'PDF KB':>9} {'rápido ms':>10} {'PdfReader ms':>13}")
+    for n in args.paginas:
+        pdf = anexar_pagina_y_metadatos(pdf_sintetico(n), portada, {META_KEY: meta_json})
+        t_rapido = cronometrar(lambda: leer_meta(pdf, META_KEY), args.repeticiones)
+        t_completo = cronometrar(lambda: PdfReader(BytesIO(pdf)).metadata.get(META_KEY), args.repeticiones)
+        print(f"{n:>8} {len(pdf) / 1024:>9.1f} {t_rapido:>10.3f} {t_completo:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+# benchmarks/suite.py
+"""
+Suite de benchmarks del pipeline de sellado y verificación, con resultados
+en JSON para comparar contra una corrida base.
+
+Casos: PDFs sintéticos de --paginas páginas, de texto (bench_sello) y con
+una imagen distinta por página ("imagen").
+
+Etapas (--etapas):
+  arranque      `import app` en un proceso nuevo con SELLO_ROLE=all y
+                SELLO_ROLE=verify; su pico_mb es el RSS total al terminar
+  portada       generar_pagina_qr_bytes()
+  sellado       sell() de cada caso con cada perfil de salida (--perfiles);
+                "sellado/<caso>" es el incremental y "sellado_<perfil>/<caso>"
+                los demás. Además del tiempo se registra el tamaño del
+                sellado (salida_kb) y su razón con el original
+  verificacion  verify() en modo metadatos y en modo contenido
+  http          POST /sign, POST /verify, GET /v/<id> y GET /file/<id> con
+                el test client de Flask (storage y llaves temporales)
+
+Por cada medición: mediana y p95 en ms, documentos/s, MB/s de entrada y
+pico de RSS sobre el inicial (VmHWM reiniciado antes de medir; fuera de
+Linux es el pico del proceso).
+
+--salida escribe el JSON. Con --base compara contra un JSON anterior:
+marca las mediciones cuya mediana, tamaño de salida o pico de memoria (si
+sube más de --min-mb) empeora más de --umbral y sale con código 1 si hay
+alguna.
+
+Uso:
+    python benchmarks/suite.py [--paginas 1 10 100 1000] [--tipos texto imagen]
+                               [--etapas arranque portada sellado verificacion http] [--repeticiones 5]
+                               [--perfiles incremental compacto]
+                               [--salida resultados.json] [--base base.json] [--umbral 0.2]
+"""
+import argparse, json, os, platform, random, subprocess, sys, tempfile, time
+from io import BytesIO
+from statistics import median, quantiles
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from PIL import Image
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from bench_sello import pdf_sintetico
+from sello_monarca import memoria
+from sello_monarca.qr_handler import generar_pagina_qr_bytes
+from sello_monarca.sello import PERFILES, sell, verify
+
+ETAPAS = ("arranque", "portada", "sellado", "verificacion", "http")
+ROLES = ("all", "verify")
+TIPOS = ("texto", "imagen")
+_MB = 1024 * 1024
+
+
+def pdf_con_imagenes(paginas: int, lado: int = 128) -> bytes:
+    """PDF con una imagen RGB de ruido distinta por página (no comprime ni se deduplica)."""
+    buf = BytesIO()
+    c = canvas.Canvas(buf)
+    for i in range(paginas):
+        ruido = random.Random(i).randbytes(lado * lado * 3)
+        c.drawImage(ImageReader(Image.frombytes("RGB", (lado, lado), ruido)), 72, 300, 450, 450)
+        c.drawString(72, 260, f"Página {i + 1}")
+        c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def generar(tipo: str, paginas: int) -> bytes:
+    return pdf_sintetico(paginas) if tipo == "texto" else pdf_con_imagenes(paginas)
+
+
+def medir(fn, repeticiones: int, bytes_entrada: int = 0) -> dict:
+    """Corre `fn` una vez para calentar y `repeticiones` veces midiendo."""
+    fn()
+    memoria.reiniciar_pico()
+    inicial = memoria.pico_rss_kb()
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn()
+        tiempos.append(time.perf_counter() - t0)
+    return _resumen(tiempos, bytes_entrada, (memoria.pico_rss_kb() - inicial) / 1024)
+
+
+def _resumen(tiempos: list, bytes_entrada: int, pico_mb: float) -> dict:
+    mediana = median(tiempos)
+    return {
+        "mediana_ms": round(mediana * 1000, 3),
+        "p95_ms": round((quantiles(tiempos, n=20)[-1] if len(tiempos) > 1 else tiempos[0]) * 1000, 3),
+        "docs_s": round(1 / mediana, 2) if mediana else None,
+        "mb_s": round(bytes_entrada / _MB / mediana, 2) if mediana and bytes_entrada else None,
+        "pico_mb": round(pico_mb, 1),
+        "repeticiones": len(tiempos),
+    }
+
+
+def _llaves_en_entorno(tmp: str):
+    """Llave nueva para la app: PEM en el entorno, como en .env."""
+    llave = ec.generate_private_key(ec.SECP256R1())
+    os.environ["PRIVATE_KEY_PEM"] = llave.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+        serialization.BestAvailableEncryption(b"secreto")).decode()
+    os.environ["PUBLIC_KEY_PEM"] = llave.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+    os.environ["STORAGE_DIR"] = os.path.join(tmp, "storage")
+    os.environ.setdefault("SELLO_WORKERS", "0")
+
+
+_CODIGO_ARRANQUE = (
+    "import sys, time\n"
+    "t0 = time.perf_counter()\n"
+    "import app\n"
+    "t = time.perf_counter() - t0\n"
+    "from sello_monarca.memoria import pico_rss_kb\n"
+    "print(t, pico_rss_kb(), int('reportlab' in sys.modules))\n"
+)
+
+
+def etapa_arranque(repeticiones: int, tmp: str) -> dict:
+    """Tiempo de `import app` en frío (proceso nuevo) para cada SELLO_ROLE."""
+    _llaves_en_entorno(tmp)
+    resultados = {}
+    for rol in ROLES:
+        tiempos, picos = [], []
+        for _ in range(repeticiones):
+            r = subprocess.run([sys.executable, "-c", _CODIGO_ARRANQUE], cwd=RAIZ,
+                               env=dict(os.environ, SELLO_ROLE=rol),
+                               capture_output=True, text=True, check=True)
+            segundos, pico_kb, con_reportlab = r.stdout.split()
+            tiempos.append(float(segundos))
+            picos.append(int(pico_kb))
+        resultados[f"arranque/{rol}"] = _resumen(tiempos, 0, median(picos) / 1024)
+        resultados[f"arranque/{rol}"]["reportlab"] = con_reportlab == "1"
+    return resultados
+
+
+def etapa_http(casos: dict, repeticiones: int, tmp: str) -> dict:
+    _llaves_en_entorno(tmp)
+    import app as aplicacion
+    cliente = aplicacion.app.test_client()
+    meta = json.dumps({"uploader": "bench", "area": "bench"})
+    resultados = {}
+    for nombre, pdf in casos.items():
+        def firmar():
+            r = cliente.post("/sign", data={"file": (BytesIO(pdf), "bench.pdf"), "meta": meta})
+            assert r.status_code == 200, r.data
+            return r.json["doc_id"]
+
+        doc_id = firmar()
+        sellado = aplicacion.ALMACEN.abrir(doc_id).read()
+
+        def verificar():
+            r = cliente.post("/verify", data={"file": (BytesIO(sellado), "bench.pdf")})
+            assert r.status_code == 200 and r.json["valid"], r.data
+
+        def pagina():
+            assert cliente.get(f"/v/{doc_id}").status_code == 200
+
+        def archivo():
+            assert len(cliente.get(f"/file/{doc_id}").data) == len(sellado)
+
+        resultados[f"http_sign/{nombre}"] = medir(firmar, repeticiones, len(pdf))
+        resultados[f"http_verify/{nombre}"] = medir(verificar, repeticiones, len(sellado))
+        resultados[f"http_v/{nombre}"] = medir(pagina, repeticiones)
+        resultados[f"http_file/{nombre}"] = medir(archivo, repeticiones, len(sellado))
+    return resultados
+
+
+def correr(args) -> dict:
+    resultados = {}
+    llave = ec.generate_private_key(ec.SECP256R1())
+    meta = {"uploader": "bench", "area": "bench", "original_filename": "bench.pdf"}
+
+    if "arranque" in args.etapas:
+        with tempfile.TemporaryDirectory() as tmp:
+            resultados.update(etapa_arranque(args.repeticiones, tmp))
+
+    if "portada" in args.etapas:
+        url = "https://mi-app.com/v/00000000-0000-0000-0000-000000000000"
+        resultados["portada/qr"] = medir(lambda: generar_pagina_qr_bytes(url, "bench"), args.repeticiones * 10)
+
+    casos = {}
+    for tipo in args.tipos:
+        for n in args.paginas:
+            casos[f"{tipo}-{n}"] = generar(tipo, n)
+    for nombre, pdf in casos.items():
+        print(f"  caso {nombre}: {len(pdf) / 1024:.0f} KiB", file=sys.stderr)
+
+    for nombre, pdf in casos.items():
+        if "sellado" in args.etapas:
+            for perfil in args.perfiles:
+                clave = "sellado" if perfil == "incremental" else f"sellado_{perfil}"
+                r = medir(lambda: sell(pdf, meta, llave, perfil=perfil), args.repeticiones, len(pdf))
+                salida = len(sell(pdf, meta, llave, perfil=perfil)[0])
+                r["salida_kb"] = round(salida / 1024, 1)
+                r["razon_salida"] = round(salida / len(pdf), 3)
+                resultados[f"{clave}/{nombre}"] = r
+        if "verificacion" in args.etapas:
+            sellado, _ = sell(pdf, meta, llave)
+            publica = llave.public_key()
+            for modo, contenido in (("metadatos", False), ("contenido", True)):
+                def verificar():
+                    assert verify(BytesIO(sellado), publica, contenido=contenido)[0]
+                resultados[f"verificacion_{modo}/{nombre}"] = medir(verificar, args.repeticiones, len(sellado))
+
+    if "http" in args.etapas:
+        with tempfile.TemporaryDirectory() as tmp:
+            resultados.update(etapa_http(casos, args.repeticiones, tmp))
+    return resultados
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def comparar(actual: dict, base: dict, umbral: float, min_mb: float) -> list:
+    """Mediciones de `actual` que empeoran más de `umbral` respecto a `base`."""
+    regresiones = []
+    for clave, r in actual.items():
+        b = base.get(clave)
+        if b is None:
+            continue
+        if b["mediana_ms"] and r["mediana_ms"] > b["mediana_ms"] * (1 + umbral):
+            regresiones.append((clave, "mediana_ms", b["mediana_ms"], r["mediana_ms"]))
+        if b.get("salida_kb") and r.get("salida_kb", 0) > b["salida_kb"] * (1 + umbral):
+            regresiones.append((clave, "salida_kb", b["salida_kb"], r["salida_kb"]))
+        if r["pico_mb"] - b["pico_mb"] > max(min_mb, b["pico_mb"] * umbral):
+            regresiones.append((clave, "pico_mb", b["pico_mb"], r["pico_mb"]))
+    return regresiones
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--paginas", type=int, nargs="+", default=[1, 10, 100, 1000])
+    ap.add_argument("--tipos", nargs="+", choices=TIPOS, default=list(TIPOS))
+    ap.add_argument("--etapas", nargs="+", choices=ETAPAS, default=list(ETAPAS))
+    ap.add_argument("--repeticiones", type=int, default=5)
+    ap.add_argument("--perfiles", nargs="+", choices=PERFILES, default=list(PERFILES))
+    ap.add_argument("--salida", help="archivo JSON con los resultados")
+    ap.add_argument("--base", help="JSON de una corrida anterior para comparar")
+    ap.add_argument("--umbral", type=float, default=0.2, help="empeoramiento tolerado (0.2 = 20%%)")
+    ap.add_argument("--min-mb", type=float, default=5.0, help="subida de memoria mínima para marcarla")
+    args = ap.parse_args()
+
+    resultados = correr(args)
+    informe = {
+        "version": 1,
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": {"paginas": args.paginas, "tipos": args.tipos, "etapas": args.etapas,
+                       "repeticiones": args.repeticiones, "perfiles": args.perfiles},
+        "resultados": resultados,
+    }
+
+    print(f"{'medición':<36} {'mediana ms':>11} {'p95 ms':>9} {'docs/s':>8} {'MB/s':>8} {'pico MB':>8} "
+          f"{'salida KiB':>11}")
+    for clave, r in resultados.items():
+        salida = f"{r['salida_kb']:>11.1f}" if "salida_kb" in r else ""
+        print(f"{clave:<36} {r['mediana_ms']:>11.2f} {r['p95_ms']:>9.2f} {r['docs_s'] or 0:>8.1f} "
+              f"{r['mb_s'] or 0:>8.1f} {r['pico_mb']:>8.1f} {salida}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+        print(f"resultados en {args.salida}")
+
+    if args.base:
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+        regresiones = comparar(resultados, base["resultados"], args.umbral, args.min_mb)
+        print(f"\ncomparado con {args.base} ({base.get('commit') or 'sin commit'}, umbral {args.umbral:.0%})")
+        for clave, metrica, antes, ahora in regresiones:
+            print(f"  REGRESIÓN {clave} {metrica}: {antes} -> {ahora}")
+        if regresiones:
+            sys.exit(f"{len(regresiones)} regresiones")
+        print("  sin regresiones")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+# sello_monarca/almacen.py
+"""
+Almacenamiento de los PDFs sellados.
+
+app.py sólo usa la interfaz Almacen; AlmacenLocal es la implementación por
+defecto sobre el sistema de archivos. Un backend de objetos (S3, Azure Blob)
+implementaría los mismos métodos: ruta_local() devolvería None y abrir() un
+stream del objeto.
+
+AlmacenLocal:
+
+  <raiz>/documentos/ab/cd/<doc_id>.pdf     documento completo
+  <raiz>/documentos/ab/cd/<doc_id>.sello   documento deduplicado (ver abajo)
+  <raiz>/originales/ab/<content_sha256>    qué documento guarda ese original
+  <raiz>/tmp/                              escrituras en curso
+
+- Se reparte por los primeros caracteres del doc_id: ningún directorio
+  crece con el número de documentos.
+- Toda escritura va a tmp/ y se publica con fsync + os.replace: un corte
+  a mitad de escritura nunca deja un PDF truncado con el nombre final.
+- El sello es una actualización incremental, así que el PDF sellado
+  empieza con los bytes exactos del original (content_sha256 /
+  content_length del /CM_META). Si ese original ya está guardado dentro de
+  otro documento, sólo se guarda la sección del sello (.sello) con una
+  referencia a ese documento; al leerlo se concatenan ambos.
+- Los documentos anteriores, planos en <raiz>/<doc_id>.pdf, se siguen
+  leyendo; `python -m sello_monarca.almacen --storage storage` los reparte.
+"""
+from __future__ import annotations
+import argparse, io, os, re, shutil, tempfile
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+_RE_ID = re.compile(r"[0-9A-Za-z_-]{4,}")
+_CABECERA_SELLO = b"%SELLO-REF "
+_BLOQUE = 1024 * 1024
+
+
+class Almacen(ABC):
+    """
+    Interfaz de almacenamiento de documentos sellados. Un backend al que le
+    falte algún método abstracto falla al construirse, no en la primera
+    petición.
+    """
+
+    @abstractmethod
+    def version(self, doc_id: str) -> Optional[str]:
+        """Cadena que cambia si el documento se re-escribe; None si no existe."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def tamano(self, doc_id: str) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def ruta_local(self, doc_id: str) -> Optional[str]:
+        """Ruta de un archivo con el PDF completo, si la hay (send_file, mmap)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def abrir(self, doc_id: str) -> BinaryIO:
+        """Stream binario con el PDF; FileNotFoundError si no existe."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def temporal(self):
+        """Context manager con una ruta donde escribir antes de guardar(); se borra al salir."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def guardar(self, doc_id: str, ruta_tmp: str, content_sha256: Optional[str] = None,
+                content_length: Optional[int] = None) -> None:
+        """
+        Publica el PDF sellado de `ruta_tmp` (creada con temporal()) como
+        `doc_id` (si ya existe lo reemplaza). Con content_sha256/content_length
+        puede deduplicar el original.
+        """
+        raise NotImplementedError
+
+    def guardar_bytes(self, doc_id: str, datos: bytes, content_sha256: Optional[str] = None,
+                      content_length: Optional[int] = None) -> None:
+        with self.temporal() as ruta_tmp:
+            with open(ruta_tmp, "wb") as f:
+                f.write(datos)
+            self.guardar(doc_id, ruta_tmp, content_sha256, content_length)
+
+    @abstractmethod
+    def ids(self) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class _Concatenado(io.RawIOBase):
+    """Lectura de solo lectura de varios tramos (ruta, inicio, largo) como un solo archivo."""
+
+    def __init__(self, tramos: List[Tuple[str, int, int]]):
+        self._tramos = []
+        inicio_virtual = 0
+        for ruta, inicio, largo in tramos:
+            self._tramos.append((open(ruta, "rb"), inicio, largo, inicio_virtual))
+            inicio_virtual += largo
+        self._largo = inicio_virtual
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, pos: int, desde: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._largo}[desde]
+        self._pos = max(base + pos, 0)
+        return self._pos
+
+    def readinto(self, buffer) -> int:
+        for f, inicio, largo, inicio_virtual in self._tramos:
+            if inicio_virtual <= self._pos < inicio_virtual + largo:
+                desplazamiento = self._pos - inicio_virtual
+                n = min(len(buffer), largo - desplazamiento)
+                f.seek(inicio + desplazamiento)
+                leidos = f.readinto(memoryview(buffer)[:n])
+                self._pos += leidos
+                return leidos
+        return 0
+
+    def close(self) -> None:
+        for f, *_ in self._tramos:
+            f.close()
+        super().close()
+
+
+class AlmacenLocal(Almacen):
+    """Documentos en el sistema de archivos local (ver el docstring del módulo)."""
+
+    def __init__(self, raiz: str, sincronizar: bool = True):
+        self.raiz = os.path.abspath(raiz)
+        self.sincronizar = sincronizar
+        self._tmp = os.path.join(self.raiz, "tmp")
+        os.makedirs(self._tmp, exist_ok=True)
+
+    # -------- rutas --------
+    def _ruta(self, doc_id: str, extension: str) -> str:
+        if not _RE_ID.fullmatch(doc_id):
+            raise ValueError(f"doc_id inválido: {doc_id!r}")
+        return os.path.join(self.raiz, "documentos", doc_id[:2], doc_id[2:4], doc_id + extension)
+
+    def _ruta_original(self, content_sha256: str) -> str:
+        return os.path.join(self.raiz, "originales", content_sha256[:2], content_sha256)
+
+    def _buscar(self, doc_id: str) -> Tuple[Optional[str], bool]:
+        """(ruta, es_completo) del archivo que guarda `doc_id`, o (None, False)."""
+        try:
+            completo = self._ruta(doc_id, ".pdf")
+        except ValueError:
+            return None, False
+        if os.path.exists(completo):
+            return completo, True
+        seccion = self._ruta(doc_id, ".sello")
+        if os.path.exists(seccion):
+            return seccion, False
+        plano = os.path.join(self.raiz, doc_id + ".pdf")
+        if os.path.exists(plano):
+            return plano, True
+        return None, False
+
+    @staticmethod
+    def _leer_cabecera(ruta_seccion: str) -> Tuple[str, int, int]:
+        """(doc_id base, largo del original, offset de la sección) de un .sello."""
+        with open(ruta_seccion, "rb") as f:
+            linea = f.readline()
+        if not linea.startswith(_CABECERA_SELLO):
+            raise ValueError(f"{ruta_seccion}: no es una sección de sello")
+        base, largo, _ = linea[len(_CABECERA_SELLO):].split()
+        return base.decode(), int(largo), len(linea)
+
+    # -------- lectura --------
+    def version(self, doc_id: str) -> Optional[str]:
+        ruta, _ = self._buscar(doc_id)
+        if ruta is None:
+            return None
+        st = os.stat(ruta)
+        return f"{st.st_mtime_ns}:{st.st_size}"
+
+    def tamano(self, doc_id: str) -> int:
+        ruta, completo = self._buscar(doc_id)
+        if ruta is None:
+            raise FileNotFoundError(doc_id)
+        if completo:
+            return os.path.getsize(ruta)
+        _, largo, offset = self._leer_cabecera(ruta)
+        return largo + os.path.getsize(ruta) - offset
+
+    def ruta_local(self, doc_id: str) -> Optional[str]:
+        ruta, completo = self._buscar(doc_id)
+        return ruta if completo else None
+
+    def abrir(self, doc_id: str) -> BinaryIO:
+        ruta, completo = self._buscar(doc_id)
+        if ruta is None:
+            raise FileNotFoundError(doc_id)
+        if completo:
+            return open(ruta, "rb")
+        base, largo, offset = self._leer_cabecera(ruta)
+        ruta_base = self.ruta_local(base)
+        if ruta_base is None:
+            raise FileNotFoundError(f"{doc_id}: falta el documento base {base}")
+        tramos = [(ruta_base, 0, largo), (ruta, offset, os.path.getsize(ruta) - offset)]
+        return io.BufferedReader(_Concatenado(tramos), _BLOQUE)
+
+    def ids(self) -> Iterator[str]:
+        for raiz, _, archivos in os.walk(os.path.join(self.raiz, "documentos")):
+            for nombre in archivos:
+                doc_id, ext = os.path.splitext(nombre)
+                if ext in (".pdf", ".sello"):
+                    yield doc_id
+        for nombre in os.listdir(self.raiz):
+            doc_id, ext = os.path.splitext(nombre)
+            if ext == ".pdf" and _RE_ID.fullmatch(doc_id):
+                yield doc_id
+
+    # -------- escritura --------
+    @contextmanager
+    def temporal(self) -> Iterator[str]:
+        fd, ruta = tempfile.mkstemp(suffix=".tmp", dir=self._tmp)
+        os.close(fd)
+        try:
+            yield ruta
+        finally:
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass                    # ya publicada con guardar()
+
+    def _publicar(self, ruta_tmp: str, destino: str) -> None:
+        """fsync + chmod + rename: `destino` aparece completo o no aparece."""
+        if self.sincronizar:
+            with open(ruta_tmp, "rb") as f:
+                os.fsync(f.fileno())
+        os.chmod(ruta_tmp, 0o644)           # mkstemp crea con 0600
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        os.replace(ruta_tmp, destino)
+
+    def _documento_con_original(self, content_sha256: str, content_length: int) -> Optional[str]:
+        """doc_id de un documento completo que empieza con ese original, si existe."""
+        try:
+            with open(self._ruta_original(content_sha256), "rb") as f:
+                base, largo = f.read().split()
+        except (FileNotFoundError, ValueError):
+            return None
+        base = base.decode()
+        ruta = self.ruta_local(base)
+        if int(largo) != content_length or ruta is None or os.path.getsize(ruta) < content_length:
+            return None
+        return base
+
+    def guardar(self, doc_id: str, ruta_tmp: str, content_sha256: Optional[str] = None,
+                content_length: Optional[int] = None) -> None:
+        # Si el documento ya existe (re-firma) y está completo se reemplaza
+        # completo: otros .sello pueden usarlo de base
+        actual, completo = self._buscar(doc_id)
+        base = None
+        if content_sha256 and content_length and not completo:
+            base = self._documento_con_original(content_sha256, content_length)
+
+        if base is None:
+            destino = self._ruta(doc_id, ".pdf")
+            self._publicar(ruta_tmp, destino)
+            if actual is not None and actual != destino:
+                os.remove(actual)           # .sello o archivo plano anterior
+            if content_sha256 and content_length:
+                with self.temporal() as ref_tmp:
+                    with open(ref_tmp, "wb") as f:
+                        f.write(b"%s %d\n" % (doc_id.encode(), content_length))
+                    self._publicar(ref_tmp, self._ruta_original(content_sha256))
+            return
+
+        # El original ya está guardado: sólo se conserva la sección del sello
+        with self.temporal() as seccion_tmp:
+            with open(ruta_tmp, "rb") as origen, open(seccion_tmp, "wb") as destino:
+                destino.write(_CABECERA_SELLO + b"%s %d %s\n" % (
+                    base.encode(), content_length, content_sha256.encode()))
+                origen.seek(content_length)
+                shutil.copyfileobj(origen, destino, _BLOQUE)
+            self._publicar(seccion_tmp, self._ruta(doc_id, ".sello"))
+        os.remove(ruta_tmp)
+
+    def migrar_planos(self) -> int:
+        """Mueve los <raiz>/<doc_id>.pdf planos a su directorio repartido."""
+        movidos = 0
+        for nombre in os.listdir(self.raiz):
+            doc_id, ext = os.path.splitext(nombre)
+            if ext == ".pdf" and _RE_ID.fullmatch(doc_id):
+                destino = self._ruta(doc_id, ".pdf")
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                os.replace(os.path.join(self.raiz, nombre), destino)
+                movidos += 1
+        return movidos
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Reparte en subdirectorios los PDFs planos de storage/")
+    ap.add_argument("--storage", default="storage")
+    args = ap.parse_args(argv)
+    print(f"{AlmacenLocal(args.storage).migrar_planos()} documentos movidos")
+
+
+if __name__ == "__main__":
+    main()
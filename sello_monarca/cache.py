@@ -0,0 +1,142 @@
+# sello_monarca/cache.py
+"""
+Caché de resultados de verificación.
+
+Los documentos sellados no cambian, así que el resultado de verificar un
+doc_id (firma ECDSA + canonicalización del JSON) se puede reutilizar
+mientras el archivo tenga el mismo mtime/tamaño (o el mismo hash).
+
+Dos niveles:
+  1. Memoria del proceso: LRU acotado con TTL.
+  2. Opcional, en disco (SQLite) y compartido por todos los workers de
+     gunicorn; se consulta cuando falla el nivel 1.
+"""
+from __future__ import annotations
+import json, os, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+_PURGA_CADA = 1000          # escrituras en disco entre purgas de expirados
+
+
+class CacheVerificacion:
+    """LRU + TTL en memoria con un nivel opcional compartido en SQLite."""
+
+    def __init__(self, capacidad: int = 1024, ttl: float = 300.0,
+                 ruta_disco: Optional[str] = None):
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self.ruta_disco = ruta_disco
+        self._datos: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._escrituras_disco = 0
+        self._contadores = {
+            "hits_memoria": 0, "hits_disco": 0, "misses": 0,
+            "expirados": 0, "desalojados": 0, "errores_disco": 0,
+        }
+        if ruta_disco:
+            os.makedirs(os.path.dirname(os.path.abspath(ruta_disco)), exist_ok=True)
+            with self._disco() as con:
+                con.execute(
+                    "CREATE TABLE IF NOT EXISTS cache "
+                    "(clave TEXT PRIMARY KEY, valor TEXT NOT NULL, expira REAL NOT NULL)"
+                )
+
+    # -------- nivel 2: disco --------
+    def _disco(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.ruta_disco, timeout=5)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=OFF")
+            self._local.con = con
+        return con
+
+    # Un fallo del nivel compartido (p. ej. base bloqueada) nunca rompe la
+    # petición: se trata como miss o simplemente no se escribe.
+    def _leer_disco(self, clave: str):
+        try:
+            fila = self._disco().execute(
+                "SELECT valor FROM cache WHERE clave = ? AND expira > ?", (clave, time.time())
+            ).fetchone()
+        except sqlite3.Error:
+            self._contar("errores_disco")
+            return None
+        return json.loads(fila[0]) if fila else None
+
+    def _escribir_disco(self, clave: str, valor) -> None:
+        try:
+            with self._disco() as con:
+                con.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)",
+                            (clave, json.dumps(valor), time.time() + self.ttl))
+                self._escrituras_disco += 1
+                if self._escrituras_disco % _PURGA_CADA == 0:
+                    con.execute("DELETE FROM cache WHERE expira <= ?", (time.time(),))
+        except sqlite3.Error:
+            self._contar("errores_disco")
+
+    # -------- nivel 1: memoria --------
+    def _contar(self, nombre: str) -> None:
+        with self._lock:
+            self._contadores[nombre] += 1
+
+    def obtener(self, clave: str):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None:
+                expira, valor = entrada
+                if expira > ahora:
+                    self._datos.move_to_end(clave)
+                    self._contadores["hits_memoria"] += 1
+                    return valor
+                del self._datos[clave]
+                self._contadores["expirados"] += 1
+
+        if self.ruta_disco:
+            valor = self._leer_disco(clave)
+            if valor is not None:
+                self._contar("hits_disco")
+                self._guardar_memoria(clave, valor)
+                return valor
+        self._contar("misses")
+        return None
+
+    def _guardar_memoria(self, clave: str, valor) -> None:
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+                self._contadores["desalojados"] += 1
+
+    def guardar(self, clave: str, valor) -> None:
+        """`valor` debe ser serializable a JSON si hay nivel en disco."""
+        self._guardar_memoria(clave, valor)
+        if self.ruta_disco:
+            self._escribir_disco(clave, valor)
+
+    def obtener_o_calcular(self, clave: str, calcular: Callable[[], Any]):
+        valor = self.obtener(clave)
+        if valor is None:
+            valor = calcular()
+            self.guardar(clave, valor)
+        return valor
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            datos = dict(self._contadores)
+            datos["entradas"] = len(self._datos)
+        consultas = datos["hits_memoria"] + datos["hits_disco"] + datos["misses"]
+        datos["capacidad"] = self.capacidad
+        datos["ttl"] = self.ttl
+        datos["disco"] = bool(self.ruta_disco)
+        datos["tasa_hits"] = round((consultas - datos["misses"]) / consultas, 4) if consultas else None
+        return datos
+
+
+def clave_documento(doc_id: str, version: str) -> str:
+    """doc_id + Almacen.version() (mtime + tamaño): cambia si el documento se re-escribe."""
+    return f"{doc_id}:{version}"
@@ -0,0 +1,260 @@
+# sello_monarca/compacto.py
+"""
+Perfil de salida "compacto": re-escribe el PDF original en una forma más
+chica antes de sellarlo.
+
+El sello incremental copia el original tal cual, con su peso muerto
+(contenidos sin comprimir, fuentes e imágenes repetidas por página, tabla
+xref en texto). compactar() genera un documento equivalente:
+
+- Streams sin filtro comprimidos con Flate y los Flate existentes
+  re-comprimidos a nivel 9; sólo se conserva el resultado si es más chico.
+  No se toca ningún otro filtro (DCT, JBIG2...): no hay pérdida.
+- Objetos idénticos (fuentes, imágenes, descriptores, ExtGState, arreglos)
+  fusionados en uno; se repite hasta que no cambia nada, así una fuente
+  repetida se fusiona junto con su FontFile.
+- Objetos que no son streams empaquetados en object streams y tabla de
+  referencias como xref stream (PDF 1.5).
+
+El documento entero pasa por objetos de PyPDF2 y la salida se arma en
+memoria (con muchos objetos chicos, hasta ~8 veces el tamaño del
+original), así que los originales de más de MAX_ENTRADA no se compactan
+(ver sello.cuerpo_segun_perfil): se sellan incrementales, con la memoria
+acotada de sellar_en().
+
+Sólo se copia lo alcanzable desde /Root e /Info (se descartan objetos
+huérfanos y secciones incrementales anteriores). El resultado es
+determinista: el mismo original produce los mismos bytes, así que la
+deduplicación del almacén sigue funcionando sobre el cuerpo compacto.
+"""
+from __future__ import annotations
+from hashlib import sha256
+from io import BytesIO
+import mmap, re, zlib
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from PyPDF2 import PdfReader, generic
+
+from sello_monarca.incremental import serializar
+
+OBJETOS_POR_STREAM = 100
+MAX_ENTRADA = 16 * 1024 * 1024      # bytes; por encima se sella el original
+_MIN_COMPRIMIR = 64                 # streams más chicos no ganan con Flate
+_RE_VERSION = re.compile(rb"%PDF-1\.(\d)")
+
+# Diccionarios que se pueden compartir sin cambiar el documento; páginas,
+# anotaciones, campos o nodos de estructura tienen identidad propia
+_TIPOS_DEDUPLICABLES = {"/Font", "/FontDescriptor", "/ExtGState", "/Encoding"}
+_CLAVES_DEDUPLICABLES = ("/FunctionType", "/ShadingType", "/PatternType")
+
+
+def _referencias(obj) -> List[Tuple[int, int]]:
+    """(idnum, generación) de las referencias indirectas que contiene `obj` (sin entrar en ellas)."""
+    refs: List[Tuple[int, int]] = []
+    pila = [obj]
+    while pila:
+        o = pila.pop()
+        if isinstance(o, generic.IndirectObject):
+            refs.append((o.idnum, o.generation))
+        elif isinstance(o, generic.DictionaryObject):
+            es_stream = isinstance(o, generic.StreamObject)
+            pila.extend(v for k, v in dict.items(o) if not (es_stream and k == "/Length"))
+        elif isinstance(o, generic.ArrayObject):
+            pila.extend(list.__iter__(o))
+    return refs
+
+
+def _comprimir(stream: generic.StreamObject) -> generic.StreamObject:
+    """Copia de `stream` con Flate (nivel 9) si así queda más chico."""
+    filtro = stream.get("/Filter")
+    if isinstance(filtro, generic.ArrayObject) and len(filtro) == 1:
+        filtro = filtro[0]
+    datos = stream._data or b""
+    if isinstance(datos, str):
+        datos = datos.encode("latin-1")
+    if len(datos) < _MIN_COMPRIMIR or stream.get("/Type") == "/Metadata":
+        return stream                   # XMP se deja legible para herramientas que no leen PDF
+    if filtro is None:
+        if "/DecodeParms" in stream:
+            return stream
+        nuevo_dato = zlib.compress(datos, 9)
+    elif filtro == "/FlateDecode":
+        try:
+            nuevo_dato = zlib.compress(zlib.decompress(datos), 9)
+        except zlib.error:
+            return stream
+    else:
+        return stream
+    if len(nuevo_dato) >= len(datos):
+        return stream
+    nuevo = generic.DecodedStreamObject()
+    nuevo.update(dict.items(stream))
+    nuevo[generic.NameObject("/Filter")] = generic.NameObject("/FlateDecode")
+    nuevo._data = nuevo_dato
+    return nuevo
+
+
+def _deduplicable(obj) -> bool:
+    if isinstance(obj, generic.StreamObject):
+        return obj.get("/Type") not in ("/XRef", "/ObjStm")
+    if isinstance(obj, generic.DictionaryObject):
+        return (dict.get(obj, "/Type") in _TIPOS_DEDUPLICABLES
+                or any(k in obj for k in _CLAVES_DEDUPLICABLES))
+    return isinstance(obj, generic.ArrayObject)
+
+
+def _fusionar_identicos(objetos: Dict[int, object], max_pasadas: int = 8) -> Dict[int, int]:
+    """
+    {idnum: idnum representante}. Dos objetos deduplicables son el mismo si
+    serializan igual una vez que sus referencias apuntan a representantes.
+    """
+    canon = {num: num for num in objetos}
+    candidatos = [num for num, obj in objetos.items() if _deduplicable(obj)]
+    # El hash de los datos de cada stream no cambia entre pasadas
+    hash_datos = {
+        num: sha256(objetos[num]._data or b"").digest()
+        for num in candidatos if isinstance(objetos[num], generic.StreamObject)
+    }
+    renum = lambda n: canon.get(n, n)
+    for _ in range(max_pasadas):
+        grupos: Dict[Tuple[bytes, Optional[bytes]], int] = {}
+        cambio = False
+        for num in candidatos:
+            obj = objetos[num]
+            if num in hash_datos:
+                cabecera = generic.DictionaryObject(
+                    (k, v) for k, v in dict.items(obj) if k != "/Length")
+                clave = (serializar(cabecera, renum), hash_datos[num])
+            else:
+                clave = (serializar(obj, renum), None)
+            representante = grupos.setdefault(clave, canon[num])
+            if representante != canon[num]:
+                canon[num] = representante
+                cambio = True
+        if not cambio:
+            break
+    return canon
+
+
+def _cuerpo_objstm(cuerpos: List[Tuple[int, bytes]]) -> generic.DecodedStreamObject:
+    cabecera, datos = BytesIO(), BytesIO()
+    for num, cuerpo in cuerpos:
+        cabecera.write(b"%d %d " % (num, datos.tell()))
+        datos.write(cuerpo)
+        datos.write(b"\n")
+    primero = cabecera.tell()
+    objstm = generic.DecodedStreamObject()
+    objstm[generic.NameObject("/Type")] = generic.NameObject("/ObjStm")
+    objstm[generic.NameObject("/N")] = generic.NumberObject(len(cuerpos))
+    objstm[generic.NameObject("/First")] = generic.NumberObject(primero)
+    objstm[generic.NameObject("/Filter")] = generic.NameObject("/FlateDecode")
+    objstm._data = zlib.compress(cabecera.getvalue() + datos.getvalue(), 9)
+    return objstm
+
+
+def compactar(pdf_original) -> bytes:
+    """
+    Re-escribe `pdf_original` (bytes o mmap) en el perfil compacto.
+    Lanza ValueError si el documento está cifrado o si alguna referencia
+    alcanzable no se puede resolver: la copia no debe perder nada.
+    """
+    reader = PdfReader(pdf_original if isinstance(pdf_original, mmap.mmap) else BytesIO(pdf_original))
+    trailer = reader.trailer
+    if "/Encrypt" in trailer:
+        raise ValueError("PDF cifrado: no se puede compactar")
+    if "/Root" not in trailer:
+        raise ValueError("PDF sin /Root")
+    raices = [trailer.raw_get(k) for k in ("/Root", "/Info") if k in trailer]
+
+    # 1) Grafo alcanzable, en orden de recorrido (el orden fija la numeración).
+    # La salida numera por idnum: en un documento válido cada idnum tiene una
+    # sola generación viva, así que dos generaciones del mismo son un error.
+    objetos: Dict[int, object] = {}
+    generaciones: Dict[int, int] = {}
+    pendientes = deque((r.idnum, r.generation) for r in raices if isinstance(r, generic.IndirectObject))
+    while pendientes:
+        num, gen = pendientes.popleft()
+        if num in objetos:
+            if generaciones[num] != gen:
+                raise ValueError(f"Referencias a {num} con generaciones {generaciones[num]} y {gen}")
+            continue
+        obj = reader.get_object(generic.IndirectObject(num, gen, reader))
+        if obj is None:
+            raise ValueError(f"No se puede resolver el objeto {num} {gen} R")
+        if isinstance(obj, generic.StreamObject):
+            obj = _comprimir(obj)
+        objetos[num] = obj
+        generaciones[num] = gen
+        pendientes.extend(ref for ref in _referencias(obj) if generaciones.get(ref[0]) != ref[1])
+
+    # 2) Fusión de idénticos y numeración nueva desde 1
+    canon = _fusionar_identicos(objetos)
+    nuevos: Dict[int, int] = {}
+    for num in objetos:
+        if canon[num] == num:
+            nuevos[num] = len(nuevos) + 1
+    for num in objetos:
+        representante = canon[num]
+        while canon[representante] != representante:
+            representante = canon[representante]
+        canon[num] = representante
+        nuevos[num] = nuevos[representante]
+
+    def renum(n: int) -> int:
+        if n not in nuevos:
+            raise ValueError(f"Referencia a un objeto que no se copió: {n}")
+        return nuevos[n]
+
+    # 3) Salida: streams sueltos; el resto en object streams
+    version = _RE_VERSION.match(bytes(pdf_original[:16]))
+    menor = max(5, int(version.group(1)) if version else 0)
+    out = BytesIO()
+    out.write(b"%%PDF-1.%d\n%%\xe2\xe3\xcf\xd3\n" % menor)
+    entradas: Dict[int, Tuple[int, int, int]] = {}      # num -> (tipo, campo 2, campo 3)
+    sueltos: List[Tuple[int, bytes]] = []
+    for num, obj in objetos.items():
+        if canon[num] != num:
+            continue
+        cuerpo = serializar(obj, renum)
+        if isinstance(obj, generic.StreamObject):
+            entradas[nuevos[num]] = (1, out.tell(), 0)
+            out.write(b"%d 0 obj\n" % nuevos[num] + cuerpo + b"\nendobj\n")
+        else:
+            sueltos.append((nuevos[num], cuerpo))
+
+    siguiente = len([n for n in objetos if canon[n] == n]) + 1
+    for i in range(0, len(sueltos), OBJETOS_POR_STREAM):
+        grupo = sueltos[i:i + OBJETOS_POR_STREAM]
+        num_objstm = siguiente
+        siguiente += 1
+        entradas[num_objstm] = (1, out.tell(), 0)
+        out.write(b"%d 0 obj\n" % num_objstm + serializar(_cuerpo_objstm(grupo)) + b"\nendobj\n")
+        for indice, (num, _) in enumerate(grupo):
+            entradas[num] = (2, num_objstm, indice)
+
+    # 4) xref stream con el trailer
+    num_xref = siguiente
+    xref_pos = out.tell()
+    entradas[num_xref] = (1, xref_pos, 0)
+    ancho = max(1, (xref_pos.bit_length() + 7) // 8)
+    filas = bytearray(b"\x00" + b"\x00" * ancho + b"\xff\xff")     # objeto 0: libre
+    for num in range(1, num_xref + 1):
+        tipo, campo2, campo3 = entradas[num]
+        filas += bytes([tipo]) + campo2.to_bytes(ancho, "big") + campo3.to_bytes(2, "big")
+
+    xref = generic.DecodedStreamObject()
+    xref[generic.NameObject("/Type")] = generic.NameObject("/XRef")
+    xref[generic.NameObject("/Size")] = generic.NumberObject(num_xref + 1)
+    for ref, clave in zip(raices, ("/Root", "/Info")):
+        if isinstance(ref, generic.IndirectObject):
+            xref[generic.NameObject(clave)] = generic.IndirectObject(renum(ref.idnum), 0, None)
+    if "/ID" in trailer:
+        xref[generic.NameObject("/ID")] = trailer.raw_get("/ID").get_object()
+    xref[generic.NameObject("/W")] = generic.ArrayObject(
+        [generic.NumberObject(1), generic.NumberObject(ancho), generic.NumberObject(2)])
+    xref[generic.NameObject("/Filter")] = generic.NameObject("/FlateDecode")
+    xref._data = zlib.compress(bytes(filas), 9)
+    out.write(b"%d 0 obj\n" % num_xref + serializar(xref) + b"\nendobj\n")
+    out.write(b"startxref\n%d\n%%%%EOF\n" % xref_pos)
+    return out.getvalue()
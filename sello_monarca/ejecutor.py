@@ -0,0 +1,210 @@
+# sello_monarca/ejecutor.py
+"""
+Ejecutor de sellado fuera del hilo de la petición.
+
+sell() es trabajo de CPU (PyPDF2, ReportLab, QR, ECDSA) y retiene el GIL;
+con varios sellados simultáneos el proceso de Flask deja de atender /health
+y /v. Aquí se despacha a un pool de procesos:
+
+  - Cada worker carga la llave privada una sola vez (initializer) y deja
+    lista la plantilla de la portada.
+  - Entre procesos sólo viajan bytes, el dict de metadatos del usuario y
+    la URL base; la llave nunca se serializa por petición.
+  - Con max_memoria_mb cada worker corre con RLIMIT_DATA (ver memoria.py);
+    un documento que no cabe falla con MemoryError sin tirar el servidor.
+  - Con metricas_dir cada worker registra sus etapas (ver metricas.py) en
+    el mismo directorio que los procesos web.
+  - perfil es el perfil de salida de sello.PERFILES; con "compacto" la
+    compactación del original también corre en el pool.
+  - La cola está acotada: si ya hay `workers + cola_max` sellados en curso
+    o esperando, sellar() lanza ColaLlena y la ruta responde 503.
+
+Con workers=0 se sella en el mismo proceso (comportamiento anterior), pero
+se respeta el mismo límite de concurrencia. En ese modo no hay límite de
+memoria ni pico de RSS por sellado: el proceso web atiende varias
+peticiones a la vez, así que reiniciar VmHWM o fijar RLIMIT_DATA afectaría
+a todas.
+"""
+from __future__ import annotations
+import multiprocessing, threading
+from itertools import repeat
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+from sello_monarca.llaves import cargar_llave_privada_desde_env
+from sello_monarca import memoria, metricas
+from sello_monarca.sello import (PERFILES, sell, sellar_en, firmar_lote, incrustar, campos_contenido,
+                                 cuerpo_segun_perfil)
+
+# Estado de cada proceso worker
+_LLAVE_WORKER = None
+
+
+class ColaLlena(Exception):
+    """No hay lugar en la cola de sellado; el cliente debe reintentar."""
+
+
+def _inicializar_worker(llave_pem: str, password: Optional[bytes], max_memoria_mb: int = 0,
+                        metricas_dir: Optional[str] = None, metricas_intervalo: float = 10.0) -> None:
+    global _LLAVE_WORKER
+    if metricas_dir:
+        metricas.activar(metricas_dir, metricas_intervalo)
+    _LLAVE_WORKER = cargar_llave_privada_desde_env(llave_pem, password=password)
+    from sello_monarca.qr_handler import _plantilla
+    _plantilla()
+    memoria.limitar_memoria(max_memoria_mb)
+
+
+def _sellar_en_worker(pdf_original: bytes, user_meta: Dict[str, Any],
+                      base_url: str, perfil: str) -> Tuple[bytes, str]:
+    return sell(pdf_original, user_meta, _LLAVE_WORKER, base_url=base_url, perfil=perfil)
+
+
+def _sellar_archivo(ruta_entrada: str, ruta_salida: str, user_meta: Dict[str, Any],
+                    base_url: str, llave, perfil: str,
+                    medir: bool = True) -> Tuple[str, str, Optional[int]]:
+    if medir:
+        memoria.reiniciar_pico()
+    with open(ruta_salida, "wb") as salida:
+        doc_id, sha_archivo = sellar_en(ruta_entrada, salida, user_meta, llave, base_url, perfil)
+    return doc_id, sha_archivo, memoria.pico_rss_kb() if medir else None
+
+
+def _sellar_archivo_en_worker(ruta_entrada: str, ruta_salida: str, user_meta: Dict[str, Any],
+                              base_url: str, perfil: str) -> Tuple[str, str, Optional[int]]:
+    return _sellar_archivo(ruta_entrada, ruta_salida, user_meta, base_url, _LLAVE_WORKER, perfil)
+
+
+def _firmar_lote_en_worker(user_metas: List[Dict[str, Any]], base_url: str,
+                           contenidos: List[Optional[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    return firmar_lote(user_metas, _LLAVE_WORKER, base_url, contenidos)
+
+
+class EjecutorSellado:
+    """Pool de procesos para sell() con cola acotada."""
+
+    def __init__(self, llave_pem: str, password: Optional[bytes] = None,
+                 workers: int = 0, cola_max: int = 16, espera: float = 0.0,
+                 llave=None, max_memoria_mb: int = 0, metricas_dir: Optional[str] = None,
+                 metricas_intervalo: float = 10.0, perfil: str = "incremental"):
+        if workers < 0 or cola_max < 0:
+            raise ValueError("workers y cola_max no pueden ser negativos")
+        if perfil not in PERFILES:
+            raise ValueError(f"perfil desconocido: {perfil!r}")
+        self.llave_pem = llave_pem
+        self.password = password
+        self.workers = workers
+        self.cola_max = cola_max
+        self.espera = espera
+        self.max_memoria_mb = max_memoria_mb
+        self.metricas_dir = metricas_dir
+        self.metricas_intervalo = metricas_intervalo
+        self.perfil = perfil
+        self._cupos = threading.BoundedSemaphore(max(workers, 1) + cola_max)
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._llave_local = llave
+
+    def _obtener_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: el proceso de Flask tiene hilos, hacer fork no es seguro.
+                # Se crea en la primera petición y no al importar app.py, porque
+                # los hijos de spawn re-importan el módulo principal.
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_inicializar_worker,
+                    initargs=(self.llave_pem, self.password, self.max_memoria_mb,
+                              self.metricas_dir, self.metricas_intervalo),
+                )
+            return self._pool
+
+    @contextmanager
+    def _cupo(self):
+        if self.espera:
+            adquirido = self._cupos.acquire(timeout=self.espera)
+        else:
+            adquirido = self._cupos.acquire(blocking=False)
+        if not adquirido:
+            raise ColaLlena("Cola de sellado llena")
+        try:
+            yield
+        finally:
+            self._cupos.release()
+
+    @contextmanager
+    def _usar_pool(self):
+        pool = self._obtener_pool()
+        try:
+            yield pool
+        except BrokenProcessPool:
+            # Un worker murió (p. ej. OOM): se descarta el pool para recrearlo
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    def _llave(self):
+        if self._llave_local is None:
+            self._llave_local = cargar_llave_privada_desde_env(self.llave_pem, password=self.password)
+        return self._llave_local
+
+    def sellar(self, pdf_original: bytes, user_meta: Dict[str, Any],
+               base_url: str) -> Tuple[bytes, str]:
+        """Equivalente a sell(); lanza ColaLlena si la cola está saturada."""
+        with self._cupo():
+            if not self.workers:
+                return sell(pdf_original, user_meta, self._llave(), base_url=base_url, perfil=self.perfil)
+            with self._usar_pool() as pool:
+                return pool.submit(_sellar_en_worker, bytes(pdf_original),
+                                   dict(user_meta), base_url, self.perfil).result()
+
+    def sellar_archivo(self, ruta_entrada: str, ruta_salida: str,
+                       user_meta: Dict[str, Any], base_url: str) -> Tuple[str, str, Optional[int]]:
+        """
+        Sella el PDF de `ruta_entrada` escribiendo directo en `ruta_salida`.
+        Sólo viajan rutas entre procesos; el worker mapea la entrada con mmap.
+        Devuelve (doc_id, SHA-256 del archivo escrito, pico de RSS en KiB
+        del worker que selló, o None con workers=0).
+        """
+        with self._cupo():
+            if not self.workers:
+                return _sellar_archivo(ruta_entrada, ruta_salida, user_meta, base_url,
+                                       self._llave(), self.perfil, medir=False)
+            with self._usar_pool() as pool:
+                return pool.submit(_sellar_archivo_en_worker, ruta_entrada, ruta_salida,
+                                   dict(user_meta), base_url, self.perfil).result()
+
+    def sellar_lote(self, documentos: List[Tuple[bytes, Dict[str, Any]]],
+                    base_url: str) -> List[Tuple[bytes, str]]:
+        """
+        Equivalente a sell_batch(): el hash del contenido y la portada de
+        cada documento se reparten entre el pool y la única firma (raíz de
+        Merkle) se hace en un worker. El lote ocupa un solo lugar de la cola.
+        """
+        user_metas = [dict(m) for _, m in documentos]
+        with self._cupo():
+            if not self.workers:
+                documentos = [(cuerpo_segun_perfil(pdf, self.perfil), m) for pdf, m in documentos]
+                contenidos = [campos_contenido(pdf) for pdf, _ in documentos]
+                metas = firmar_lote(user_metas, self._llave(), base_url, contenidos)
+                return [(incrustar(pdf, meta), meta["id"])
+                        for (pdf, _), meta in zip(documentos, metas)]
+            with self._usar_pool() as pool:
+                pdfs = [bytes(pdf) for pdf, _ in documentos]
+                if self.perfil != "incremental":
+                    pdfs = list(pool.map(cuerpo_segun_perfil, pdfs, repeat(self.perfil)))
+                contenidos = list(pool.map(campos_contenido, pdfs))
+                metas = pool.submit(_firmar_lote_en_worker, user_metas, base_url, contenidos).result()
+                sellados = pool.map(incrustar, pdfs, metas)
+                return [(pdf, meta["id"]) for pdf, meta in zip(sellados, metas)]
+
+    def cerrar(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
@@ -0,0 +1,187 @@
+# sello_monarca/idempotencia.py
+"""
+Sellado idempotente para /sign y /sign-json.
+
+Power Automate reintenta la petición si no recibe respuesta a tiempo; sin
+esto cada reintento sellaba otra vez el mismo PDF y dejaba un doc_id
+huérfano. Cada petición se identifica con una clave (la cabecera
+Idempotency-Key o, si no viene, la huella del PDF original + metadatos) y
+el resultado se guarda en SQLite durante `ventana` segundos:
+
+- clave nueva: quien la reclama sella y llama a completar(), o a liberar()
+  si falla, para que el siguiente intento vuelva a sellar.
+- clave terminada: se devuelve el resultado guardado sin sellar.
+- clave en curso: se espera a que termine el sellado en vuelo. Un evento
+  despierta a quienes esperan en este proceso; los de otros workers de
+  gunicorn consultan la base cada `sondeo` segundos. Una reserva sin
+  terminar más antigua que `concesion` (worker caído) se puede reclamar.
+- misma Idempotency-Key con otro contenido: ClaveReutilizada (422).
+- resultado que ya no sirve (trabajo asíncrono en error): olvidar() y se
+  vuelve a reclamar.
+"""
+from __future__ import annotations
+import hashlib, json, os, sqlite3, threading, time
+from typing import Any, Dict, Optional
+
+EN_CURSO, LISTO = "en_curso", "listo"
+
+_PURGA_CADA = 500           # reservas entre purgas de claves vencidas
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS idempotencia (
+    clave       TEXT PRIMARY KEY,
+    huella      TEXT NOT NULL,
+    estado      TEXT NOT NULL,
+    creado      REAL NOT NULL,
+    actualizado REAL NOT NULL,
+    resultado   TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_idempotencia_creado ON idempotencia (creado);
+"""
+
+
+class ClaveReutilizada(ValueError):
+    """La Idempotency-Key ya se usó con otro documento o metadatos."""
+
+
+class EnCurso(Exception):
+    """El sellado de la misma clave sigue en curso tras esperar `espera` segundos."""
+
+
+def huella_peticion(ruta_pdf: str, user_meta: Dict[str, Any]) -> str:
+    """sha256 de los bytes del PDF original seguidos de los metadatos en JSON canónico."""
+    h = hashlib.sha256()
+    with open(ruta_pdf, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    h.update(b"\0" + json.dumps(user_meta, sort_keys=True, separators=(",", ":")).encode())
+    return h.hexdigest()
+
+
+class RegistroIdempotencia:
+    def __init__(self, ruta_db: str, ventana: float = 24 * 3600, concesion: float = 600.0,
+                 espera: float = 120.0, sondeo: float = 0.25):
+        self.ruta_db = ruta_db
+        self.ventana = ventana
+        self.concesion = concesion
+        self.espera = espera
+        self.sondeo = sondeo
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._eventos: Dict[str, threading.Event] = {}
+        self._reservas = 0
+        os.makedirs(os.path.dirname(os.path.abspath(ruta_db)), exist_ok=True)
+        self._conexion().executescript(_ESQUEMA)
+
+    def _conexion(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            # isolation_level=None: las transacciones se abren a mano
+            con = sqlite3.connect(self.ruta_db, timeout=30, isolation_level=None)
+            con.row_factory = sqlite3.Row
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def _intentar(self, clave: str, huella: str):
+        """(LISTO, resultado), (EN_CURSO, None) o (None, None) si la clave quedó reservada."""
+        con = self._conexion()
+        ahora = time.time()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            fila = con.execute(
+                "SELECT huella, estado, creado, actualizado, resultado FROM idempotencia WHERE clave = ?",
+                (clave,),
+            ).fetchone()
+            if fila is not None and fila["creado"] >= ahora - self.ventana:
+                if fila["huella"] != huella:
+                    raise ClaveReutilizada(clave)
+                if fila["estado"] == LISTO:
+                    con.execute("COMMIT")
+                    return LISTO, json.loads(fila["resultado"])
+                if fila["actualizado"] >= ahora - self.concesion:
+                    con.execute("COMMIT")
+                    return EN_CURSO, None
+            # Clave nueva, vencida o con la reserva abandonada
+            con.execute(
+                "INSERT OR REPLACE INTO idempotencia (clave, huella, estado, creado, actualizado) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (clave, huella, EN_CURSO, ahora, ahora),
+            )
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._reservas += 1
+            purgar = self._reservas % _PURGA_CADA == 0
+        if purgar:
+            self.purgar()
+        return None, None
+
+    def _avisar(self, clave: str) -> None:
+        with self._lock:
+            evento = self._eventos.pop(clave, None)
+        if evento is not None:
+            evento.set()
+
+    # -------- API --------
+    def reclamar(self, clave: str, huella: str) -> Optional[Dict[str, Any]]:
+        """
+        None si la clave queda reservada para quien llama (debe terminar con
+        completar() o liberar()); el resultado guardado si ya se selló.
+        Espera a un sellado en vuelo hasta `espera` segundos (luego EnCurso).
+        """
+        limite = time.monotonic() + self.espera
+        while True:
+            # El evento se crea antes de consultar: un completar() entre la
+            # consulta y el wait() no se pierde
+            with self._lock:
+                evento = self._eventos.setdefault(clave, threading.Event())
+            estado, resultado = self._intentar(clave, huella)
+            if estado is None:
+                return None
+            if estado == LISTO:
+                self._avisar(clave)
+                return resultado
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                raise EnCurso(clave)
+            evento.wait(min(restante, self.sondeo))
+
+    def completar(self, clave: str, resultado: Dict[str, Any]) -> None:
+        """Guarda el resultado (serializable a JSON) y despierta a quienes esperan."""
+        self._conexion().execute(
+            "UPDATE idempotencia SET estado = ?, actualizado = ?, resultado = ? WHERE clave = ?",
+            (LISTO, time.time(), json.dumps(resultado), clave),
+        )
+        self._avisar(clave)
+
+    def liberar(self, clave: str) -> None:
+        """Suelta la reserva tras un fallo: el siguiente intento vuelve a sellar."""
+        self._conexion().execute(
+            "DELETE FROM idempotencia WHERE clave = ? AND estado = ?", (clave, EN_CURSO)
+        )
+        self._avisar(clave)
+
+    def olvidar(self, clave: str, resultado: Dict[str, Any]) -> None:
+        """
+        Descarta el resultado guardado (p. ej. el trabajo asíncrono que
+        devolvía terminó en error) para que el siguiente reclamar() vuelva
+        a sellar. Sólo borra si sigue siendo `resultado`: otro reintento
+        pudo haberlo reemplazado ya.
+        """
+        self._conexion().execute(
+            "DELETE FROM idempotencia WHERE clave = ? AND estado = ? AND resultado = ?",
+            (clave, LISTO, json.dumps(resultado)),
+        )
+
+    def purgar(self) -> int:
+        """Borra las claves más antiguas que `ventana` (y reservas abandonadas)."""
+        ahora = time.time()
+        cur = self._conexion().execute(
+            "DELETE FROM idempotencia WHERE creado < ? AND (estado = ? OR actualizado < ?)",
+            (ahora - self.ventana, LISTO, ahora - self.concesion),
+        )
+        return cur.rowcount
@@ -0,0 +1,328 @@
+# sello_monarca/incremental.py
+"""
+Actualización incremental de PDFs (ISO 32000-1, §7.5.6).
+
+En lugar de re-escribir el documento completo, se agregan al final de los
+bytes originales solamente los objetos nuevos o modificados, junto con una
+nueva tabla de referencias cruzadas cuyo /Prev apunta a la anterior.
+El costo de sellar depende así del tamaño de la sección anexada y no del
+tamaño del PDF original.
+"""
+from __future__ import annotations
+from io import BytesIO
+import codecs, mmap, re, zlib
+from typing import Dict, List, Optional, Tuple
+
+from PyPDF2 import PdfReader, generic
+from PyPDF2.generic import encode_pdfdocencoding
+
+_RE_STARTXREF = re.compile(rb"startxref\s+(\d+)")
+_RE_CABECERA_OBJ = re.compile(rb"\s*\d+\s+\d+\s+obj")
+
+
+def buscar_startxref(data) -> int:
+    """Devuelve el offset del último 'startxref' (se busca sólo en la cola)."""
+    cola = bytes(data[-2048:])
+    encontrados = _RE_STARTXREF.findall(cola)
+    if not encontrados:
+        raise ValueError("No se encontró 'startxref' en el PDF")
+    return int(encontrados[-1])
+
+
+# ------------------------------------------------------------------
+# Serialización de objetos PyPDF2
+# ------------------------------------------------------------------
+class RefFija(generic.IndirectObject):
+    """Referencia a un objeto del documento destino: nunca se renumera."""
+
+    def __init__(self, idnum: int, generation: int = 0) -> None:
+        super().__init__(idnum, generation, None)
+
+
+def serializar(obj, renum=None) -> bytes:
+    """
+    Serializa un objeto de PyPDF2 a bytes PDF.
+    - renum: función opcional idnum -> idnum nuevo para las referencias
+      indirectas (se usa al importar objetos de otro documento).
+    """
+    out = BytesIO()
+    _escribir(obj, out, renum)
+    return out.getvalue()
+
+
+def _escribir(obj, out, renum) -> None:
+    if isinstance(obj, generic.IndirectObject):
+        if renum is None or isinstance(obj, RefFija):
+            out.write(b"%d %d R" % (obj.idnum, obj.generation))
+        else:
+            out.write(b"%d 0 R" % renum(obj.idnum))
+    elif isinstance(obj, generic.StreamObject):
+        data = obj._data or b""
+        if isinstance(data, str):
+            data = data.encode("latin-1")
+        out.write(b"<<")
+        for k, v in dict.items(obj):
+            if k == "/Length":
+                continue
+            k.write_to_stream(out, None)
+            out.write(b" ")
+            _escribir(v, out, renum)
+        out.write(b"/Length %d>>\nstream\n" % len(data))
+        out.write(data)
+        out.write(b"\nendstream")
+    elif isinstance(obj, generic.DictionaryObject):
+        out.write(b"<<")
+        for k, v in dict.items(obj):
+            k.write_to_stream(out, None)
+            out.write(b" ")
+            _escribir(v, out, renum)
+        out.write(b">>")
+    elif isinstance(obj, generic.ArrayObject):
+        out.write(b"[")
+        for i, v in enumerate(list.__iter__(obj)):
+            if i:
+                out.write(b" ")
+            _escribir(v, out, renum)
+        out.write(b"]")
+    elif isinstance(obj, generic.TextStringObject):
+        # PyPDF2 escapa en octal todo lo no alfanumérico (x3 en el JSON del sello)
+        try:
+            crudo = encode_pdfdocencoding(obj)
+        except UnicodeEncodeError:
+            crudo = codecs.BOM_UTF16_BE + obj.encode("utf-16be")
+        out.write(b"(")
+        out.write(crudo.replace(b"\\", b"\\\\").replace(b"(", b"\\(")
+                  .replace(b")", b"\\)").replace(b"\r", b"\\r"))
+        out.write(b")")
+    else:
+        obj.write_to_stream(out, None)
+
+
+# ------------------------------------------------------------------
+# Sección incremental
+# ------------------------------------------------------------------
+class ActualizacionIncremental:
+    """
+    Acumula objetos nuevos/redefinidos sobre un PDF existente y genera la
+    sección incremental (objetos + xref + trailer) que se anexa al final.
+    """
+
+    def __init__(self, pdf_original, reader: Optional[PdfReader] = None):
+        self.original = pdf_original
+        # Un mmap se lee directo; BytesIO sobre bytes tampoco copia
+        self.reader = reader or PdfReader(
+            pdf_original if isinstance(pdf_original, mmap.mmap) else BytesIO(pdf_original)
+        )
+        trailer = self.reader.trailer
+        if "/Encrypt" in trailer:
+            raise ValueError("PDF cifrado: no se admite actualización incremental")
+
+        self.prev = buscar_startxref(pdf_original)
+        cabecera = bytes(pdf_original[self.prev:self.prev + 32])
+        if cabecera.startswith(b"xref"):
+            self.xref_stream = False
+        elif _RE_CABECERA_OBJ.match(cabecera):
+            self.xref_stream = True
+        else:
+            raise ValueError("startxref no apunta a una tabla de referencias válida")
+
+        # Con xref streams PyPDF2 no copia /Size al trailer: se deduce de la xref
+        conocidos = [n for tabla in self.reader.xref.values() for n in tabla]
+        conocidos += list(self.reader.xref_objStm)
+        self.siguiente = max(int(trailer.get("/Size", 0)), max(conocidos, default=0) + 1)
+        self.trailer_extra: Dict[str, object] = {}
+        self._objetos: Dict[int, Tuple[int, bytes]] = {}
+
+    # -------- objetos --------
+    def reservar(self) -> int:
+        """Reserva un número de objeto nuevo."""
+        num = self.siguiente
+        self.siguiente += 1
+        return num
+
+    def agregar(self, num: int, obj, generacion: int = 0, renum=None) -> None:
+        """Define (o redefine) el objeto `num` con el contenido de `obj`."""
+        cuerpo = obj if isinstance(obj, bytes) else serializar(obj, renum)
+        self._objetos[num] = (generacion, cuerpo)
+
+    def importar(self, raiz: generic.IndirectObject, reemplazos: Optional[dict] = None) -> int:
+        """
+        Copia el grafo de objetos alcanzable desde `raiz` (perteneciente a
+        otro PdfReader) asignándole números nuevos. Devuelve el número de
+        `raiz` en este documento.
+        - reemplazos: {idnum_origen: PdfObject} para sustituir objetos
+          concretos antes de copiarlos.
+        """
+        reemplazos = reemplazos or {}
+        mapa: Dict[int, int] = {}
+        pendientes: List[int] = []
+
+        def renum(idnum: int) -> int:
+            if idnum not in mapa:
+                mapa[idnum] = self.reservar()
+                pendientes.append(idnum)
+            return mapa[idnum]
+
+        origen = raiz.pdf
+        nuevo = renum(raiz.idnum)
+        while pendientes:
+            idnum = pendientes.pop()
+            obj = reemplazos.get(idnum)
+            if obj is None:
+                obj = origen.get_object(idnum)
+            self.agregar(mapa[idnum], obj, renum=renum)
+        return nuevo
+
+    def agregar_pagina(self, pagina_ref: generic.IndirectObject) -> int:
+        """
+        Importa una página de otro documento y la agrega al final del nodo
+        raíz del árbol de páginas (sólo se redefine ese nodo).
+        """
+        catalogo = self.reader.trailer["/Root"]
+        pages_ref = catalogo.raw_get("/Pages")
+        pages = pages_ref.get_object()
+
+        pagina = generic.DictionaryObject(
+            (k, v) for k, v in dict.items(pagina_ref.get_object()) if k != "/Parent"
+        )
+        # Evita heredar atributos del nodo raíz que cambiarían la página
+        for clave, defecto in (("/Rotate", generic.NumberObject(0)),
+                               ("/CropBox", pagina.get("/MediaBox"))):
+            if clave in pages and clave not in pagina and defecto is not None:
+                pagina[generic.NameObject(clave)] = defecto
+        pagina[generic.NameObject("/Parent")] = RefFija(pages_ref.idnum, pages_ref.generation)
+        num = self.importar(pagina_ref, {pagina_ref.idnum: pagina})
+
+        kids = generic.ArrayObject(list.__iter__(pages["/Kids"]))
+        kids.append(RefFija(num))
+        pages_nuevo = generic.DictionaryObject(dict.items(pages))
+        pages_nuevo[generic.NameObject("/Kids")] = kids
+        pages_nuevo[generic.NameObject("/Count")] = generic.NumberObject(int(pages["/Count"]) + 1)
+        self.agregar(pages_ref.idnum, pages_nuevo, generacion=pages_ref.generation)
+        return num
+
+    def actualizar_info(self, extra: Dict[str, str]) -> int:
+        """Escribe un diccionario /Info nuevo = Info original + `extra`."""
+        info = generic.DictionaryObject()
+        anterior = self.reader.trailer.raw_get("/Info") if "/Info" in self.reader.trailer else None
+        if anterior is not None:
+            info.update(dict.items(anterior.get_object()))
+        for k, v in extra.items():
+            info[generic.NameObject(k)] = generic.create_string_object(str(v))
+        num = self.reservar()
+        self.agregar(num, info)
+        self.trailer_extra["/Info"] = RefFija(num)
+        return num
+
+    # -------- salida --------
+    def _trailer(self) -> generic.DictionaryObject:
+        t = self.reader.trailer
+        trailer = generic.DictionaryObject()
+        trailer[generic.NameObject("/Size")] = generic.NumberObject(self.siguiente)
+        trailer[generic.NameObject("/Root")] = t.raw_get("/Root")
+        if "/Info" in t:
+            trailer[generic.NameObject("/Info")] = t.raw_get("/Info")
+        if "/ID" in t:
+            trailer[generic.NameObject("/ID")] = t.raw_get("/ID")
+        for k, v in self.trailer_extra.items():
+            trailer[generic.NameObject(k)] = v
+        trailer[generic.NameObject("/Prev")] = generic.NumberObject(self.prev)
+        return trailer
+
+    def serializar(self) -> bytes:
+        """Devuelve la sección incremental lista para anexarse al original."""
+        base = len(self.original)
+        out = BytesIO()
+        if bytes(self.original[-1:]) not in (b"\n", b"\r"):
+            out.write(b"\n")
+
+        offsets: Dict[int, Tuple[int, int]] = {}
+        for num in sorted(self._objetos):
+            generacion, cuerpo = self._objetos[num]
+            offsets[num] = (base + out.tell(), generacion)
+            out.write(b"%d %d obj\n" % (num, generacion))
+            out.write(cuerpo)
+            out.write(b"\nendobj\n")
+
+        if self.xref_stream:
+            self._xref_stream(out, base, offsets)
+        else:
+            self._xref_tabla(out, base, offsets)
+        return out.getvalue()
+
+    @staticmethod
+    def _subsecciones(nums: List[int]) -> List[List[int]]:
+        grupos: List[List[int]] = []
+        for n in sorted(nums):
+            if grupos and n == grupos[-1][-1] + 1:
+                grupos[-1].append(n)
+            else:
+                grupos.append([n])
+        return grupos
+
+    def _xref_tabla(self, out, base, offsets) -> None:
+        xref_pos = base + out.tell()
+        # La entrada 0 (cabeza de la lista libre) evita que algunos lectores
+        # "corrijan" subsecciones que no empiezan en 0
+        out.write(b"xref\n0 1\n0000000000 65535 f \n")
+        for grupo in self._subsecciones(list(offsets)):
+            out.write(b"%d %d\n" % (grupo[0], len(grupo)))
+            for n in grupo:
+                off, gen = offsets[n]
+                out.write(b"%010d %05d n \n" % (off, gen))
+        out.write(b"trailer\n")
+        out.write(serializar(self._trailer()))
+        out.write(b"\nstartxref\n%d\n%%%%EOF\n" % xref_pos)
+
+    def _xref_stream(self, out, base, offsets) -> None:
+        num_xref = self.reservar()
+        xref_pos = base + out.tell()
+        offsets = dict(offsets)
+        offsets[num_xref] = (xref_pos, 0)
+
+        ancho = max(1, (max(off for off, _ in offsets.values()).bit_length() + 7) // 8)
+        filas = bytearray()
+        indice = generic.ArrayObject()
+        for grupo in self._subsecciones(list(offsets)):
+            indice.extend([generic.NumberObject(grupo[0]), generic.NumberObject(len(grupo))])
+            for n in grupo:
+                off, gen = offsets[n]
+                filas += b"\x01" + off.to_bytes(ancho, "big") + gen.to_bytes(2, "big")
+
+        xref = generic.DecodedStreamObject()
+        xref.update(self._trailer())
+        xref[generic.NameObject("/Type")] = generic.NameObject("/XRef")
+        xref[generic.NameObject("/W")] = generic.ArrayObject(
+            [generic.NumberObject(1), generic.NumberObject(ancho), generic.NumberObject(2)]
+        )
+        xref[generic.NameObject("/Index")] = indice
+        xref[generic.NameObject("/Filter")] = generic.NameObject("/FlateDecode")
+        xref._data = zlib.compress(bytes(filas))
+
+        out.write(b"%d 0 obj\n" % num_xref)
+        out.write(serializar(xref))
+        out.write(b"\nendobj\nstartxref\n%d\n%%%%EOF\n" % xref_pos)
+
+
+def preparar_pagina(pdf_original, pagina_pdf: bytes) -> ActualizacionIncremental:
+    """
+    Actualización sobre `pdf_original` (bytes o mmap) con la primera página
+    de `pagina_pdf` ya agregada; falta actualizar_info() y serializar().
+    Lanza ValueError si el documento no admite actualización incremental.
+    """
+    act = ActualizacionIncremental(pdf_original)
+    lector_pagina = PdfReader(BytesIO(pagina_pdf))
+    act.agregar_pagina(lector_pagina.pages[0].indirect_reference)
+    return act
+
+
+def anexar_pagina_y_metadatos(pdf_original: bytes, pagina_pdf: bytes,
+                              info_extra: Dict[str, str]) -> bytes:
+    """
+    Agrega al PDF original, en una sola sección incremental, la primera
+    página de `pagina_pdf` y las entradas `info_extra` en /Info.
+    Lanza ValueError si el documento no admite actualización incremental.
+    """
+    act = preparar_pagina(pdf_original, pagina_pdf)
+    act.actualizar_info(info_extra)
+    return pdf_original + act.serializar()
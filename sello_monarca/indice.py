@@ -0,0 +1,202 @@
+# sello_monarca/indice.py
+"""
+Índice local (SQLite) de documentos sellados.
+
+Se escribe al sellar (/sign, /sign-json) y permite servir /v y /download
+sin abrir ni parsear el PDF. Para documentos sellados antes de existir el
+índice hay un comando de reconstrucción que recorre el almacén en paralelo:
+
+    python -m sello_monarca.indice --storage storage --db storage/indice.sqlite3
+"""
+from __future__ import annotations
+import argparse, json, os, sqlite3, threading, time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, Dict, Iterable, Optional
+
+from sello_monarca.almacen import Almacen, AlmacenLocal
+from sello_monarca.lector_rapido import abrir_pdf
+from sello_monarca.memoria import bloques
+from sello_monarca.utils import calcular_hash
+from sello_monarca.sello import leer_meta_json
+
+_BLOQUE_HASH = 1024 * 1024
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS documentos (
+    doc_id            TEXT PRIMARY KEY,
+    original_filename TEXT,
+    uploader          TEXT,
+    area              TEXT,
+    uploaded_at       TEXT,
+    signature         TEXT,
+    size              INTEGER,
+    sha256            TEXT,
+    meta_json         TEXT NOT NULL,
+    content_sha256    TEXT,
+    kid               TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_documentos_sha256 ON documentos (sha256);
+"""
+
+_COLUMNAS = ("doc_id", "original_filename", "uploader", "area", "uploaded_at",
+             "signature", "size", "sha256", "meta_json", "content_sha256", "kid")
+
+
+class IndiceDocumentos:
+    """Acceso al índice; una conexión por hilo, WAL para varios workers."""
+
+    def __init__(self, ruta_db: str):
+        self.ruta_db = ruta_db
+        self._local = threading.local()
+        directorio = os.path.dirname(os.path.abspath(ruta_db))
+        os.makedirs(directorio, exist_ok=True)
+        with self._conexion() as con:
+            con.executescript(_ESQUEMA)
+            # Bases creadas antes de existir content_sha256 / kid
+            columnas = {f["name"] for f in con.execute("PRAGMA table_info(documentos)")}
+            if "content_sha256" not in columnas:
+                con.execute("ALTER TABLE documentos ADD COLUMN content_sha256 TEXT")
+            if "kid" not in columnas:
+                con.execute("ALTER TABLE documentos ADD COLUMN kid TEXT")
+
+    def _conexion(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.ruta_db, timeout=30)
+            con.row_factory = sqlite3.Row
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def registrar(self, fila: Dict[str, Any]) -> None:
+        """Inserta o reemplaza una fila (ver fila_de_pdf)."""
+        self.registrar_varios([fila])
+
+    def registrar_varios(self, filas: Iterable[Dict[str, Any]]) -> int:
+        valores = [tuple(f.get(c) for c in _COLUMNAS) for f in filas]
+        if not valores:
+            return 0
+        with self._conexion() as con:
+            con.executemany(
+                f"INSERT OR REPLACE INTO documentos ({', '.join(_COLUMNAS)}) "
+                f"VALUES ({', '.join('?' * len(_COLUMNAS))})",
+                valores,
+            )
+        return len(valores)
+
+    def obtener(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        fila = self._conexion().execute(
+            "SELECT * FROM documentos WHERE doc_id = ?", (doc_id,)
+        ).fetchone()
+        return dict(fila) if fila else None
+
+    def buscar_sha256(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """Fila del documento cuyo PDF sellado tiene ese SHA-256 (hex), o None."""
+        fila = self._conexion().execute(
+            "SELECT * FROM documentos WHERE sha256 = ? LIMIT 1", (sha256.lower(),)
+        ).fetchone()
+        return dict(fila) if fila else None
+
+    def ids(self) -> set:
+        return {f[0] for f in self._conexion().execute("SELECT doc_id FROM documentos")}
+
+    def ids_sin_kid(self, kid: str) -> list:
+        """doc_ids cuyo sello no es de la llave `kid` (incluye los anteriores a los kid)."""
+        return [f[0] for f in self._conexion().execute(
+            "SELECT doc_id FROM documentos WHERE kid IS NULL OR kid != ? ORDER BY doc_id", (kid,))]
+
+
+def hash_archivo(fuente) -> str:
+    """SHA-256 hexadecimal de un PDF (bytes, ruta, mmap o archivo) por bloques."""
+    with abrir_pdf(fuente) as data:
+        return calcular_hash(bloques(data, _BLOQUE_HASH)).hex()
+
+
+def fila_de_pdf(fuente, size: Optional[int] = None, sha: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Construye la fila del índice a partir de un PDF sellado. Sólo se lee el
+    /Info (sello.leer_meta_json) y se calcula el hash si no se proporciona
+    (al sellar ya viene del sha calculado mientras se escribía el archivo).
+    """
+    meta_json = leer_meta_json(fuente)
+    meta = json.loads(meta_json)
+    if not meta:
+        raise ValueError("El PDF no tiene metadatos de sello")
+    if size is None:
+        with abrir_pdf(fuente) as data:
+            size = len(data)
+    return {
+        "doc_id": meta.get("id"),
+        "original_filename": meta.get("original_filename"),
+        "uploader": meta.get("uploader"),
+        "area": meta.get("area"),
+        "uploaded_at": meta.get("uploaded_at"),
+        "signature": meta.get("signature"),
+        "size": size,
+        "sha256": sha or hash_archivo(fuente),
+        "meta_json": meta_json,
+        "content_sha256": meta.get("content_sha256"),
+        "kid": meta.get("kid"),
+    }
+
+
+# ------------------------------------------------------------------
+# Reconstrucción
+# ------------------------------------------------------------------
+def fila_de_almacen(almacen: Almacen, doc_id: str) -> Dict[str, Any]:
+    """fila_de_pdf() de un documento del almacén (mmap si está completo en disco)."""
+    with almacen.abrir(doc_id) as f:
+        return fila_de_pdf(f)
+
+
+def _fila_de_documento(almacen: Almacen, doc_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        return fila_de_almacen(almacen, doc_id)
+    except Exception as e:          # PDF dañado o sin sello: se reporta y se sigue
+        print(f"omitido {doc_id}: {e}")
+        return None
+
+
+def reconstruir(indice: IndiceDocumentos, almacen: Almacen,
+                workers: Optional[int] = None, solo_faltantes: bool = True,
+                lote: int = 500) -> int:
+    """
+    Recorre los documentos del almacén en paralelo (procesos) y los registra
+    en el índice. Devuelve cuántas filas se escribieron.
+    """
+    doc_ids = list(almacen.ids())
+    if solo_faltantes:
+        conocidos = indice.ids()
+        doc_ids = [d for d in doc_ids if d not in conocidos]
+
+    escritas = 0
+    pendientes = []
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        for fila in ex.map(_fila_de_documento, repeat(almacen), doc_ids, chunksize=32):
+            if fila:
+                pendientes.append(fila)
+            if len(pendientes) >= lote:
+                escritas += indice.registrar_varios(pendientes)
+                pendientes = []
+    escritas += indice.registrar_varios(pendientes)
+    return escritas
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Reconstruye el índice de documentos sellados")
+    ap.add_argument("--storage", default="storage")
+    ap.add_argument("--db", default=None, help="por defecto <storage>/indice.sqlite3")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--todo", action="store_true", help="re-indexa también los ya registrados")
+    args = ap.parse_args(argv)
+
+    indice = IndiceDocumentos(args.db or os.path.join(args.storage, "indice.sqlite3"))
+    t0 = time.perf_counter()
+    n = reconstruir(indice, AlmacenLocal(args.storage), args.workers, solo_faltantes=not args.todo)
+    print(f"{n} documentos indexados en {time.perf_counter() - t0:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+# sello_monarca/lector_rapido.py
+"""
+Lectura rápida del diccionario /Info de un PDF.
+
+Sólo se lee la cola del archivo (startxref), la sección de referencias
+cruzadas (tabla clásica o xref stream) y el objeto /Info; nunca se recorre
+el árbol de páginas. El costo es prácticamente independiente del tamaño
+del documento.
+
+Acepta bytes, bytearray, memoryview, mmap, una ruta o un archivo binario
+abierto. Si algo no se puede resolver lanza ValueError (o un error de
+PyPDF2) para que quien llama use la lectura completa con PdfReader.
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from io import BytesIO
+import mmap, os, re, threading
+from typing import Dict, Iterator, Optional, Tuple
+
+from PyPDF2 import generic
+from PyPDF2.generic import read_object
+from PyPDF2._utils import read_non_whitespace
+
+from sello_monarca.incremental import buscar_startxref
+
+_RE_CABECERA = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj")
+_RE_SUBSECCION = re.compile(rb"\s*(\d+)\s+(\d+)[ \t]*\r?\n?")
+_VENTANA = 4096
+_MAX_SECCIONES = 64
+
+
+# _Resolutor que está leyendo en cada hilo (para los /Length indirectos)
+_hilo = threading.local()
+
+
+class _Estricto:
+    """
+    Sustituto de PdfReader: hace que PyPDF2 falle en lugar de devolver datos
+    parciales. PyPDF2 sólo le pide objetos para el /Length indirecto de un
+    stream, que resuelve el _Resolutor que está leyendo. Es uno solo para
+    todas las lecturas porque PyPDF2 lo compara al comparar referencias.
+    """
+    strict = True
+    xref: dict = {}
+
+    @staticmethod
+    def get_object(ref):
+        resolutor = getattr(_hilo, "resolutor", None)
+        if resolutor is None:
+            raise ValueError(f"No se puede resolver {ref!r} fuera de una xref")
+        return resolutor.longitud(ref)
+
+
+@contextmanager
+def abrir_pdf(fuente) -> Iterator:
+    """
+    Entrega un objeto indexable (bytes o mmap) sin copiar el archivo a memoria
+    cuando `fuente` es una ruta o un archivo con descriptor.
+    """
+    if isinstance(fuente, (bytes, bytearray, memoryview, mmap.mmap)):
+        yield fuente
+    elif isinstance(fuente, (str, os.PathLike)):
+        with open(fuente, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                yield m
+    else:
+        try:
+            fd = fuente.fileno()
+        except (AttributeError, OSError):
+            fd = None
+        if fd is not None:
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as m:
+                yield m
+        else:
+            pos = fuente.tell()
+            fuente.seek(0)
+            try:
+                yield fuente.read()
+            finally:
+                fuente.seek(pos)
+
+
+class _Prefijo:
+    """Los primeros `n` bytes de `data` (bytes o mmap) sin copiarlos."""
+
+    def __init__(self, data, n: int):
+        self.data, self.n = data, n
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __getitem__(self, rebanada: slice):
+        inicio, fin, _ = rebanada.indices(self.n)
+        return self.data[inicio:fin]
+
+
+class _Seccion:
+    """Una sección de referencias cruzadas (tabla clásica o xref stream)."""
+
+    def __init__(self, data, offset: int):
+        self.data = data
+        self.trailer: generic.DictionaryObject
+        self._subsecciones = []      # tabla: [(inicio, cuenta, pos_entradas)]
+        self._stream = None          # xref stream: (datos, W, Index)
+        self._hibrida: Optional[_Seccion] = None
+
+        if bytes(data[offset:offset + 4]) == b"xref":
+            self._leer_tabla(offset + 4)
+            if "/XRefStm" in self.trailer:
+                self._hibrida = _Seccion(data, int(self.trailer["/XRefStm"]))
+        else:
+            xref = _leer_objeto(data, offset)
+            if not isinstance(xref, generic.StreamObject) or xref.get("/Type") != "/XRef":
+                raise ValueError("startxref no apunta a una xref válida")
+            self.trailer = xref
+            tam = int(xref["/Size"])
+            indice = [int(v) for v in xref.get("/Index", [0, tam])]
+            self._stream = (xref.get_data(), [int(w) for w in xref["/W"]], indice)
+
+    def _leer_tabla(self, pos: int) -> None:
+        data = self.data
+        while True:
+            cab = bytes(data[pos:pos + 64])
+            if cab.lstrip().startswith(b"trailer"):
+                pos += cab.index(b"trailer") + len(b"trailer")
+                break
+            m = _RE_SUBSECCION.match(cab)
+            if not m:
+                raise ValueError("Tabla xref con formato inesperado")
+            inicio, cuenta = int(m.group(1)), int(m.group(2))
+            entradas = pos + m.end()
+            # Cada entrada mide exactamente 20 bytes (ISO 32000-1, §7.5.4)
+            fin = entradas + cuenta * 20
+            siguiente = bytes(data[fin:fin + 8]).lstrip()
+            if cuenta and not (siguiente[:1].isdigit() or siguiente.startswith(b"trailer")):
+                raise ValueError("Entradas xref de longitud no estándar")
+            self._subsecciones.append((inicio, cuenta, entradas))
+            pos = fin
+        trailer = _leer_objeto(data, pos, con_cabecera=False)
+        if not isinstance(trailer, generic.DictionaryObject):
+            raise ValueError("Trailer ilegible")
+        self.trailer = trailer
+
+    def entradas(self) -> Iterator[Tuple[int, str]]:
+        """(num, tipo) de cada objeto que define la sección: "n", "c" o "f"."""
+        for inicio, cuenta, entradas in self._subsecciones:
+            for i in range(cuenta):
+                pos = entradas + i * 20
+                linea = bytes(self.data[pos:pos + 20])
+                yield inicio + i, "n" if linea.split()[2:3] == [b"n"] else "f"
+        if self._stream is not None:
+            datos, anchos, indice = self._stream
+            fila_bytes = sum(anchos)
+            fila = 0
+            for i in range(0, len(indice), 2):
+                for num in range(indice[i], indice[i] + indice[i + 1]):
+                    pos = fila * fila_bytes
+                    tipo = int.from_bytes(datos[pos:pos + anchos[0]], "big") if anchos[0] else 1
+                    yield num, {1: "n", 2: "c"}.get(tipo, "f")
+                    fila += 1
+        if self._hibrida is not None:
+            yield from self._hibrida.entradas()
+
+    def buscar(self, num: int) -> Optional[Tuple]:
+        """
+        Devuelve ("n", offset, gen), ("c", num_objstm, indice), ("f",) o None
+        si la sección no define el objeto.
+        """
+        for inicio, cuenta, entradas in self._subsecciones:
+            if inicio <= num < inicio + cuenta:
+                pos = entradas + (num - inicio) * 20
+                linea = bytes(self.data[pos:pos + 20])
+                offset, gen, tipo = linea.split()[:3]
+                return ("n", int(offset), int(gen)) if tipo == b"n" else ("f",)
+        if self._stream is not None:
+            datos, anchos, indice = self._stream
+            fila_bytes = sum(anchos)
+            fila = 0
+            for i in range(0, len(indice), 2):
+                inicio, cuenta = indice[i], indice[i + 1]
+                if inicio <= num < inicio + cuenta:
+                    fila += num - inicio
+                    crudo = datos[fila * fila_bytes:(fila + 1) * fila_bytes]
+                    campos, p = [], 0
+                    for w in anchos:
+                        campos.append(int.from_bytes(crudo[p:p + w], "big") if w else None)
+                        p += w
+                    tipo = 1 if campos[0] is None else campos[0]
+                    if tipo == 1:
+                        return ("n", campos[1], campos[2] or 0)
+                    if tipo == 2:
+                        return ("c", campos[1], campos[2])
+                    return ("f",)
+                fila += cuenta
+        if self._hibrida is not None:
+            return self._hibrida.buscar(num)
+        return None
+
+
+def _leer_objeto(data, pos: int, con_cabecera: bool = True):
+    """Parsea un objeto a partir de `pos` usando una ventana creciente."""
+    inicio = 0
+    if con_cabecera:
+        m = _RE_CABECERA.match(bytes(data[pos:pos + 64]))
+        if not m:
+            raise ValueError(f"No hay un objeto en el offset {pos}")
+        inicio = m.end()
+
+    ventana = _VENTANA
+    total = len(data)
+    while True:
+        trozo = bytes(data[pos:pos + ventana])
+        completo = pos + ventana >= total
+        if completo or not con_cabecera or b"endobj" in trozo:
+            try:
+                stream = BytesIO(trozo)
+                stream.seek(inicio)
+                read_non_whitespace(stream)
+                stream.seek(-1, 1)
+                return read_object(stream, _Estricto)
+            except Exception:
+                if completo:
+                    raise
+        ventana *= 4
+
+
+class _Resolutor:
+    """Resuelve números de objeto recorriendo las secciones de la más nueva a la más vieja."""
+
+    def __init__(self, data):
+        self.data = data
+        self.secciones = []
+        self._siguiente: Optional[int] = buscar_startxref(data)
+        self._visitadas = set()
+        self._resolviendo = set()
+
+    def _seccion(self, i: int) -> Optional[_Seccion]:
+        while len(self.secciones) <= i and self._siguiente is not None:
+            if self._siguiente in self._visitadas or len(self.secciones) >= _MAX_SECCIONES:
+                raise ValueError("Cadena /Prev cíclica o demasiado larga")
+            self._visitadas.add(self._siguiente)
+            seccion = _Seccion(self.data, self._siguiente)
+            self.secciones.append(seccion)
+            prev = seccion.trailer.get("/Prev")
+            self._siguiente = int(prev) if prev is not None else None
+        return self.secciones[i] if i < len(self.secciones) else None
+
+    def trailer(self, clave: str):
+        """Primer valor de `clave` en los trailers, del más nuevo al más viejo."""
+        i = 0
+        while (seccion := self._seccion(i)) is not None:
+            if clave in seccion.trailer:
+                return seccion.trailer.raw_get(clave)
+            i += 1
+        return None
+
+    def objeto(self, num: int):
+        i = 0
+        while (seccion := self._seccion(i)) is not None:
+            entrada = seccion.buscar(num)
+            if entrada is not None:
+                if entrada[0] == "n":
+                    with self._leyendo():
+                        return _leer_objeto(self.data, entrada[1])
+                if entrada[0] == "c":
+                    return self._objeto_comprimido(entrada[1], entrada[2])
+                return generic.NullObject()
+            i += 1
+        raise ValueError(f"Objeto {num} no encontrado en la xref")
+
+    def _objeto_comprimido(self, num_objstm: int, indice: int):
+        objstm = self.objeto(num_objstm)
+        datos = objstm.get_data()
+        n, primero = int(objstm["/N"]), int(objstm["/First"])
+        if indice >= n:
+            raise ValueError("Índice fuera del object stream")
+        pares = datos[:primero].split()
+        offset = int(pares[indice * 2 + 1])
+        stream = BytesIO(datos[primero + offset:])
+        with self._leyendo():
+            return read_object(stream, _Estricto)
+
+    @contextmanager
+    def _leyendo(self) -> Iterator[None]:
+        anterior = getattr(_hilo, "resolutor", None)
+        _hilo.resolutor = self
+        try:
+            yield
+        finally:
+            _hilo.resolutor = anterior
+
+    def longitud(self, ref) -> int:
+        """/Length indirecto de un stream (ver _Estricto)."""
+        if ref.idnum in self._resolviendo:
+            raise ValueError(f"Referencia circular al objeto {ref.idnum}")
+        self._resolviendo.add(ref.idnum)
+        try:
+            valor = self.objeto(ref.idnum)
+        finally:
+            self._resolviendo.discard(ref.idnum)
+        if not isinstance(valor, int):
+            raise ValueError(f"/Length {ref.idnum} no es un entero")
+        return valor
+
+    def resolver(self, obj):
+        if isinstance(obj, generic.IndirectObject):
+            return self.objeto(obj.idnum)
+        return obj
+
+
+def leer_info(fuente) -> Dict[str, object]:
+    """Devuelve el diccionario /Info (vacío si el documento no tiene)."""
+    with abrir_pdf(fuente) as data:
+        res = _Resolutor(data)
+        if res.trailer("/Encrypt") is not None:
+            raise ValueError("PDF cifrado: se requiere la lectura completa")
+        info_ref = res.trailer("/Info")
+        if info_ref is None:
+            return {}
+        info = res.resolver(info_ref)
+        if not isinstance(info, generic.DictionaryObject):
+            raise ValueError("/Info no es un diccionario")
+        return {k: res.resolver(v) for k, v in dict.items(info)}
+
+
+def leer_meta(fuente, clave: str) -> Optional[str]:
+    """Valor de texto de `clave` en /Info, o None si no existe."""
+    valor = leer_info(fuente).get(clave)
+    return None if valor is None else str(valor)
+
+
+def _solo_agrega(seccion: _Seccion, tam_anterior: int) -> bool:
+    """La sección sólo define objetos nuevos (número >= `tam_anterior`) y no libera ninguno."""
+    return all((num == 0 and tipo == "f") or (num >= tam_anterior and tipo != "f")
+               for num, tipo in seccion.entradas())
+
+
+def solo_anexa_pagina_e_info(fuente, longitud: int) -> bool:
+    """
+    Comprueba que lo que sigue a los primeros `longitud` bytes es una sola
+    sección incremental que:
+      - tiene /Prev hacia la xref del original y conserva /Root;
+      - sólo define objetos nuevos (número >= /Size del original), salvo
+        el nodo raíz de páginas, y no libera ninguno;
+      - en ese nodo sólo agrega una página al final de /Kids y suma 1 a /Count.
+    Es decir: el original queda intacto salvo una página más y un /Info nuevo.
+    Después puede haber secciones de re-firma (sello.refirmar_en) que sólo
+    agregan objetos nuevos (el /Info) y conservan /Root.
+    """
+    with abrir_pdf(fuente) as data:
+        if len(data) <= longitud:
+            return False
+        cuerpo = _Prefijo(data, longitud)
+        original = _Resolutor(cuerpo)
+        nuevo = _Resolutor(data)
+        raiz = original.trailer("/Root")
+        if nuevo.trailer("/Root") != raiz:
+            return False
+        prev_original = buscar_startxref(cuerpo)
+        i = 0
+        while True:
+            seccion, anterior = nuevo._seccion(i), nuevo._seccion(i + 1)
+            if seccion is None or anterior is None:
+                return False
+            prev = seccion.trailer.get("/Prev")
+            if prev is None:
+                return False
+            if int(prev) == prev_original:
+                break               # la sección del sello
+            if seccion.trailer.raw_get("/Root") != raiz or "/Encrypt" in seccion.trailer \
+                    or not _solo_agrega(seccion, int(anterior.trailer["/Size"])):
+                return False
+            i += 1
+
+        tam_original = int(original.trailer("/Size"))
+        pages_ref = original.resolver(raiz).raw_get("/Pages")
+        for num, tipo in seccion.entradas():
+            if num == 0 and tipo == "f":
+                continue
+            if num >= tam_original and tipo != "f":
+                continue
+            if num != pages_ref.idnum or tipo != "n":
+                return False
+
+        antes = original.objeto(pages_ref.idnum)
+        despues = nuevo.objeto(pages_ref.idnum)
+        kids_antes = list(list.__iter__(original.resolver(dict.get(antes, "/Kids"))))
+        kids_despues = list(list.__iter__(nuevo.resolver(dict.get(despues, "/Kids"))))
+        if kids_despues[:-1] != kids_antes or len(kids_despues) != len(kids_antes) + 1 \
+                or kids_despues[-1].idnum < tam_original:
+            return False
+        if int(nuevo.resolver(dict.get(despues, "/Count"))) != \
+                int(original.resolver(dict.get(antes, "/Count"))) + 1:
+            return False
+        otras = lambda d: {k: v for k, v in dict.items(d) if k not in ("/Kids", "/Count")}
+        return otras(antes) == otras(despues)
@@ -1,4 +1,6 @@
 # sello_monarca/llaves.py
+import glob, hashlib, os
+from functools import lru_cache
 
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric import ec
@@ -56,3 +58,63 @@ def cargar_llave_publica_desde_env(env_string: str):
     key_bytes = key_cleaned.encode("utf-8").decode("unicode_escape").encode("utf-8")
 
     return serialization.load_pem_public_key(key_bytes)
+
+
+@lru_cache(maxsize=64)
+def _kid_der(der: bytes) -> str:
+    return hashlib.sha256(der).hexdigest()[:16]
+
+
+def kid(llave) -> str:
+    """
+    Identificador de una llave (privada o pública): sha256 de la llave
+    pública en DER, 16 caracteres hex. Va firmado dentro de /CM_META.
+    """
+    publica = llave.public_key() if hasattr(llave, "private_numbers") else llave
+    return _kid_der(publica.public_bytes(serialization.Encoding.DER,
+                                         serialization.PublicFormat.SubjectPublicKeyInfo))
+
+
+class RegistroLlaves:
+    """
+    Llaves públicas por kid, para verificar sellos de llaves anteriores a
+    una rotación. Un sello con "kid" se verifica sólo con esa llave
+    (búsqueda en un dict); los anteriores a los kid, con cada llave.
+    """
+
+    def __init__(self, llaves=()):
+        self._por_kid = {}
+        for llave in llaves:
+            self.agregar(llave)
+
+    def agregar(self, llave) -> str:
+        k = kid(llave)
+        self._por_kid[k] = llave
+        return k
+
+    def cargar_directorio(self, directorio: str) -> int:
+        """Agrega cada *.pem de `directorio`; devuelve cuántas llaves leyó."""
+        rutas = sorted(glob.glob(os.path.join(directorio, "*.pem")))
+        for ruta in rutas:
+            self.agregar(cargar_llave_publica(ruta))
+        return len(rutas)
+
+    def obtener(self, k: str):
+        return self._por_kid.get(k)
+
+    def candidatas(self, meta) -> list:
+        """Llaves con que se puede verificar `meta` (vacía si su kid no se conoce)."""
+        k = meta.get("kid")
+        if k is None:
+            return list(self._por_kid.values())
+        llave = self._por_kid.get(k)
+        return [llave] if llave is not None else []
+
+    def kids(self) -> list:
+        return list(self._por_kid)
+
+    def __contains__(self, k: str) -> bool:
+        return k in self._por_kid
+
+    def __len__(self) -> int:
+        return len(self._por_kid)
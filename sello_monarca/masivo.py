@@ -0,0 +1,273 @@
+# sello_monarca/masivo.py
+"""
+Sellado masivo fuera de línea (migración del archivo histórico).
+
+Recorre un árbol de PDFs y sella cada uno con sellar_en() en un pool de
+procesos, sin pasar por HTTP:
+
+- Cada worker carga la llave privada una sola vez (initializer) y escribe
+  el sellado directo en el almacén (mmap de la entrada, sin copias).
+- El proceso principal registra las filas del índice y el progreso por
+  lotes (--lote documentos o --cada segundos) en una transacción cada uno.
+- Progreso en SQLite (<storage>/masivo.sqlite3 por defecto): al volver a
+  correr se omiten los archivos ya sellados, así una migración
+  interrumpida sigue donde se quedó. Los que fallaron se reintentan con
+  --reintentar-errores. Si el proceso muere a media tanda, los documentos
+  de esa tanda se vuelven a sellar y las copias anteriores quedan en el
+  almacén sin índice.
+- Cada --reporte segundos imprime documentos/s y MB/s.
+- --perfil compacto (o SELLO_PERFIL) sella la versión compacta de cada
+  original (ver compacto.py), igual que la app; los de más de
+  compacto.MAX_ENTRADA se sellan incrementales.
+
+    python -m sello_monarca.masivo legado/ --storage storage --llave privada.pem \\
+        --uploader migracion --area Archivo --workers 8
+
+Sin --llave se usa PRIVATE_KEY_PEM del entorno (como app.py); la
+contraseña de la llave se lee de SELLO_KEY_PASSWORD.
+"""
+from __future__ import annotations
+import argparse, json, os, sqlite3, sys, time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sello_monarca import memoria
+from sello_monarca.almacen import AlmacenLocal
+from sello_monarca.indice import IndiceDocumentos, fila_de_pdf
+from sello_monarca.llaves import cargar_llave_privada, cargar_llave_privada_desde_env
+from sello_monarca.sello import PERFILES, sellar_en
+
+LISTO, ERROR = "listo", "error"
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS progreso (
+    ruta    TEXT PRIMARY KEY,
+    estado  TEXT NOT NULL,
+    doc_id  TEXT,
+    bytes   INTEGER,
+    error   TEXT,
+    sellado REAL NOT NULL
+);
+"""
+
+# Estado de cada proceso worker
+_LLAVE = None
+_ALMACEN: Optional[AlmacenLocal] = None
+
+
+def _inicializar(ruta_llave: Optional[str], password: Optional[bytes], storage: str,
+                 sincronizar: bool, max_memoria_mb: int) -> None:
+    global _LLAVE, _ALMACEN
+    if ruta_llave:
+        _LLAVE = cargar_llave_privada(ruta_llave, password)
+    else:
+        _LLAVE = cargar_llave_privada_desde_env(os.getenv("PRIVATE_KEY_PEM"), password=password)
+    _ALMACEN = AlmacenLocal(storage, sincronizar=sincronizar)
+    memoria.limitar_memoria(max_memoria_mb)
+
+
+def _sellar_uno(ruta: str, relativa: str, user_meta: Dict[str, Any],
+                base_url: str, perfil: str = "incremental") -> Tuple[str, Optional[Dict[str, Any]], Optional[str], int]:
+    """(ruta relativa, fila del índice o None, error o None, bytes de entrada)."""
+    try:
+        tam_entrada = os.path.getsize(ruta)
+        with _ALMACEN.temporal() as ruta_tmp:
+            with open(ruta_tmp, "wb") as salida:
+                doc_id, sha_archivo = sellar_en(ruta, salida, user_meta, _LLAVE, base_url, perfil)
+            fila = fila_de_pdf(ruta_tmp, size=os.path.getsize(ruta_tmp), sha=sha_archivo)
+            meta = json.loads(fila["meta_json"])
+            _ALMACEN.guardar(doc_id, ruta_tmp, meta.get("content_sha256"), meta.get("content_length"))
+        return relativa, fila, None, tam_entrada
+    except Exception as e:          # PDF dañado, cifrado, sin memoria...: se registra y se sigue
+        return relativa, None, f"{e.__class__.__name__}: {e}", 0
+
+
+class Progreso:
+    """Archivos ya procesados de una migración (tabla `progreso`)."""
+
+    def __init__(self, ruta_db: str):
+        os.makedirs(os.path.dirname(os.path.abspath(ruta_db)), exist_ok=True)
+        self.con = sqlite3.connect(ruta_db, timeout=30)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.executescript(_ESQUEMA)
+
+    def hechos(self, incluir_errores: bool = True) -> set:
+        estados = (LISTO, ERROR) if incluir_errores else (LISTO,)
+        return {f[0] for f in self.con.execute(
+            f"SELECT ruta FROM progreso WHERE estado IN ({', '.join('?' * len(estados))})", estados)}
+
+    def registrar(self, filas: List[Tuple[str, str, Optional[str], int, Optional[str]]]) -> None:
+        """filas: (ruta, estado, doc_id, bytes, error)."""
+        ahora = time.time()
+        with self.con:
+            self.con.executemany(
+                "INSERT OR REPLACE INTO progreso (ruta, estado, doc_id, bytes, error, sellado) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(*f, ahora) for f in filas],
+            )
+
+    def resumen(self) -> Dict[str, int]:
+        return dict(self.con.execute("SELECT estado, COUNT(*) FROM progreso GROUP BY estado").fetchall())
+
+
+def buscar_pdfs(origen: str) -> Iterator[Tuple[str, str]]:
+    """(ruta, ruta relativa a `origen`) de cada .pdf del árbol, en orden estable."""
+    for raiz, dirs, archivos in os.walk(origen):
+        dirs.sort()
+        for nombre in sorted(archivos):
+            if nombre.lower().endswith(".pdf"):
+                ruta = os.path.join(raiz, nombre)
+                yield ruta, os.path.relpath(ruta, origen).replace(os.sep, "/")
+
+
+class _Tanda:
+    """Resultados pendientes de escribir en el índice y en el progreso."""
+
+    def __init__(self, indice: IndiceDocumentos, progreso: Progreso):
+        self.indice = indice
+        self.progreso = progreso
+        self.filas: List[Dict[str, Any]] = []
+        self.estados: List[Tuple[str, str, Optional[str], int, Optional[str]]] = []
+        self.desde = time.monotonic()
+
+    def agregar(self, relativa: str, fila, error, tam: int) -> None:
+        if fila is not None:
+            self.filas.append(fila)
+            self.estados.append((relativa, LISTO, fila["doc_id"], tam, None))
+        else:
+            print(f"error {relativa}: {error}", file=sys.stderr)
+            self.estados.append((relativa, ERROR, None, 0, error))
+
+    def escribir(self) -> None:
+        # Primero el índice: un documento marcado como listo siempre está indexado
+        self.indice.registrar_varios(self.filas)
+        self.progreso.registrar(self.estados)
+        self.filas, self.estados = [], []
+        self.desde = time.monotonic()
+
+
+def sellar_arbol(origen: str, storage: str, user_meta: Dict[str, Any], base_url: str,
+                 ruta_llave: Optional[str] = None, password: Optional[bytes] = None,
+                 workers: Optional[int] = None, db: Optional[str] = None,
+                 progreso_db: Optional[str] = None, lote: int = 200, cada: float = 5.0,
+                 reporte: float = 10.0, sincronizar: bool = True, max_memoria_mb: int = 0,
+                 reintentar_errores: bool = False, perfil: str = "incremental") -> Dict[str, Any]:
+    """
+    Sella los PDFs de `origen` que falten según el progreso y devuelve
+    {"sellados", "errores", "omitidos", "segundos", "docs_s", "mb_s"}.
+    workers=0 sella en este proceso.
+    """
+    indice = IndiceDocumentos(db or os.path.join(storage, "indice.sqlite3"))
+    progreso = Progreso(progreso_db or os.path.join(storage, "masivo.sqlite3"))
+    hechos = progreso.hechos(incluir_errores=not reintentar_errores)
+    tanda = _Tanda(indice, progreso)
+    initargs = (ruta_llave, password, storage, sincronizar, max_memoria_mb)
+
+    def tareas():
+        for ruta, relativa in buscar_pdfs(origen):
+            if relativa not in hechos:
+                meta = {**user_meta, "original_filename": os.path.basename(ruta), "original_path": relativa}
+                yield ruta, relativa, meta, base_url, perfil
+
+    sellados = errores = bytes_entrada = 0
+    t0 = ultimo_reporte = time.monotonic()
+
+    def anotar(resultado) -> None:
+        nonlocal sellados, errores, bytes_entrada, ultimo_reporte
+        tanda.agregar(*resultado)
+        if resultado[1] is not None:
+            sellados += 1
+            bytes_entrada += resultado[3]
+        else:
+            errores += 1
+        ahora = time.monotonic()
+        if len(tanda.estados) >= lote or ahora - tanda.desde >= cada:
+            tanda.escribir()
+        if reporte and ahora - ultimo_reporte >= reporte:
+            ultimo_reporte = ahora
+            t = ahora - t0
+            print(f"{sellados} sellados, {errores} errores, {sellados / t:.1f} docs/s, "
+                  f"{bytes_entrada / t / 1e6:.1f} MB/s", flush=True)
+
+    en_vuelo = set()
+
+    def recoger(futuros) -> None:
+        for f in futuros:
+            en_vuelo.discard(f)
+            anotar(f.result())
+
+    try:
+        if workers == 0:
+            _inicializar(*initargs)
+            for tarea in tareas():
+                anotar(_sellar_uno(*tarea))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_inicializar,
+                                     initargs=initargs) as ex:
+                try:
+                    # Ventana acotada: con 300k archivos no se crean 300k futuros de golpe
+                    maximo = (workers or os.cpu_count() or 1) * 4
+                    for tarea in tareas():
+                        if len(en_vuelo) >= maximo:
+                            recoger(wait(en_vuelo, return_when=FIRST_COMPLETED).done)
+                        en_vuelo.add(ex.submit(_sellar_uno, *tarea))
+                    recoger(wait(en_vuelo).done)
+                except BaseException:
+                    for f in en_vuelo:
+                        f.cancel()
+                    raise
+    finally:
+        # También con Ctrl+C: se registra lo que los workers alcanzaron a
+        # publicar, para no sellarlo otra vez al reanudar
+        for f in list(en_vuelo):
+            if f.done() and not f.cancelled() and f.exception() is None:
+                recoger([f])
+        tanda.escribir()
+
+    segundos = time.monotonic() - t0
+    return {
+        "sellados": sellados,
+        "errores": errores,
+        "omitidos": len(hechos),
+        "segundos": round(segundos, 2),
+        "docs_s": round(sellados / segundos, 2) if segundos else 0.0,
+        "mb_s": round(bytes_entrada / segundos / 1e6, 2) if segundos else 0.0,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Sella en lote un árbol de PDFs (reanudable)")
+    ap.add_argument("origen", help="directorio con los PDFs a sellar")
+    ap.add_argument("--storage", default="storage")
+    ap.add_argument("--db", default=None, help="índice; por defecto <storage>/indice.sqlite3")
+    ap.add_argument("--progreso", default=None, help="por defecto <storage>/masivo.sqlite3")
+    ap.add_argument("--llave", default=None, help="PEM de la llave privada; sin él, PRIVATE_KEY_PEM")
+    ap.add_argument("--uploader", default="migracion")
+    ap.add_argument("--area", default="")
+    ap.add_argument("--base-url", default=os.getenv("API_BASE_URL", "http://127.0.0.1:5000").rstrip("/") + "/v/")
+    ap.add_argument("--workers", type=int, default=None, help="0 sella en este proceso")
+    ap.add_argument("--lote", type=int, default=200, help="documentos por escritura al índice")
+    ap.add_argument("--cada", type=float, default=5.0, help="segundos máximos entre escrituras")
+    ap.add_argument("--reporte", type=float, default=10.0, help="segundos entre reportes (0: sólo al final)")
+    ap.add_argument("--sin-fsync", action="store_true", help="no hace fsync de cada PDF publicado")
+    ap.add_argument("--max-memoria-mb", type=int, default=0)
+    ap.add_argument("--reintentar-errores", action="store_true")
+    ap.add_argument("--perfil", choices=PERFILES, default=os.getenv("SELLO_PERFIL", "incremental"),
+                    help="perfil de salida (SELLO_PERFIL)")
+    args = ap.parse_args(argv)
+
+    password = os.getenv("SELLO_KEY_PASSWORD", "secreto").encode() or None
+    resultado = sellar_arbol(
+        args.origen, args.storage, {"uploader": args.uploader, "area": args.area}, args.base_url,
+        ruta_llave=args.llave, password=password, workers=args.workers, db=args.db,
+        progreso_db=args.progreso, lote=args.lote, cada=args.cada, reporte=args.reporte,
+        sincronizar=not args.sin_fsync, max_memoria_mb=args.max_memoria_mb,
+        reintentar_errores=args.reintentar_errores, perfil=args.perfil,
+    )
+    print(f"{resultado['sellados']} sellados, {resultado['errores']} errores, "
+          f"{resultado['omitidos']} ya hechos en {resultado['segundos']:.1f} s: "
+          f"{resultado['docs_s']:.1f} docs/s, {resultado['mb_s']:.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# sello_monarca/memoria.py
+"""
+Medición y límite de memoria por sellado.
+
+- pico_rss_kb(): pico de RSS del proceso (VmHWM en Linux, ru_maxrss en
+  otros sistemas, donde no se puede reiniciar).
+- reiniciar_pico(): reinicia VmHWM para medir sólo la petición actual.
+- bloques(data): recorre bytes o un mmap por bloques soltando del RSS
+  las páginas del mmap ya leídas.
+- limitar_memoria(mb): RLIMIT_DATA para el proceso. Cuenta heap y mapeos
+  anónimos pero no los mmap de archivos de sólo lectura, así el PDF de
+  entrada mapeado no consume el límite. Se aplica en los workers del
+  pool, nunca en el proceso web.
+"""
+from __future__ import annotations
+import mmap, re, sys
+from typing import Iterator, Optional
+
+try:
+    import resource
+except ImportError:          # Windows
+    resource = None
+
+_RE_HWM = re.compile(r"VmHWM:\s+(\d+)\s+kB")
+_BLOQUE = 1024 * 1024
+
+
+def reiniciar_pico() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def pico_rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            m = _RE_HWM.search(f.read())
+        if m:
+            return int(m.group(1))
+    except OSError:
+        pass
+    if resource is None:
+        return 0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss // 1024 if sys.platform == "darwin" else maxrss   # macOS: bytes
+
+
+def limitar_memoria(mb: int) -> bool:
+    """Fija RLIMIT_DATA en `mb` MiB; devuelve False si el sistema no lo permite."""
+    if not mb or resource is None or not hasattr(resource, "RLIMIT_DATA"):
+        return False
+    limite = mb * 1024 * 1024
+    try:
+        _, duro = resource.getrlimit(resource.RLIMIT_DATA)
+        if duro != resource.RLIM_INFINITY:
+            limite = min(limite, duro)
+        resource.setrlimit(resource.RLIMIT_DATA, (limite, duro))
+        return True
+    except (ValueError, OSError):
+        return False
+
+
+def bloques(data, tam: int = _BLOQUE, fin: Optional[int] = None) -> Iterator[memoryview]:
+    """
+    Vistas consecutivas de `tam` bytes (hasta `fin`, por defecto todo `data`).
+    Si `data` es un mmap, las páginas de cada bloque se sueltan
+    (MADV_DONTNEED) después de entregarlo: de lo contrario recorrer un
+    archivo mapeado lo deja entero en el RSS.
+    Cada vista se libera al pedir la siguiente (no se debe guardar).
+    """
+    soltar = isinstance(data, mmap.mmap) and hasattr(mmap, "MADV_DONTNEED")
+    with memoryview(data) as vista:
+        total = len(vista) if fin is None else min(fin, len(vista))
+        for i in range(0, total, tam):
+            with vista[i:min(i + tam, total)] as trozo:
+                yield trozo
+            if soltar:
+                # madvise exige un inicio alineado a página (tam puede no serlo)
+                inicio = i - i % mmap.PAGESIZE
+                data.madvise(mmap.MADV_DONTNEED, inicio, min(i + tam, len(vista)) - inicio)
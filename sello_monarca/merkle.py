@@ -0,0 +1,68 @@
+# sello_monarca/merkle.py
+"""
+Árbol de Merkle para el sellado por lotes.
+
+Un lote firma una sola raíz; cada documento lleva en su /CM_META la prueba
+de inclusión (hashes hermanos desde su hoja hasta la raíz).
+
+  hoja  = SHA-256(0x00 || datos)
+  nodo  = SHA-256(0x01 || izquierdo || derecho)
+
+Los prefijos separan hojas de nodos internos. Un nodo sin pareja sube
+tal cual al siguiente nivel (no se duplica), así dos lotes distintos
+no pueden producir la misma raíz.
+
+La prueba es una lista de cadenas "L:<hex>" / "R:<hex>": el hermano va a
+la izquierda o a la derecha del hash acumulado.
+"""
+from __future__ import annotations
+from hashlib import sha256
+from typing import List, Sequence, Tuple
+
+
+def hash_hoja(datos: bytes) -> bytes:
+    return sha256(b"\x00" + datos).digest()
+
+
+def hash_nodo(izquierdo: bytes, derecho: bytes) -> bytes:
+    return sha256(b"\x01" + izquierdo + derecho).digest()
+
+
+def construir(hojas: Sequence[bytes]) -> Tuple[bytes, List[List[str]]]:
+    """
+    Recibe los hashes de hoja y devuelve (raíz, pruebas), con una prueba
+    por hoja en el mismo orden.
+    """
+    if not hojas:
+        raise ValueError("El lote está vacío")
+    pruebas: List[List[str]] = [[] for _ in hojas]
+    # posiciones[i] = índices de hoja que cuelgan del nodo i del nivel actual
+    nivel = list(hojas)
+    posiciones = [[i] for i in range(len(hojas))]
+    while len(nivel) > 1:
+        siguiente, sig_posiciones = [], []
+        for i in range(0, len(nivel) - 1, 2):
+            izq, der = nivel[i], nivel[i + 1]
+            for hoja in posiciones[i]:
+                pruebas[hoja].append("R:" + der.hex())
+            for hoja in posiciones[i + 1]:
+                pruebas[hoja].append("L:" + izq.hex())
+            siguiente.append(hash_nodo(izq, der))
+            sig_posiciones.append(posiciones[i] + posiciones[i + 1])
+        if len(nivel) % 2:
+            siguiente.append(nivel[-1])
+            sig_posiciones.append(posiciones[-1])
+        nivel, posiciones = siguiente, sig_posiciones
+    return nivel[0], pruebas
+
+
+def raiz_desde_prueba(hoja: bytes, prueba: Sequence[str]) -> bytes:
+    """Recalcula la raíz a partir del hash de hoja y su prueba de inclusión."""
+    actual = hoja
+    for paso in prueba:
+        lado, _, hermano_hex = paso.partition(":")
+        hermano = bytes.fromhex(hermano_hex)
+        if len(hermano) != 32 or lado not in ("L", "R"):
+            raise ValueError("Prueba de inclusión mal formada")
+        actual = hash_nodo(hermano, actual) if lado == "L" else hash_nodo(actual, hermano)
+    return actual
@@ -0,0 +1,179 @@
+# sello_monarca/metricas.py
+"""
+Histogramas por etapa del sellado y la verificación, exportados en formato
+de texto de Prometheus.
+
+- Desactivado por defecto: etapa() devuelve un context manager vacío y
+  observar() retorna de inmediato, sin medir ni escribir nada.
+- activar(directorio): cada proceso (workers de gunicorn y del pool de
+  sellado) acumula en memoria y vuelca cada `intervalo` segundos, y al
+  salir, a <directorio>/metricas-<pid>.json. exportar() suma los archivos
+  de todos los procesos, así /metrics da el total sin importar qué worker
+  atiende. Los archivos de procesos terminados se conservan para que los
+  contadores no retrocedan; el directorio se vacía al desplegar (igual que
+  PROMETHEUS_MULTIPROC_DIR).
+- Tras un fork el hijo empieza con los histogramas vacíos.
+
+Uso:
+    with metricas.etapa("portada"):
+        ...
+    metricas.observar("sello_entrada_bytes", len(pdf), operacion="sellar")
+"""
+from __future__ import annotations
+import atexit, bisect, glob, json, os, threading, time
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Tuple
+
+_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_BYTES = (1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7, 1e8, 5e8, 1e9)
+_PAGINAS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+# nombre -> (ayuda, límites de los buckets)
+HISTOGRAMAS: Dict[str, Tuple[str, tuple]] = {
+    "sello_etapa_segundos": ("Duración de cada etapa del sellado y la verificación", _SEGUNDOS),
+    "sello_http_segundos": ("Duración de las peticiones HTTP por ruta", _SEGUNDOS),
+    "sello_entrada_bytes": ("Tamaño del PDF recibido", _BYTES),
+    "sello_salida_bytes": ("Tamaño del PDF sellado", _BYTES),
+    "sello_paginas": ("Páginas del PDF recibido", _PAGINAS),
+}
+
+_ACTIVO = False
+_DIRECTORIO: Optional[str] = None
+_INTERVALO = 10.0
+_LOCK = threading.Lock()
+# (nombre, etiquetas ordenadas) -> [cuenta por bucket..., cuenta +Inf, suma]
+_DATOS: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[float]] = {}
+_NULO = nullcontext()
+
+
+def activo() -> bool:
+    return _ACTIVO
+
+
+def activar(directorio: str, intervalo: float = 10.0) -> None:
+    """Empieza a medir en este proceso y a volcar en `directorio`."""
+    global _ACTIVO, _DIRECTORIO, _INTERVALO
+    os.makedirs(directorio, exist_ok=True)
+    _DIRECTORIO = os.path.abspath(directorio)
+    _INTERVALO = intervalo
+    if not _ACTIVO:
+        _ACTIVO = True
+        atexit.register(volcar)
+        os.register_at_fork(after_in_child=_despues_de_fork)
+        _iniciar_volcado()
+
+
+def _iniciar_volcado() -> None:
+    def bucle():
+        while True:
+            time.sleep(_INTERVALO)
+            volcar()
+    threading.Thread(target=bucle, name="metricas", daemon=True).start()
+
+
+def _despues_de_fork() -> None:
+    global _LOCK
+    _LOCK = threading.Lock()
+    _DATOS.clear()
+    _iniciar_volcado()
+
+
+def observar(nombre: str, valor: float, **etiquetas: str) -> None:
+    """Suma `valor` al histograma `nombre` (ver HISTOGRAMAS) con esas etiquetas."""
+    if not _ACTIVO:
+        return
+    limites = HISTOGRAMAS[nombre][1]
+    clave = (nombre, tuple(sorted(etiquetas.items())))
+    with _LOCK:
+        datos = _DATOS.get(clave)
+        if datos is None:
+            datos = _DATOS[clave] = [0.0] * (len(limites) + 2)
+        datos[bisect.bisect_left(limites, valor)] += 1
+        datos[-1] += valor
+
+
+class _Cronometro:
+    __slots__ = ("nombre", "inicio")
+
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observar("sello_etapa_segundos", time.perf_counter() - self.inicio, etapa=self.nombre)
+        return False
+
+
+def etapa(nombre: str):
+    """Context manager que registra la duración del bloque en sello_etapa_segundos."""
+    return _Cronometro(nombre) if _ACTIVO else _NULO
+
+
+def volcar() -> None:
+    """Escribe los histogramas de este proceso en su archivo (reemplazo atómico)."""
+    if not _ACTIVO or _DIRECTORIO is None:
+        return
+    with _LOCK:
+        filas = [[nombre, dict(etiquetas), datos[:]] for (nombre, etiquetas), datos in _DATOS.items()]
+    if not filas:
+        return
+    ruta = os.path.join(_DIRECTORIO, f"metricas-{os.getpid()}.json")
+    tmp = f"{ruta}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(filas, f, separators=(",", ":"))
+        os.replace(tmp, ruta)
+    except OSError:
+        pass                    # un volcado perdido no debe romper el sellado
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _etiquetas(etiquetas: Dict[str, str], extra: str = "") -> str:
+    partes = [f'{k}="{_escapar(v)}"' for k, v in sorted(etiquetas.items())]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _numero(valor: float) -> str:
+    return repr(int(valor)) if float(valor).is_integer() else repr(valor)
+
+
+def exportar() -> str:
+    """Texto de Prometheus con la suma de los histogramas de todos los procesos."""
+    volcar()
+    total: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[float]] = {}
+    for ruta in glob.glob(os.path.join(_DIRECTORIO or "", "metricas-*.json")):
+        try:
+            with open(ruta, encoding="utf-8") as f:
+                filas = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for nombre, etiquetas, datos in filas:
+            if nombre not in HISTOGRAMAS or len(datos) != len(HISTOGRAMAS[nombre][1]) + 2:
+                continue                # archivo de una versión con otros buckets
+            clave = (nombre, tuple(sorted(etiquetas.items())))
+            acumulado = total.setdefault(clave, [0.0] * len(datos))
+            for i, v in enumerate(datos):
+                acumulado[i] += v
+
+    lineas = []
+    for nombre, (ayuda, limites) in HISTOGRAMAS.items():
+        series = [(dict(etq), datos) for (n, etq), datos in sorted(total.items()) if n == nombre]
+        les = [f'le="{_numero(limite)}"' for limite in limites] + ['le="+Inf"']
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} histogram")
+        for etiquetas, datos in series:
+            acumulada = 0.0
+            for le, cuenta in zip(les, datos):
+                acumulada += cuenta
+                lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, le)} {_numero(acumulada)}")
+            lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {_numero(datos[-1])}")
+            lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {_numero(acumulada)}")
+    return "\n".join(lineas) + "\n"
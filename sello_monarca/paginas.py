@@ -0,0 +1,104 @@
+# sello_monarca/paginas.py
+"""
+Apoyo para las páginas HTML públicas (/v/<doc_id> y /verify-ui).
+
+- fecha_legible(): "2025-05-30T23:12:35Z" -> "30 mayo 2025, 17:12 (MTY)".
+- RecursosEstaticos: CSS/JS de static/ leídos una vez, con su gzip y su
+  ETag precalculados. La URL lleva el hash (?v=...), así que se pueden
+  servir con Cache-Control immutable: un cambio del archivo cambia la URL.
+- huella() / huella_directorio(): ETags compuestos y versión de templates/ y static/ para los ETag de
+  las páginas.
+- comprimir(): gzip de una respuesta dinámica si el cliente lo acepta.
+
+El HTML de cada página vive en templates/; Jinja compila cada plantilla
+una vez por proceso y sólo la tabla del documento cambia por petición.
+"""
+from __future__ import annotations
+import datetime as dt, gzip, hashlib, mimetypes, os, threading
+from typing import Dict, NamedTuple, Optional
+from zoneinfo import ZoneInfo
+
+MESES = (
+    "enero", "febrero", "marzo", "abril", "mayo", "junio",
+    "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre",
+)
+
+# Por debajo de esto gzip no compensa (cabeceras + CPU)
+_MIN_GZIP = 512
+
+
+def fecha_legible(iso: str, zona: str = "America/Monterrey", sufijo: str = "MTY") -> str:
+    """Fecha ISO en UTC a hora local de `zona` con el mes en español; `iso` si no se puede leer."""
+    try:
+        utc = dt.datetime.strptime(iso, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=dt.timezone.utc)
+        local = utc.astimezone(ZoneInfo(zona))
+    except (TypeError, ValueError, KeyError):
+        return iso
+    return f"{local.day} {MESES[local.month - 1]} {local.year}, {local.hour:02d}:{local.minute:02d} ({sufijo})"
+
+
+class Recurso(NamedTuple):
+    datos: bytes
+    gzip: Optional[bytes]       # None si no reduce el tamaño
+    etag: str
+    mimetype: str
+
+
+class RecursosEstaticos:
+    """Archivos de `directorio` servidos desde memoria (ver el docstring del módulo)."""
+
+    def __init__(self, directorio: str):
+        self.directorio = os.path.abspath(directorio)
+        self._recursos: Dict[str, Recurso] = {}
+        self._lock = threading.Lock()
+
+    def _cargar(self, nombre: str) -> Recurso:
+        ruta = os.path.abspath(os.path.join(self.directorio, nombre))
+        if os.path.dirname(ruta) != self.directorio:
+            raise FileNotFoundError(nombre)
+        with open(ruta, "rb") as f:
+            datos = f.read()
+        comprimido = gzip.compress(datos, 9, mtime=0)
+        mimetype = mimetypes.guess_type(nombre)[0] or "application/octet-stream"
+        if mimetype.startswith("text/") or mimetype.endswith("javascript"):
+            mimetype += "; charset=utf-8"
+        return Recurso(datos, comprimido if len(comprimido) < len(datos) else None,
+                       hashlib.sha256(datos).hexdigest()[:16], mimetype)
+
+    def obtener(self, nombre: str) -> Recurso:
+        """Recurso de `nombre`; FileNotFoundError si no está en el directorio."""
+        recurso = self._recursos.get(nombre)
+        if recurso is None:
+            recurso = self._cargar(nombre)
+            with self._lock:
+                self._recursos[nombre] = recurso
+        return recurso
+
+    def version(self, nombre: str) -> str:
+        return self.obtener(nombre).etag
+
+
+def huella(*partes) -> str:
+    """Hash corto de `partes` (para ETags compuestos)."""
+    return hashlib.sha256("\0".join(map(str, partes)).encode()).hexdigest()[:16]
+
+
+def huella_directorio(directorio: str) -> str:
+    """Hash corto del contenido de los archivos de `directorio` (cambia si se edita cualquiera)."""
+    h = hashlib.sha256()
+    for raiz, dirs, archivos in os.walk(directorio):
+        dirs.sort()
+        for nombre in sorted(archivos):
+            ruta = os.path.join(raiz, nombre)
+            h.update(os.path.relpath(ruta, directorio).encode() + b"\0")
+            with open(ruta, "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+def comprimir(datos: bytes, acepta_gzip: bool) -> Optional[bytes]:
+    """gzip de `datos` si el cliente lo acepta y vale la pena; None si no."""
+    if not acepta_gzip or len(datos) < _MIN_GZIP:
+        return None
+    comprimido = gzip.compress(datos, 6, mtime=0)
+    return comprimido if len(comprimido) < len(datos) else None
@@ -1,58 +1,69 @@
 # sello_monarca/qr_handler.py
 from io import BytesIO
-import os, qrcode, datetime
+import os, qrcode, datetime, zlib
+from functools import lru_cache
 from urllib.parse import urlparse, parse_qs
 
 from reportlab.pdfgen import canvas
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.utils import ImageReader
 from reportlab.lib.units import cm
 from reportlab.lib import colors
-from flask import current_app
+from flask import current_app, has_app_context
+from PyPDF2 import PdfReader, generic
 
+from sello_monarca import metricas
+from sello_monarca.incremental import serializar
 
-# Ajusta el nombre o la ruta si tu archivo se llama distinto
-# dentro de la función que genera el PDF (o justo antes)
 
+W, H = letter
+QR_SIDE = 8 * cm
+QR_Y = H / 2 - QR_SIDE / 2 + 2.5 * cm       # un poco más arriba para compactar
+TEXTO_Y = QR_Y - 1.2 * cm
+LINK_Y = TEXTO_Y - 1.1 * cm
+META_Y = 2 * cm
 
+# Numeración fija de la portada independiente; los objetos de la plantilla
+# (form XObject + logo + fuentes) empiezan en _PRIMER_OBJ_PLANTILLA.
+_CATALOGO, _PAGINAS, _PAGINA, _CONTENIDO, _FUENTE, _ANOTACION, _IMAGEN_QR = range(1, 8)
+_PRIMER_OBJ_PLANTILLA = 8
 
-def generar_pagina_qr_bytes(url: str) -> bytes:
-    """
-    Genera una portada PDF que contiene:
-      – Logotipo de Casa Monarca
-      – Título “Sello Monarca”
-      – Subtítulo “Verificación de documentos”
-      – Código QR (link clicable y texto)
-      – Metadatos ligeros (ID y fecha)
-    Devuelve los bytes del PDF para que insertes la página al final
-    con tu función insertar_pagina_qr().
-    """
-    # ---------- Extrae metadatos -------
-    doc_id = parse_qs(urlparse(url).query).get("id", [""])[0]
-    fecha  = datetime.datetime.utcnow().strftime("%d-%b-%Y")
+# "vector": módulos del QR como rectángulos PDF (nítido a cualquier zoom, sin PIL)
+# "raster": imagen 1-bit generada con PIL
+MODOS_QR = ("vector", "raster")
+MODO_QR = "vector"
+
+
+def _ruta_logo() -> str:
+    """Logo desde la app de Flask si hay contexto; si no, desde el repo."""
+    if has_app_context():
+        static = current_app.static_folder
+    else:
+        static = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+    return os.path.join(static, "logo_casa_monarca.png")
 
-    # ---------- QR ----------
-    qr_buf = BytesIO()
-    qrcode.make(url).save(qr_buf, format="PNG")
-    qr_buf.seek(0)
-    qr_img = ImageReader(qr_buf)
 
+@lru_cache(maxsize=1)
+def _plantilla() -> tuple:
+    """
+    Dibuja UNA vez por proceso las partes fijas de la portada (logo, título,
+    línea, subtítulo y mensaje) y las convierte en un form XObject.
+    Devuelve los objetos ya serializados como ((num, bytes), ...), numerados
+    a partir de _PRIMER_OBJ_PLANTILLA (que es el propio form XObject).
+    """
     # ---------- Logo ----------
-    logo_path = os.path.join(current_app.static_folder, "logo_casa_monarca.png")
-    logo_img  = ImageReader(logo_path)
+    logo_img = ImageReader(_ruta_logo())
     lw_pt, lh_pt = logo_img.getSize()
     max_logo = 4 * cm                        # límite en 4 cm sin deformar
     scale = min(max_logo / lw_pt, max_logo / lh_pt, 1)
     lw, lh = lw_pt * scale, lh_pt * scale
 
-    # ---------- Página ----------
     buf = BytesIO()
-    c   = canvas.Canvas(buf, pagesize=letter)
-    W, H = letter
+    c = canvas.Canvas(buf, pagesize=letter)
 
     # 1) Encabezado
     top_y = H - 2 * cm
-    # Logo
     c.drawImage(logo_img, 2 * cm, top_y - lh, lw, lh, mask="auto")
     # Título “Sello Monarca”
     c.setFont("Helvetica-Bold", 24)
@@ -66,45 +77,191 @@ def generar_pagina_qr_bytes(url: str) -> bytes:
     c.drawString(2 * cm, top_y - lh - 1.1 * cm, "Verificación de documentos")
     c.setFillColor(colors.black)
 
-    # 2) QR centrado
-    qr_side = 8 * cm
-    qr_y = H / 2 - qr_side / 2 + 2.5 * cm    # un poco más arriba para compactar
-    c.drawImage(
-        qr_img,
-        (W - qr_side) / 2,
-        qr_y,
-        qr_side,
-        qr_side,
-        mask="auto"
-    )
-
-    # 3) Mensaje principal
-    ty = qr_y - 1.2 * cm
+    # 3) Mensaje principal (el QR y la URL se dibujan por documento)
     c.setFont("Helvetica", 11)
-    c.drawCentredString(W / 2, ty,
+    c.drawCentredString(W / 2, TEXTO_Y,
         "Este PDF está firmado digitalmente por Casa Monarca.")
-    c.drawCentredString(W / 2, ty - 0.45 * cm,
+    c.drawCentredString(W / 2, TEXTO_Y - 0.45 * cm,
         "Escanea el código QR o visita la URL para confirmar su autenticidad:")
+    c.showPage()
+    c.save()
 
-    # URL clicable
-    link_y = ty - 1.1 * cm
-    c.setFillColor(colors.blue)
-    c.drawCentredString(W / 2, link_y, url)
-    c.linkURL(url, (W * 0.1, link_y - 0.2 * cm, W * 0.9, link_y + 0.3 * cm), relative=0)
-    c.setFillColor(colors.black)
+    # ---------- Página -> form XObject ----------
+    pagina = PdfReader(BytesIO(buf.getvalue())).pages[0]
+    form = generic.EncodedStreamObject()
+    form._data = zlib.compress(pagina.get_contents().get_data())
+    form[generic.NameObject("/Filter")] = generic.NameObject("/FlateDecode")
+    form[generic.NameObject("/Type")] = generic.NameObject("/XObject")
+    form[generic.NameObject("/Subtype")] = generic.NameObject("/Form")
+    form[generic.NameObject("/BBox")] = generic.ArrayObject(
+        generic.FloatObject(v) for v in (0, 0, W, H)
+    )
+    form[generic.NameObject("/Resources")] = pagina.raw_get("/Resources")
+
+    mapa = {}
+    pendientes = []
+
+    def renum(idnum: int) -> int:
+        if idnum not in mapa:
+            mapa[idnum] = _PRIMER_OBJ_PLANTILLA + 1 + len(mapa)
+            pendientes.append(idnum)
+        return mapa[idnum]
+
+    objetos = [(_PRIMER_OBJ_PLANTILLA, serializar(form, renum))]
+    while pendientes:
+        idnum = pendientes.pop()
+        objetos.append((mapa[idnum], serializar(pagina.pdf.get_object(idnum), renum)))
+    return tuple(sorted(objetos))
+
+
+def _cadena_pdf(texto: str) -> bytes:
+    """Cadena literal PDF (WinAnsi) con paréntesis y diagonales escapados."""
+    crudo = texto.encode("cp1252", "replace")
+    return b"(" + crudo.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _imagen_qr(url: str) -> bytes:
+    """QR rasterizado como imagen 1-bit (sin pasar por PNG ni ImageReader)."""
+    img = qrcode.make(url).get_image()          # modo "1": 0 = negro, 1 = blanco
+    ancho, alto = img.size
+    datos = zlib.compress(img.tobytes())
+    return (b"<</Type/XObject/Subtype/Image/Width %d/Height %d/ColorSpace/DeviceGray"
+            b"/BitsPerComponent 1/Filter/FlateDecode/Length %d>>\nstream\n"
+            % (ancho, alto, len(datos)) + datos + b"\nendstream")
 
-    # 4) Metadatos gris
-    meta_y = 2 * cm
-    c.setFont("Helvetica", 9)
-    c.setFillColor(colors.grey)
+
+def _rectangulos_qr(matriz) -> list:
+    """
+    Convierte la matriz de módulos en rectángulos (x, y, ancho, alto) en
+    unidades de módulo, con y hacia arriba como en PDF. Las corridas
+    horizontales se unen en un solo rectángulo y las corridas idénticas de
+    filas consecutivas se apilan en uno más alto.
+    """
+    n = len(matriz)
+    abiertos = {}            # (x, ancho) -> [y_superior, alto]
+    rects = []
+    for fila_idx, fila in enumerate(matriz):
+        corridas = set()
+        x = 0
+        while x < n:
+            if fila[x]:
+                inicio = x
+                while x < n and fila[x]:
+                    x += 1
+                corridas.add((inicio, x - inicio))
+            else:
+                x += 1
+        for clave in list(abiertos):
+            if clave not in corridas:
+                y_sup, alto = abiertos.pop(clave)
+                rects.append((clave[0], n - y_sup - alto, clave[1], alto))
+        for clave in corridas:
+            if clave in abiertos:
+                abiertos[clave][1] += 1
+            else:
+                abiertos[clave] = [fila_idx, 1]
+    for (x, ancho), (y_sup, alto) in abiertos.items():
+        rects.append((x, n - y_sup - alto, ancho, alto))
+    return rects
+
+
+def _dibujo_qr_vectorial(url: str, x: float, y: float, lado: float) -> bytes:
+    """Operadores PDF que pintan el QR como un único trazado relleno."""
+    qr = qrcode.QRCode(border=4)
+    qr.add_data(url)
+    qr.make(fit=True)
+    matriz = qr.get_matrix()                    # incluye el borde blanco
+    escala = lado / len(matriz)
+    trazado = b" ".join(b"%d %d %d %d re" % r for r in _rectangulos_qr(matriz))
+    return (b"q %s 0 0 %s %s %s cm 0 g %s f Q"
+            % (_fmt(escala), _fmt(escala), _fmt(x), _fmt(y), trazado))
+
+
+def _fmt(v: float) -> bytes:
+    return (b"%.4f" % v).rstrip(b"0").rstrip(b".")
+
+
+def generar_pagina_qr_bytes(url: str, doc_id: str | None = None, modo_qr: str = MODO_QR) -> bytes:
+    """
+    Genera una portada PDF que contiene:
+      – Logotipo de Casa Monarca
+      – Título “Sello Monarca”
+      – Subtítulo “Verificación de documentos”
+      – Código QR (link clicable y texto)
+      – Metadatos ligeros (ID y fecha)
+    Las partes fijas vienen de la plantilla en caché (_plantilla); aquí sólo
+    se dibujan el QR, la URL, el ID y la fecha.
+    - modo_qr: "vector" (por defecto) o "raster" (ver MODOS_QR).
+    Devuelve los bytes del PDF de una página; sello.escribir_sellado() la
+    anexa al final del documento (incremental.anexar_pagina_y_metadatos()
+    hace lo mismo con un PDF en memoria).
+    """
+    if modo_qr not in MODOS_QR:
+        raise ValueError(f"modo_qr desconocido: {modo_qr!r}")
+
+    # ---------- Extrae metadatos -------
+    if doc_id is None:
+        doc_id = parse_qs(urlparse(url).query).get("id", [""])[0]
+    fecha = datetime.datetime.utcnow().strftime("%d-%b-%Y")
+    plantilla = _plantilla()
+
+    # ---------- Contenido variable ----------
+    url_pdf = _cadena_pdf(url)
+    url_x = (W - stringWidth(url, "Helvetica", 11)) / 2
+    gris = b"0.501961 0.501961 0.501961 rg"
+    if modo_qr == "vector":
+        with metricas.etapa("portada_qr"):
+            qr = _dibujo_qr_vectorial(url, (W - QR_SIDE) / 2, QR_Y, QR_SIDE)
+        xobjects = b"/Plantilla %d 0 R" % _PRIMER_OBJ_PLANTILLA
+        imagen_qr = b"null"
+    else:
+        with metricas.etapa("portada_qr"):
+            imagen_qr = _imagen_qr(url)
+        qr = b"q %s 0 0 %s %s %s cm /QR Do Q" % (_fmt(QR_SIDE), _fmt(QR_SIDE), _fmt((W - QR_SIDE) / 2), _fmt(QR_Y))
+        xobjects = b"/Plantilla %d 0 R/QR %d 0 R" % (_PRIMER_OBJ_PLANTILLA, _IMAGEN_QR)
+    contenido = [
+        b"q /Plantilla Do Q",
+        qr,
+        b"BT /F1 11 Tf 0 0 1 rg %s %s Td %s Tj ET" % (_fmt(url_x), _fmt(LINK_Y), url_pdf),
+    ]
     if doc_id:
-        c.drawString(2 * cm, meta_y, f"ID del documento: {doc_id}")
-    c.drawString(W - 2 * cm - 130, meta_y, f"Emitido: {fecha}")
-    c.setFillColor(colors.black)
+        contenido.append(b"BT /F1 9 Tf %s %s %s Td %s Tj ET"
+                         % (gris, _fmt(2 * cm), _fmt(META_Y), _cadena_pdf(f"ID del documento: {doc_id}")))
+    contenido.append(b"BT /F1 9 Tf %s %s %s Td %s Tj ET"
+                     % (gris, _fmt(W - 2 * cm - 130), _fmt(META_Y), _cadena_pdf(f"Emitido: {fecha}")))
+    contenido = zlib.compress(b"\n".join(contenido))
 
-    c.showPage()
-    c.save()
-    buf.seek(0)
+    rect = b" ".join(_fmt(v) for v in (W * 0.1, LINK_Y - 0.2 * cm, W * 0.9, LINK_Y + 0.3 * cm))
+    objetos = [
+        (_CATALOGO, b"<</Type/Catalog/Pages %d 0 R>>" % _PAGINAS),
+        (_PAGINAS, b"<</Type/Pages/Kids[%d 0 R]/Count 1>>" % _PAGINA),
+        (_PAGINA, b"<</Type/Page/Parent %d 0 R/MediaBox[0 0 %s %s]/Contents %d 0 R/Annots[%d 0 R]"
+                  b"/Resources<</ProcSet[/PDF/Text/ImageB]/Font<</F1 %d 0 R>>"
+                  b"/XObject<<%s>>>>>>"
+                  % (_PAGINAS, _fmt(W), _fmt(H), _CONTENIDO, _ANOTACION, _FUENTE, xobjects)),
+        (_CONTENIDO, b"<</Filter/FlateDecode/Length %d>>\nstream\n" % len(contenido) + contenido + b"\nendstream"),
+        (_FUENTE, b"<</Type/Font/Subtype/Type1/BaseFont/Helvetica/Encoding/WinAnsiEncoding>>"),
+        (_ANOTACION, b"<</Type/Annot/Subtype/Link/Rect[%s]/Border[0 0 0]/A<</S/URI/URI %s>>>>"
+                     % (rect, url_pdf)),
+        # En modo vector el objeto queda como null para conservar la numeración
+        (_IMAGEN_QR, imagen_qr),
+        *plantilla,
+    ]
+
+    # ---------- Página ----------
+    buf = BytesIO()
+    buf.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = {}
+    for num, cuerpo in objetos:
+        offsets[num] = buf.tell()
+        buf.write(b"%d 0 obj\n" % num + cuerpo + b"\nendobj\n")
+    total = max(offsets) + 1
+    xref_pos = buf.tell()
+    buf.write(b"xref\n0 %d\n0000000000 65535 f \n" % total)
+    for num in range(1, total):
+        buf.write(b"%010d 00000 n \n" % offsets[num])
+    buf.write(b"trailer\n<</Size %d/Root %d 0 R>>\nstartxref\n%d\n%%%%EOF\n"
+              % (total, _CATALOGO, xref_pos))
     return buf.getvalue()
 
 
@@ -0,0 +1,198 @@
+# sello_monarca/refirma.py
+"""
+Re-firma de los documentos del almacén con una llave nueva (rotación).
+
+Cada sello lleva en /CM_META el "kid" de la llave que lo firmó y app.py
+verifica con un RegistroLlaves (PUBLIC_KEY_PEM + PUBLIC_KEYS_DIR), así que
+tras rotar la llave los documentos anteriores siguen siendo válidos
+mientras su llave pública esté en el registro. Este comando los pasa a la
+llave nueva para poder retirar la anterior:
+
+- Comprueba la firma actual con las llaves públicas conocidas y anexa una
+  sección incremental que sólo reemplaza /Info (sello.refirmar_en): no se
+  regenera la portada QR ni se toca el cuerpo, así que el original sigue
+  deduplicado y verificar_contenido() sigue valiendo.
+- Los pendientes salen del índice (columna kid), que se actualiza por
+  lotes; una corrida interrumpida se reanuda sola. Antes se indexan los
+  documentos del almacén que falten.
+- Pensado para correr junto al tráfico: pocos workers con prioridad baja
+  (--nice) y un tope de documentos por segundo (--max-docs-s).
+
+    python -m sello_monarca.refirma --storage storage --llave nueva.pem \\
+        --llaves-publicas llaves/ --workers 2 --max-docs-s 20
+
+Sin --llave se usa PRIVATE_KEY_PEM (la llave nueva); la contraseña se lee
+de SELLO_KEY_PASSWORD. Cada re-firma cambia el SHA-256 del archivo (ETag
+de /file y /verify-hash); las copias que los navegadores guardaron como
+immutable siguen verificando con la llave anterior, así que no conviene
+retirarla del registro hasta que pase FILE_CACHE_MAX_AGE.
+"""
+from __future__ import annotations
+import argparse, json, os, sys, time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Optional, Tuple
+
+from sello_monarca.almacen import AlmacenLocal
+from sello_monarca.indice import IndiceDocumentos, fila_de_pdf, reconstruir
+from sello_monarca.lector_rapido import leer_meta
+from sello_monarca.llaves import (RegistroLlaves, cargar_llave_privada, cargar_llave_privada_desde_env,
+                                  cargar_llave_publica_desde_env, kid)
+from sello_monarca.sello import META_KEY, refirmar_en
+
+# Estado de cada proceso worker
+_LLAVE = None
+_KID: Optional[str] = None
+_PUBLICAS: Optional[RegistroLlaves] = None
+_ALMACEN: Optional[AlmacenLocal] = None
+
+
+def cargar_llave(ruta_llave: Optional[str], password: Optional[bytes]):
+    """Llave privada nueva: de `ruta_llave` o, sin ella, de PRIVATE_KEY_PEM."""
+    if ruta_llave:
+        return cargar_llave_privada(ruta_llave, password)
+    return cargar_llave_privada_desde_env(os.getenv("PRIVATE_KEY_PEM"), password=password)
+
+
+def registro_publicas(llave_nueva, directorio: Optional[str]) -> RegistroLlaves:
+    """La llave nueva, PUBLIC_KEY_PEM (si está) y los *.pem de `directorio`."""
+    registro = RegistroLlaves([llave_nueva.public_key()])
+    if os.getenv("PUBLIC_KEY_PEM"):
+        registro.agregar(cargar_llave_publica_desde_env(os.getenv("PUBLIC_KEY_PEM")))
+    if directorio:
+        registro.cargar_directorio(directorio)
+    return registro
+
+
+def _inicializar(ruta_llave: Optional[str], password: Optional[bytes], storage: str,
+                 dir_publicas: Optional[str], sincronizar: bool, nice: int) -> None:
+    global _LLAVE, _KID, _PUBLICAS, _ALMACEN
+    if nice:
+        os.nice(nice)
+    _LLAVE = cargar_llave(ruta_llave, password)
+    _KID = kid(_LLAVE)
+    _PUBLICAS = registro_publicas(_LLAVE, dir_publicas)
+    _ALMACEN = AlmacenLocal(storage, sincronizar=sincronizar)
+
+
+def _refirmar_uno(doc_id: str) -> Tuple[str, Optional[Dict[str, Any]], Optional[str]]:
+    """(doc_id, fila nueva del índice o None, error o None)."""
+    try:
+        with _ALMACEN.abrir(doc_id) as f:
+            if json.loads(leer_meta(f, META_KEY) or "{}").get("kid") == _KID:
+                return doc_id, fila_de_pdf(f), None     # ya re-firmado; el índice estaba atrasado
+            with _ALMACEN.temporal() as ruta_tmp:
+                with open(ruta_tmp, "wb") as salida:
+                    meta, sha_archivo = refirmar_en(f, salida, _LLAVE, _PUBLICAS)
+                fila = fila_de_pdf(ruta_tmp, size=os.path.getsize(ruta_tmp), sha=sha_archivo)
+                _ALMACEN.guardar(doc_id, ruta_tmp, meta.get("content_sha256"), meta.get("content_length"))
+        return doc_id, fila, None
+    except Exception as e:          # firma inválida, PDF dañado...: se reporta y se sigue
+        return doc_id, None, f"{e.__class__.__name__}: {e}"
+
+
+def refirmar_almacen(storage: str, ruta_llave: Optional[str] = None, password: Optional[bytes] = None,
+                     dir_publicas: Optional[str] = None, workers: int = 1, db: Optional[str] = None,
+                     max_docs_s: float = 0.0, lote: int = 200, nice: int = 10,
+                     reporte: float = 10.0, sincronizar: bool = True) -> Dict[str, Any]:
+    """
+    Re-firma con la llave nueva los documentos cuyo kid es otro. Devuelve
+    {"kid", "refirmados", "errores", "segundos", "docs_s"}.
+    """
+    indice = IndiceDocumentos(db or os.path.join(storage, "indice.sqlite3"))
+    almacen = AlmacenLocal(storage, sincronizar=sincronizar)
+    reconstruir(indice, almacen, max(workers, 1))
+    kid_nuevo = kid(cargar_llave(ruta_llave, password))
+    pendientes = indice.ids_sin_kid(kid_nuevo)
+    print(f"llave {kid_nuevo}: {len(pendientes)} documentos por re-firmar", flush=True)
+
+    filas = []
+    refirmados = errores = 0
+    t0 = ultimo_reporte = time.monotonic()
+    turno = t0
+
+    def anotar(resultado) -> None:
+        nonlocal filas, refirmados, errores, ultimo_reporte
+        doc_id, fila, error = resultado
+        if fila is None:
+            errores += 1
+            print(f"error {doc_id}: {error}", file=sys.stderr)
+        else:
+            refirmados += 1
+            filas.append(fila)
+            if len(filas) >= lote:
+                indice.registrar_varios(filas)
+                filas = []
+        ahora = time.monotonic()
+        if reporte and ahora - ultimo_reporte >= reporte:
+            ultimo_reporte = ahora
+            print(f"{refirmados}/{len(pendientes)} re-firmados, {errores} errores, "
+                  f"{refirmados / (ahora - t0):.1f} docs/s", flush=True)
+
+    en_vuelo = set()
+
+    def recoger(futuros) -> None:
+        for f in futuros:
+            en_vuelo.discard(f)
+            anotar(f.result())
+
+    try:
+        with ProcessPoolExecutor(max_workers=max(workers, 1), initializer=_inicializar,
+                                 initargs=(ruta_llave, password, storage, dir_publicas,
+                                           sincronizar, nice)) as ex:
+            try:
+                for doc_id in pendientes:
+                    if max_docs_s:
+                        # Ritmo fijo: cada envío espera su turno
+                        espera = turno - time.monotonic()
+                        if espera > 0:
+                            time.sleep(espera)
+                        turno = max(turno, time.monotonic() - 1.0) + 1.0 / max_docs_s
+                    if len(en_vuelo) >= max(workers, 1) * 2:
+                        recoger(wait(en_vuelo, return_when=FIRST_COMPLETED).done)
+                    en_vuelo.add(ex.submit(_refirmar_uno, doc_id))
+                recoger(wait(en_vuelo).done)
+            except BaseException:
+                for f in en_vuelo:
+                    f.cancel()
+                raise
+    finally:
+        for f in list(en_vuelo):
+            if f.done() and not f.cancelled() and f.exception() is None:
+                recoger([f])
+        indice.registrar_varios(filas)
+
+    segundos = time.monotonic() - t0
+    return {
+        "kid": kid_nuevo,
+        "refirmados": refirmados,
+        "errores": errores,
+        "segundos": round(segundos, 2),
+        "docs_s": round(refirmados / segundos, 2) if segundos else 0.0,
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Re-firma los documentos del almacén con la llave nueva")
+    ap.add_argument("--storage", default="storage")
+    ap.add_argument("--db", default=None, help="índice; por defecto <storage>/indice.sqlite3")
+    ap.add_argument("--llave", default=None, help="PEM de la llave privada nueva; sin él, PRIVATE_KEY_PEM")
+    ap.add_argument("--llaves-publicas", default=os.getenv("PUBLIC_KEYS_DIR"),
+                    help="directorio con los *.pem de las llaves anteriores (PUBLIC_KEYS_DIR)")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--max-docs-s", type=float, default=0.0, help="tope de documentos por segundo (0: sin tope)")
+    ap.add_argument("--nice", type=int, default=10, help="prioridad de los workers (os.nice)")
+    ap.add_argument("--lote", type=int, default=200, help="filas por escritura al índice")
+    ap.add_argument("--reporte", type=float, default=10.0)
+    ap.add_argument("--sin-fsync", action="store_true")
+    args = ap.parse_args(argv)
+
+    password = os.getenv("SELLO_KEY_PASSWORD", "secreto").encode() or None
+    r = refirmar_almacen(args.storage, args.llave, password, args.llaves_publicas, args.workers,
+                         args.db, args.max_docs_s, args.lote, args.nice, args.reporte,
+                         sincronizar=not args.sin_fsync)
+    print(f"llave {r['kid']}: {r['refirmados']} re-firmados, {r['errores']} errores "
+          f"en {r['segundos']:.1f} s ({r['docs_s']:.1f} docs/s)")
+
+
+if __name__ == "__main__":
+    main()
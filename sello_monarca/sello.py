@@ -1,16 +1,25 @@
 # sello_monarca/sello.py
 from __future__ import annotations
 from io import BytesIO
-import json, uuid, base64, datetime as dt
+import json, mmap, uuid, base64, datetime as dt
 from hashlib import sha256
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, Any, List, Optional
 
 from PyPDF2 import PdfReader, PdfWriter, generic
-from sello_monarca.utils import firmar_hash, verificar_firma
-from sello_monarca.qr_handler import generar_pagina_qr_bytes
+from PyPDF2.errors import PdfReadError, PyPdfError
+from sello_monarca import merkle, metricas
+from sello_monarca import compacto
+from sello_monarca.utils import calcular_hash, firmar_hash, verificar_firma
+from sello_monarca.incremental import ActualizacionIncremental, preparar_pagina
+from sello_monarca.lector_rapido import abrir_pdf, leer_meta, solo_anexa_pagina_e_info
+from sello_monarca.llaves import RegistroLlaves, kid
+from sello_monarca.memoria import bloques
 
 META_KEY = "/CM_META"
 SIGN_PLACEHOLDER = "FIRMA_PENDIENTE"
+# Perfiles de salida: "incremental" anexa el sello a los bytes originales;
+# "compacto" sella la versión compacta del original (ver compacto.py)
+PERFILES = ("incremental", "compacto")
 
 def _utc_iso() -> str:
     return dt.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
@@ -23,63 +32,363 @@ def _merge_metadata(base_meta: dict, extra: dict) -> dict:
         meta[generic.NameObject(k)] = generic.create_string_object(str(v))
     return meta
 
-def _embed_meta(pdf_bytes: bytes, json_meta: str) -> bytes:
-    reader = PdfReader(BytesIO(pdf_bytes))
-    writer = PdfWriter()
-    for p in reader.pages:
-        writer.add_page(p)
-    writer.add_metadata(_merge_metadata(reader.metadata or {}, {META_KEY: json_meta}))
+# Claves que pone el sello; las que vengan en los metadatos del usuario se descartan
+CLAVES_RESERVADAS = frozenset({"id", "uploaded_at", "verify_url", "signature", "kid",
+                               "content_sha256", "content_length", "merkle"})
+
+def _meta_base(user_meta: Dict[str, Any], base_url: str) -> Dict[str, Any]:
+    """Metadatos del sello con id nuevo y la firma como marcador."""
+    doc_id = str(uuid.uuid4())
+    return {
+        **{k: v for k, v in user_meta.items() if k not in CLAVES_RESERVADAS},
+        "id": doc_id,
+        "uploaded_at": _utc_iso(),
+        "verify_url": f"{base_url}{doc_id}",
+        "signature": SIGN_PLACEHOLDER
+    }
+
+def _json_canonico(meta: Dict[str, Any]) -> bytes:
+    return json.dumps(meta, separators=(",", ":")).encode()
+
+class _SalidaConHash:
+    """
+    Envuelve el archivo de salida y calcula el SHA-256 de lo que se escribe.
+    resumen() se puede pedir a mitad de escritura (p. ej. al terminar el cuerpo).
+    """
+
+    def __init__(self, salida):
+        self.salida = salida
+        self._hash = sha256()
+        self.escritos = 0
+
+    def write(self, datos) -> int:
+        self._hash.update(datos)
+        self.escritos += len(datos)
+        return self.salida.write(datos)
+
+    def tell(self) -> int:
+        return self.salida.tell()
+
+    def resumen(self) -> str:
+        return self._hash.copy().hexdigest()
+
+def _firmar(meta: Dict[str, Any], private_key) -> None:
+    """
+    Firma `meta` en su lugar (el hash se calcula con el marcador de firma y
+    el kid de la llave ya incluidos).
+    """
+    meta["kid"] = kid(private_key)
+    meta["signature"] = SIGN_PLACEHOLDER
+    h = sha256(_json_canonico(meta)).digest()
+    meta["signature"] = base64.b64encode(firmar_hash(h, private_key)).decode()
+
+def cuerpo_segun_perfil(pdf_original, perfil: str = "incremental"):
+    """
+    Cuerpo que se sella con `perfil`: el original (bytes o mmap) o su
+    versión compacta. Se sella el original si pasa de compacto.MAX_ENTRADA
+    (la compactación es en memoria), si compactar no lo achica o si no se
+    puede (cifrado, dañado, con referencias que no se resuelven).
+    """
+    if perfil not in PERFILES:
+        raise ValueError(f"perfil desconocido: {perfil!r}")
+    if perfil == "incremental" or len(pdf_original) > compacto.MAX_ENTRADA:
+        return pdf_original
+    try:
+        with metricas.etapa("compactar"):
+            compactado = compacto.compactar(pdf_original)
+    except (ValueError, PdfReadError, PyPdfError):
+        return pdf_original
+    return compactado if len(compactado) < len(pdf_original) else pdf_original
+
+def campos_contenido(pdf_original) -> Optional[Dict[str, Any]]:
+    """
+    content_sha256/content_length del cuerpo original (bytes o mmap), o
+    None si el documento no admite actualización incremental: en ese caso
+    el sello re-escribe el PDF y el original no queda como prefijo.
+    """
+    try:
+        ActualizacionIncremental(pdf_original)
+    except (ValueError, PdfReadError):
+        return None
+    return {
+        "content_sha256": calcular_hash(bloques(pdf_original)).hex(),
+        "content_length": len(pdf_original),
+    }
+
+def escribir_sellado(salida, pdf_original, meta: Dict[str, Any], private_key=None,
+                     perfil: str = "incremental") -> str:
+    """
+    Escribe en el archivo binario `salida` el PDF original (bytes o mmap)
+    con la portada QR y /CM_META. Devuelve el SHA-256 hexadecimal de todo
+    lo escrito. Con perfil="compacto" el cuerpo es la versión compacta del
+    original y content_sha256/content_length se refieren a ella.
+
+    El cuerpo original se copia por bloques y se hashea al vuelo. Con
+    `private_key`, `meta` recibe content_sha256/content_length y se firma
+    después de copiar el cuerpo; sin ella `meta` ya viene firmado (lotes)
+    y, si declara contenido, debe coincidir con el del documento.
+    """
+    # ReportLab y qrcode sólo hacen falta para sellar: una réplica que sólo
+    # verifica nunca los importa
+    from sello_monarca.qr_handler import generar_pagina_qr_bytes
+    entrada = pdf_original
+    pdf_original = cuerpo_segun_perfil(pdf_original, perfil)
+    with metricas.etapa("portada"):
+        qr_pdf_bytes = generar_pagina_qr_bytes(meta["verify_url"], meta["id"])
+    out = _SalidaConHash(salida)
+    try:
+        with metricas.etapa("parseo"):
+            act = preparar_pagina(pdf_original, qr_pdf_bytes)
+    except (ValueError, PdfReadError):
+        act = None
+
+    if act is None:
+        # PDFs cifrados o con xref dañada: se re-escriben completos, sin
+        # content_sha256 (el original no queda como prefijo del resultado)
+        if "content_sha256" in meta:
+            raise ValueError("El documento no admite sello incremental")
+        if private_key is not None:
+            with metricas.etapa("firma"):
+                _firmar(meta, private_key)
+        with metricas.etapa("reescritura"):
+            _sellar_reescritura(pdf_original, qr_pdf_bytes, json.dumps(meta, separators=(",", ":")), out)
+        _observar_tamanos(entrada, out, None)
+        return out.resumen()
+
+    # Una sola sección incremental: /CM_META + página QR tras los bytes originales
+    with metricas.etapa("copia_cuerpo"):
+        for bloque in bloques(pdf_original):
+            out.write(bloque)
+    contenido = {"content_sha256": out.resumen(), "content_length": len(pdf_original)}
+    if private_key is not None:
+        meta.update(contenido)
+        with metricas.etapa("firma"):
+            _firmar(meta, private_key)
+    elif "content_sha256" in meta and any(meta.get(k) != v for k, v in contenido.items()):
+        raise ValueError("El contenido del documento no coincide con el sello")
+    with metricas.etapa("incrustar_meta"):
+        act.actualizar_info({META_KEY: json.dumps(meta, separators=(",", ":"))})
+        out.write(act.serializar())
+    _observar_tamanos(entrada, out, act)
+    return out.resumen()
+
+def _observar_tamanos(pdf_original, out: _SalidaConHash, act: Optional[ActualizacionIncremental]) -> None:
+    if not metricas.activo():
+        return
+    metricas.observar("sello_entrada_bytes", len(pdf_original), operacion="sellar")
+    metricas.observar("sello_salida_bytes", out.escritos, operacion="sellar")
+    if act is not None:
+        # /Count del árbol original: reader.pages recorrería todo el árbol
+        paginas = act.reader.trailer["/Root"]["/Pages"]["/Count"]
+        metricas.observar("sello_paginas", int(paginas), operacion="sellar")
+
+def incrustar(pdf_original: bytes, meta_firmada: Dict[str, Any]) -> bytes:
+    """Anexa la portada con QR y /CM_META ya firmado al PDF original."""
     out = BytesIO()
-    writer.write(out)
+    escribir_sellado(out, pdf_original, meta_firmada)
     return out.getvalue()
 
 def sell(pdf_original: bytes,
          user_meta: Dict[str, Any],
          private_key,
-         base_url: str = "https://mi-app.com/v/") -> Tuple[bytes, str]:
-    doc_id = str(uuid.uuid4())
-    verify_url = f"{base_url}{doc_id}"
+         base_url: str = "https://mi-app.com/v/",
+         perfil: str = "incremental") -> Tuple[bytes, str]:
+    meta = _meta_base(user_meta, base_url)
+    out = BytesIO()
+    escribir_sellado(out, pdf_original, meta, private_key, perfil)
+    return out.getvalue(), meta["id"]
 
-    meta = {
-        **user_meta,
-        "id": doc_id,
-        "uploaded_at": _utc_iso(),
-        "verify_url": verify_url,
-        "signature": SIGN_PLACEHOLDER
-    }
-    meta_json = json.dumps(meta, separators=(",", ":"))
-    h = sha256(meta_json.encode()).digest()
-    signature = firmar_hash(h, private_key)
-    meta["signature"] = base64.b64encode(signature).decode()
-    meta_json_signed = json.dumps(meta, separators=(",", ":"))
-
-    pdf_meta = _embed_meta(pdf_original, meta_json_signed)
-
-    qr_pdf_bytes = generar_pagina_qr_bytes(verify_url)
-    qr_reader = PdfReader(BytesIO(qr_pdf_bytes))
-    reader_final = PdfReader(BytesIO(pdf_meta))
-    writer_final = PdfWriter()
-    for p in reader_final.pages:
-        writer_final.add_page(p)
-    writer_final.add_page(qr_reader.pages[0])           # página del QR
-    writer_final.add_metadata(reader_final.metadata)    # conserva metadatos
+def sellar_en(fuente, salida,
+              user_meta: Dict[str, Any],
+              private_key,
+              base_url: str = "https://mi-app.com/v/",
+              perfil: str = "incremental") -> Tuple[str, str]:
+    """
+    sell() sin tener el documento en memoria: `fuente` puede ser bytes, una
+    ruta o un archivo (se mapea con mmap) y el resultado se escribe en el
+    archivo binario `salida`. Devuelve (doc_id, SHA-256 del archivo escrito).
+    """
+    meta = _meta_base(user_meta, base_url)
+    with abrir_pdf(fuente) as data:
+        sha_archivo = escribir_sellado(salida, data, meta, private_key, perfil)
+    return meta["id"], sha_archivo
+
+def firmar_lote(user_metas: List[Dict[str, Any]], private_key,
+                base_url: str = "https://mi-app.com/v/",
+                contenidos: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[Dict[str, Any]]:
+    """
+    Metadatos firmados para un lote con una sola operación ECDSA: se firma
+    la raíz de Merkle de los /CM_META (con el marcador de firma) y cada
+    documento lleva su prueba de inclusión en meta["merkle"].
+    - contenidos: campos_contenido() de cada documento, para que el sello
+      de lote también cubra el cuerpo original.
+    """
+    metas = [_meta_base(m, base_url) for m in user_metas]
+    for meta, contenido in zip(metas, contenidos or []):
+        if contenido:
+            meta.update(contenido)
+    for meta in metas:
+        meta["kid"] = kid(private_key)
+    raiz, pruebas = merkle.construir([merkle.hash_hoja(_json_canonico(m)) for m in metas])
+    signature = base64.b64encode(firmar_hash(raiz, private_key)).decode()
+    lote_id = str(uuid.uuid4())
+    for meta, prueba in zip(metas, pruebas):
+        meta["signature"] = signature
+        meta["merkle"] = {
+            "root": raiz.hex(),
+            "proof": prueba,
+            "batch_id": lote_id,
+            "batch_size": len(metas),
+        }
+    return metas
 
+def sell_batch(documentos: List[Tuple[bytes, Dict[str, Any]]],
+               private_key,
+               base_url: str = "https://mi-app.com/v/",
+               perfil: str = "incremental") -> List[Tuple[bytes, str]]:
+    """sell() para varios PDFs con una sola firma (ver firmar_lote)."""
+    documentos = [(cuerpo_segun_perfil(pdf, perfil), m) for pdf, m in documentos]
+    contenidos = [campos_contenido(pdf) for pdf, _ in documentos]
+    metas = firmar_lote([m for _, m in documentos], private_key, base_url, contenidos)
+    return [(incrustar(pdf, meta), meta["id"]) for (pdf, _), meta in zip(documentos, metas)]
+
+def _sellar_reescritura(pdf_original, qr_pdf_bytes: bytes, meta_json: str, salida=None):
+    """
+    Ruta de respaldo: re-escribe el documento completo en una sola pasada.
+    Devuelve los bytes, o escribe en `salida` si se indica.
+    """
+    reader = PdfReader(pdf_original if isinstance(pdf_original, mmap.mmap) else BytesIO(pdf_original))
+    writer = PdfWriter()
+    for p in reader.pages:
+        writer.add_page(p)
+    writer.add_page(PdfReader(BytesIO(qr_pdf_bytes)).pages[0])    # página del QR
+    writer.add_metadata(_merge_metadata(reader.metadata or {}, {META_KEY: meta_json}))
+
+    if salida is not None:
+        writer.write(salida)
+        return None
     out = BytesIO()
-    writer_final.write(out)
-    return out.getvalue(), doc_id
+    writer.write(out)
+    return out.getvalue()
 
-def verify(pdf_bytes: bytes, public_key) -> Tuple[bool, Dict[str, Any]]:
-    reader = PdfReader(BytesIO(pdf_bytes))
-    meta_raw = reader.metadata.get(META_KEY, "{}")
-    meta = json.loads(str(meta_raw))
+def leer_meta_json(pdf) -> str:
+    """
+    Texto de /CM_META. Primero se lee sólo la cola del PDF (lector_rapido);
+    si el objeto no se puede resolver así, se usa PdfReader completo.
+    """
+    try:
+        return leer_meta(pdf, META_KEY) or "{}"
+    except Exception:               # cualquier falla de la vía rápida: la lectura completa decide
+        with abrir_pdf(pdf) as data:
+            reader = PdfReader(data if isinstance(data, mmap.mmap) else BytesIO(data))
+            return str((reader.metadata or {}).get(META_KEY, "{}"))
 
+def verificar_meta(meta: Dict[str, Any], public_key) -> bool:
+    """
+    Verifica la firma ECDSA de un diccionario de metadatos ya extraído.
+    Deja meta["signature"] con el marcador, como al momento de firmar.
+    Acepta sellos individuales y sellos de lote (meta["merkle"]).
+    - public_key: una llave pública o un RegistroLlaves (se elige por el
+      "kid" del sello).
+    """
     sig_b64 = meta.get("signature", "")
     if sig_b64 in ("", SIGN_PLACEHOLDER):
-        return False, meta
+        return False
 
     signature = base64.b64decode(sig_b64)
     meta["signature"] = SIGN_PLACEHOLDER
-    meta_json = json.dumps(meta, separators=(",", ":")).encode()
-    h = sha256(meta_json).digest()
-    valido = verificar_firma(h, signature, public_key)
+    if isinstance(public_key, RegistroLlaves):
+        llaves = public_key.candidatas(meta)
+    else:
+        llaves = [public_key]
+    lote = meta.get("merkle")
+    if lote is None:
+        h = sha256(_json_canonico(meta)).digest()
+        return any(verificar_firma(h, signature, llave) for llave in llaves)
+
+    # Sello de lote: la hoja es el JSON sin "merkle"; la firma cubre la raíz
+    try:
+        sin_lote = {k: v for k, v in meta.items() if k != "merkle"}
+        raiz = merkle.raiz_desde_prueba(merkle.hash_hoja(_json_canonico(sin_lote)), lote["proof"])
+        if raiz.hex() != lote["root"]:
+            return False
+    except (ValueError, KeyError, TypeError):
+        return False
+    return any(verificar_firma(raiz, signature, llave) for llave in llaves)
+
+def verificar_contenido(pdf, meta: Dict[str, Any], sha_archivo: Optional[str] = None) -> bool:
+    """
+    Comprueba que el PDF es el cuerpo sellado (content_sha256 de sus primeros
+    content_length bytes) seguido sólo de la sección del sello: una página
+    más y un /Info nuevo. Recorre el archivo completo una vez.
+    - sha_archivo: SHA-256 del PDF tal como se guardó al sellar (índice);
+      si coincide con el del archivo recibido no hace falta revisar la
+      sección anexada.
+    Los sellos sin content_sha256 (anteriores, o de PDFs que hubo que
+    re-escribir) no pasan esta verificación.
+    """
+    try:
+        largo = int(meta["content_length"])
+        esperado = str(meta["content_sha256"])
+    except (KeyError, TypeError, ValueError):
+        return False
+    with abrir_pdf(pdf) as data:
+        if not 0 < largo < len(data):
+            return False
+        h = sha256()
+        for bloque in bloques(data, fin=largo):
+            h.update(bloque)
+        if h.hexdigest() != esperado:
+            return False
+        if sha_archivo:
+            with memoryview(data) as vista, vista[largo:] as seccion:
+                h.update(seccion)
+            if h.hexdigest() == sha_archivo:
+                return True
+        try:
+            return solo_anexa_pagina_e_info(data, largo)
+        except (ValueError, KeyError, TypeError, AttributeError, PyPdfError):
+            return False
+
+def refirmar_en(fuente, salida, private_key, public_key) -> Tuple[Dict[str, Any], str]:
+    """
+    Vuelve a firmar el /CM_META de un PDF ya sellado con `private_key` (p. ej.
+    tras rotar la llave). Copia el PDF tal cual a `salida` y le anexa una
+    sección incremental que sólo reemplaza /Info: la portada QR y el cuerpo
+    no cambian, y content_sha256/content_length siguen valiendo.
+    - public_key: llave o RegistroLlaves con que se comprueba antes la firma
+      actual; ValueError si no es válida (no se re-firma un sello alterado).
+    Un sello de lote queda como sello individual. Devuelve (meta nueva,
+    SHA-256 del archivo escrito).
+    """
+    with abrir_pdf(fuente) as data:
+        meta = json.loads(leer_meta_json(data))
+        actual = dict(meta)
+        if not verificar_meta(actual, public_key):
+            raise ValueError("La firma actual del documento no es válida")
+        nueva = {k: v for k, v in meta.items() if k != "merkle"}
+        _firmar(nueva, private_key)
+        act = ActualizacionIncremental(data)
+        act.actualizar_info({META_KEY: json.dumps(nueva, separators=(",", ":"))})
+        out = _SalidaConHash(salida)
+        for bloque in bloques(data):
+            out.write(bloque)
+        out.write(act.serializar())
+    return nueva, out.resumen()
+
+def verify(pdf, public_key, contenido: bool = False,
+           sha_archivo: Optional[str] = None) -> Tuple[bool, Dict[str, Any]]:
+    """
+    Verifica un PDF sellado. `pdf` puede ser bytes, mmap, una ruta o un
+    archivo binario abierto; `public_key` una llave o un RegistroLlaves.
+    - contenido=False: sólo la firma de /CM_META (se lee el diccionario /Info).
+    - contenido=True: además verificar_contenido(), que lee el archivo completo.
+    """
+    with metricas.etapa("leer_meta"):
+        meta = json.loads(leer_meta_json(pdf))
+    with metricas.etapa("verificar_firma"):
+        valido = verificar_meta(meta, public_key)
+    if valido and contenido:
+        with metricas.etapa("verificar_contenido"):
+            valido = verificar_contenido(pdf, meta, sha_archivo)
     return valido, meta
@@ -0,0 +1,492 @@
+# sello_monarca/sharepoint.py
+"""
+Publicación en SharePoint de los PDFs sellados (biblioteca SP_DOC_LIB) y
+de su fila de metadatos (lista SP_LIST), fuera del camino de la petición.
+
+- SalidaSharePoint: bandeja de salida en SQLite. app.py encola el doc_id
+  con su fila del índice al sellar; un hilo toma lotes, sube los PDFs en
+  paralelo y crea los elementos de la lista en una sola petición $batch
+  (hasta 20 por petición). Lo que falla se reintenta con backoff
+  exponencial y queda en "error" tras max_intentos. Un PDF ya subido no
+  se vuelve a subir si sólo falló su elemento de la lista.
+- ClienteGraph: conexiones HTTP keep-alive reutilizadas (un pool por
+  host), token de client credentials en caché y reintentos de 429/5xx
+  respetando Retry-After.
+- DestinoGraph: Microsoft Graph. SP_SITE es el id del sitio, SP_DOC_LIB
+  el id de la biblioteca (drive) y SP_LIST el id o nombre de la lista.
+- DestinoArchivos: sustituto local (directorio + lista.jsonl) con fallos
+  inyectables, para probar sin conexión. benchmarks/bench_sharepoint.py
+  levanta además un servidor Graph falso para medir ClienteGraph.
+"""
+from __future__ import annotations
+import http.client, json, os, queue, random, shutil, sqlite3, threading, time, traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlencode, urlsplit
+
+SUBIR, LISTA, LISTO, ERROR = "subir", "lista", "listo", "error"
+
+GRAPH_URL = "https://graph.microsoft.com/v1.0"
+_BLOQUE = 1024 * 1024
+_MAX_BATCH = 20                         # límite de Graph por petición $batch
+_REINTENTABLES = {429, 500, 502, 503, 504}
+
+# Columna de la lista <- campo de la fila del índice (o de su meta_json)
+CAMPOS_LISTA = {
+    "Title": "original_filename",
+    "DocId": "doc_id",
+    "Uploader": "uploader",
+    "Area": "area",
+    "UploadedAt": "uploaded_at",
+    "Sha256": "sha256",
+    "VerifyUrl": "verify_url",
+    "ArchivoUrl": "archivo_url",
+}
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS salida_sp (
+    doc_id      TEXT PRIMARY KEY,
+    estado      TEXT NOT NULL,
+    fila        TEXT NOT NULL,
+    archivo_url TEXT,
+    intentos    INTEGER NOT NULL DEFAULT 0,
+    proximo     REAL NOT NULL,
+    actualizado REAL NOT NULL,
+    error       TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_salida_sp_estado ON salida_sp (estado, proximo);
+"""
+
+
+class ErrorSharePoint(Exception):
+    """Fallo de SharePoint/Graph; `reintentable` indica si vale la pena repetir."""
+
+    def __init__(self, mensaje: str, reintentable: bool = True):
+        super().__init__(mensaje)
+        self.reintentable = reintentable
+
+
+def _espera(intento: int, base: float, maximo: float) -> float:
+    """Backoff exponencial con jitter (entre la mitad y el total)."""
+    return min(base * 2 ** intento, maximo) * (0.5 + random.random() / 2)
+
+
+# ------------------------------------------------------------------
+# HTTP
+# ------------------------------------------------------------------
+class ClienteGraph:
+    """Cliente HTTP mínimo para Graph sobre http.client con conexiones reutilizadas."""
+
+    def __init__(self, tenant_id: str, client_id: str, client_secret: str,
+                 base_url: str = GRAPH_URL, token_url: Optional[str] = None,
+                 timeout: float = 60.0, reintentos: int = 4, espera_base: float = 0.5):
+        self.base_url = base_url.rstrip("/")
+        self.token_url = token_url or f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self._pools: Dict[Tuple[str, str], "queue.LifoQueue"] = {}
+        self._lock = threading.Lock()
+        self._token: Optional[str] = None
+        self._token_expira = 0.0
+        self._estadisticas = {"peticiones": 0, "conexiones": 0, "reintentos": 0}
+
+    @property
+    def estadisticas(self) -> Dict[str, int]:
+        """Copia de los contadores (los actualizan varios hilos de subida)."""
+        with self._lock:
+            return dict(self._estadisticas)
+
+    def _contar(self, clave: str) -> None:
+        with self._lock:
+            self._estadisticas[clave] += 1
+
+    # -------- conexiones --------
+    @contextmanager
+    def _conexion(self, esquema: str, host: str):
+        with self._lock:
+            pool = self._pools.setdefault((esquema, host), queue.LifoQueue())
+        try:
+            con = pool.get_nowait()
+        except queue.Empty:
+            clase = http.client.HTTPSConnection if esquema == "https" else http.client.HTTPConnection
+            con = clase(host, timeout=self.timeout, blocksize=_BLOQUE)
+            self._contar("conexiones")
+        try:
+            yield con
+        except BaseException:
+            con.close()                 # estado desconocido: no se reutiliza
+            raise
+        pool.put(con)
+
+    def _enviar(self, metodo: str, url: str, cuerpo, cabeceras: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        partes = urlsplit(url)
+        ruta = partes.path + (f"?{partes.query}" if partes.query else "")
+        with self._conexion(partes.scheme, partes.netloc) as con:
+            self._contar("peticiones")
+            con.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+            resp = con.getresponse()
+            datos = resp.read()         # se lee completa para poder reutilizar la conexión
+            if resp.will_close:
+                con.close()
+            return resp.status, {k.lower(): v for k, v in resp.getheaders()}, datos
+
+    # -------- token --------
+    def _obtener_token(self, renovar: bool = False) -> str:
+        with self._lock:
+            if self._token and not renovar and time.time() < self._token_expira:
+                return self._token
+        cuerpo = urlencode({
+            "grant_type": "client_credentials",
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "scope": "https://graph.microsoft.com/.default",
+        })
+        datos = self.json("POST", self.token_url, cuerpo,
+                          {"Content-Type": "application/x-www-form-urlencoded"}, auth=False)
+        with self._lock:
+            self._token = datos["access_token"]
+            self._token_expira = time.time() + int(datos.get("expires_in", 3600)) - 60
+            return self._token
+
+    # -------- API --------
+    def solicitar(self, metodo: str, url: str, cuerpo=None,
+                  cabeceras: Optional[Dict[str, str]] = None,
+                  auth: bool = True) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        Petición con reintentos de errores de red, 429 y 5xx. `url` puede ser
+        relativa a base_url. Un `cuerpo` archivo se rebobina en cada intento.
+        """
+        if url.startswith("/"):
+            url = self.base_url + url
+        cabeceras = dict(cabeceras or {})
+        inicio = cuerpo.tell() if hasattr(cuerpo, "seek") else None
+        renovado = False
+        for intento in range(self.reintentos + 1):
+            if auth:
+                cabeceras["Authorization"] = "Bearer " + self._obtener_token()
+            if inicio is not None:
+                cuerpo.seek(inicio)
+            try:
+                status, encabezados, datos = self._enviar(metodo, url, cuerpo, cabeceras)
+            except (OSError, http.client.HTTPException) as e:
+                status, encabezados, datos = None, {}, str(e).encode()
+            if status == 401 and auth and not renovado:
+                self._obtener_token(renovar=True)
+                renovado = True
+                continue
+            if status is not None and status not in _REINTENTABLES:
+                return status, encabezados, datos
+            if intento == self.reintentos:
+                break
+            self._contar("reintentos")
+            retry_after = encabezados.get("retry-after", "")
+            time.sleep(float(retry_after) if retry_after.isdigit()
+                       else _espera(intento, self.espera_base, 30.0))
+        raise ErrorSharePoint(f"{metodo} {url}: {status or 'sin respuesta'} {datos[:200]!r}")
+
+    def json(self, metodo: str, url: str, datos=None,
+             cabeceras: Optional[Dict[str, str]] = None, auth: bool = True) -> Dict[str, Any]:
+        """solicitar() que envía/recibe JSON y lanza ErrorSharePoint si status >= 400."""
+        cabeceras = dict(cabeceras or {})
+        if isinstance(datos, (dict, list)):
+            datos = json.dumps(datos).encode()
+            cabeceras.setdefault("Content-Type", "application/json")
+        status, _, cuerpo = self.solicitar(metodo, url, datos, cabeceras, auth)
+        if status >= 400:
+            raise ErrorSharePoint(f"{metodo} {url}: {status} {cuerpo[:200]!r}",
+                                  reintentable=status in _REINTENTABLES)
+        return json.loads(cuerpo) if cuerpo else {}
+
+    def cerrar(self) -> None:
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            while not pool.empty():
+                pool.get_nowait().close()
+
+
+# ------------------------------------------------------------------
+# Destinos
+# ------------------------------------------------------------------
+def _campos(fila: Dict[str, Any], campos: Dict[str, str]) -> Dict[str, Any]:
+    meta = json.loads(fila.get("meta_json") or "{}")
+    return {columna: fila[campo] if fila.get(campo) is not None else meta.get(campo)
+            for columna, campo in campos.items()
+            if fila.get(campo) is not None or meta.get(campo) is not None}
+
+
+class DestinoGraph:
+    """Biblioteca y lista de un sitio de SharePoint vía Microsoft Graph."""
+
+    def __init__(self, cliente: ClienteGraph, sitio: str, biblioteca: str, lista: str,
+                 carpeta: str = "", campos: Optional[Dict[str, str]] = None,
+                 subida_simple_max: int = 4 * _BLOQUE, trozo: int = 5 * _BLOQUE):
+        if trozo % (320 * 1024):
+            raise ValueError("trozo debe ser múltiplo de 320 KiB (requisito de Graph)")
+        self.cliente = cliente
+        self.sitio = sitio
+        self.biblioteca = biblioteca
+        self.lista = lista
+        self.carpeta = carpeta.strip("/")
+        self.campos = campos or CAMPOS_LISTA
+        self.subida_simple_max = subida_simple_max
+        self.trozo = trozo
+
+    def subir(self, nombre: str, archivo, tamano: int) -> str:
+        """Sube el PDF (archivo binario abierto) y devuelve su webUrl."""
+        ruta = quote(f"{self.carpeta}/{nombre}" if self.carpeta else nombre)
+        item = f"/sites/{self.sitio}/drives/{self.biblioteca}/root:/{ruta}:"
+        if tamano <= self.subida_simple_max:
+            r = self.cliente.json("PUT", item + "/content", archivo, {
+                "Content-Type": "application/pdf", "Content-Length": str(tamano)})
+            return r.get("webUrl") or r.get("id", "")
+
+        # Archivos grandes: sesión de carga por trozos
+        sesion = self.cliente.json("POST", item + "/createUploadSession",
+                                   {"item": {"@microsoft.graph.conflictBehavior": "replace"}})
+        r: Dict[str, Any] = {}
+        for inicio in range(0, tamano, self.trozo):
+            datos = archivo.read(self.trozo)
+            fin = inicio + len(datos) - 1
+            r = self.cliente.json("PUT", sesion["uploadUrl"], datos, {
+                "Content-Length": str(len(datos)),
+                "Content-Range": f"bytes {inicio}-{fin}/{tamano}"}, auth=False)
+        return r.get("webUrl") or r.get("id", "")
+
+    def crear_elementos(self, filas: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """Crea un elemento por fila; devuelve el error de cada una (None si se creó)."""
+        errores: List[Optional[str]] = [None] * len(filas)
+        url = f"/sites/{self.sitio}/lists/{self.lista}/items"
+        for i in range(0, len(filas), _MAX_BATCH):
+            grupo = filas[i:i + _MAX_BATCH]
+            peticiones = [{
+                "id": str(j), "method": "POST", "url": url,
+                "headers": {"Content-Type": "application/json"},
+                "body": {"fields": _campos(fila, self.campos)},
+            } for j, fila in enumerate(grupo)]
+            try:
+                r = self.cliente.json("POST", "/$batch", {"requests": peticiones})
+            except ErrorSharePoint as e:
+                errores[i:i + len(grupo)] = [str(e)] * len(grupo)
+                continue
+            for resp in r.get("responses", []):
+                if int(resp.get("status", 500)) >= 400:
+                    mensaje = (resp.get("body") or {}).get("error", {}).get("message", "")
+                    errores[i + int(resp["id"])] = f"{resp['status']} {mensaje}".strip()
+        return errores
+
+
+class DestinoArchivos:
+    """
+    Sustituto local: los PDFs se copian a <directorio>/biblioteca y cada
+    elemento se agrega como una línea de <directorio>/lista.jsonl.
+    - fallos: probabilidad de que cada operación falle (prueba de reintentos)
+    - latencia: segundos que tarda cada operación (prueba de rendimiento)
+    """
+
+    def __init__(self, directorio: str, campos: Optional[Dict[str, str]] = None,
+                 fallos: float = 0.0, latencia: float = 0.0):
+        self.directorio = directorio
+        self.campos = campos or CAMPOS_LISTA
+        self.fallos = fallos
+        self.latencia = latencia
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directorio, "biblioteca"), exist_ok=True)
+
+    def _simular(self, operacion: str) -> None:
+        if self.latencia:
+            time.sleep(self.latencia)
+        if self.fallos and random.random() < self.fallos:
+            raise ErrorSharePoint(f"{operacion}: fallo simulado")
+
+    def subir(self, nombre: str, archivo, tamano: int) -> str:
+        self._simular("subir")
+        destino = os.path.join(self.directorio, "biblioteca", os.path.basename(nombre))
+        with open(destino + ".tmp", "wb") as f:
+            shutil.copyfileobj(archivo, f, _BLOQUE)
+        os.replace(destino + ".tmp", destino)
+        return "file://" + os.path.abspath(destino)
+
+    def crear_elementos(self, filas: List[Dict[str, Any]]) -> List[Optional[str]]:
+        errores: List[Optional[str]] = []
+        lineas = []
+        for fila in filas:
+            try:
+                self._simular("lista")
+            except ErrorSharePoint as e:
+                errores.append(str(e))
+                continue
+            errores.append(None)
+            lineas.append(json.dumps({"fields": _campos(fila, self.campos)}, ensure_ascii=False) + "\n")
+        with self._lock, open(os.path.join(self.directorio, "lista.jsonl"), "a", encoding="utf-8") as f:
+            f.writelines(lineas)
+        return errores
+
+
+# ------------------------------------------------------------------
+# Bandeja de salida
+# ------------------------------------------------------------------
+class SalidaSharePoint:
+    """
+    `abrir(doc_id) -> (archivo, tamano)` entrega el PDF (p. ej. desde el
+    almacén); `destino` es un DestinoGraph o DestinoArchivos.
+    """
+
+    def __init__(self, ruta_db: str, destino, abrir: Callable[[str], Tuple[Any, int]],
+                 lote: int = 20, paralelo: int = 4, max_intentos: int = 8,
+                 espera_base: float = 5.0, espera_max: float = 3600.0, concesion: float = 600.0):
+        self.ruta_db = ruta_db
+        self.destino = destino
+        self.abrir = abrir
+        self.lote = lote
+        self.paralelo = max(paralelo, 1)
+        self.max_intentos = max_intentos
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        self.concesion = concesion
+        self._local = threading.local()
+        self._aviso = threading.Event()
+        self._parar = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        self._subidas: Optional[ThreadPoolExecutor] = None
+        os.makedirs(os.path.dirname(os.path.abspath(ruta_db)), exist_ok=True)
+        self._conexion().executescript(_ESQUEMA)
+
+    def _conexion(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.ruta_db, timeout=30, isolation_level=None)
+            con.row_factory = sqlite3.Row
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    # -------- API --------
+    def encolar(self, filas: List[Dict[str, Any]]) -> None:
+        """Encola documentos ya guardados (filas del índice, ver indice.fila_de_pdf)."""
+        ahora = time.time()
+        self._conexion().executemany(
+            "INSERT OR IGNORE INTO salida_sp (doc_id, estado, fila, proximo, actualizado) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(f["doc_id"], SUBIR, json.dumps(f), ahora, ahora) for f in filas],
+        )
+        self._aviso.set()
+
+    def estado(self) -> Dict[str, int]:
+        """Cantidad de documentos por estado."""
+        return {f[0]: f[1] for f in self._conexion().execute(
+            "SELECT estado, COUNT(*) FROM salida_sp GROUP BY estado")}
+
+    # -------- procesamiento --------
+    def _reclamar(self) -> List[sqlite3.Row]:
+        con = self._conexion()
+        ahora = time.time()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            filas = con.execute(
+                "SELECT doc_id, estado, fila, archivo_url, intentos FROM salida_sp "
+                "WHERE estado IN (?, ?) AND proximo <= ? ORDER BY proximo LIMIT ?",
+                (SUBIR, LISTA, ahora, self.lote),
+            ).fetchall()
+            # Concesión: si este proceso muere, otro los retoma al vencer
+            con.executemany("UPDATE salida_sp SET proximo = ? WHERE doc_id = ?",
+                            [(ahora + self.concesion, f["doc_id"]) for f in filas])
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        return filas
+
+    def _fallo(self, doc_id: str, intentos: int, error: str, reintentable: bool = True) -> None:
+        intentos += 1
+        if reintentable and intentos < self.max_intentos:
+            self._conexion().execute(
+                "UPDATE salida_sp SET intentos = ?, proximo = ?, actualizado = ?, error = ? WHERE doc_id = ?",
+                (intentos, time.time() + _espera(intentos - 1, self.espera_base, self.espera_max),
+                 time.time(), error, doc_id))
+        else:
+            self._conexion().execute(
+                "UPDATE salida_sp SET estado = ?, intentos = ?, actualizado = ?, error = ? WHERE doc_id = ?",
+                (ERROR, intentos, time.time(), error, doc_id))
+
+    def _subir(self, fila: sqlite3.Row) -> str:
+        archivo, tamano = self.abrir(fila["doc_id"])
+        with archivo:
+            return self.destino.subir(f"{fila['doc_id']}.pdf", archivo, tamano)
+
+    def procesar_lote(self) -> int:
+        """Procesa un lote; devuelve cuántos documentos se tomaron."""
+        filas = self._reclamar()
+        if not filas:
+            return 0
+
+        # 1) PDFs pendientes, en paralelo (cada hilo reutiliza conexiones del cliente)
+        urls = {f["doc_id"]: f["archivo_url"] for f in filas if f["estado"] == LISTA}
+        por_subir = [f for f in filas if f["estado"] == SUBIR]
+        mapa = self._subidas.map if self._subidas else map
+        def subir(fila):
+            try:
+                return fila, self._subir(fila), None
+            except Exception as e:
+                return fila, None, e
+        for fila, url, error in mapa(subir, por_subir):
+            if error is not None:
+                self._fallo(fila["doc_id"], fila["intentos"], f"subir: {error}",
+                            getattr(error, "reintentable", not isinstance(error, FileNotFoundError)))
+                continue
+            urls[fila["doc_id"]] = url
+            self._conexion().execute(
+                "UPDATE salida_sp SET estado = ?, archivo_url = ?, actualizado = ? WHERE doc_id = ?",
+                (LISTA, url, time.time(), fila["doc_id"]))
+
+        # 2) Elementos de la lista en peticiones $batch
+        pendientes = [f for f in filas if f["doc_id"] in urls]
+        datos = [{**json.loads(f["fila"]), "archivo_url": urls[f["doc_id"]]} for f in pendientes]
+        try:
+            errores = self.destino.crear_elementos(datos) if datos else []
+        except Exception as e:
+            errores = [str(e)] * len(datos)
+        ahora = time.time()
+        for fila, error in zip(pendientes, errores):
+            if error:
+                self._fallo(fila["doc_id"], fila["intentos"], f"lista: {error}")
+            else:
+                self._conexion().execute(
+                    "UPDATE salida_sp SET estado = ?, actualizado = ?, error = NULL WHERE doc_id = ?",
+                    (LISTO, ahora, fila["doc_id"]))
+        return len(filas)
+
+    def _bucle(self) -> None:
+        while not self._parar.is_set():
+            try:
+                hubo = self.procesar_lote()
+            except Exception:
+                traceback.print_exc()
+                hubo = 0
+            if not hubo:
+                # Los reintentos vencen con el tiempo: no se espera más que el backoff base
+                self._aviso.wait(timeout=min(5.0, self.espera_base))
+                self._aviso.clear()
+
+    def iniciar(self) -> None:
+        if self._hilo is not None:
+            return
+        self._subidas = ThreadPoolExecutor(self.paralelo, thread_name_prefix="sharepoint")
+        self._hilo = threading.Thread(target=self._bucle, name="sharepoint", daemon=True)
+        self._hilo.start()
+
+    def detener(self) -> None:
+        self._parar.set()
+        self._aviso.set()
+        if self._hilo is not None:
+            self._hilo.join()
+            self._hilo = None
+        if self._subidas is not None:
+            self._subidas.shutdown()
+            self._subidas = None
+        self._parar.clear()
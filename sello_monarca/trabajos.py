@@ -0,0 +1,211 @@
+# sello_monarca/trabajos.py
+"""
+Trabajos de sellado asíncronos (POST /sign-json?async=1, GET /jobs/<id>).
+
+El PDF recibido se escribe en un directorio de spool y el trabajo se
+registra en SQLite; hilos en segundo plano lo toman, llaman a la función
+de procesamiento (sellar + guardar) y guardan el resultado. Como todo el
+estado está en disco, un trabajo sobrevive al reinicio del worker: los
+que quedaron "procesando" con la concesión vencida vuelven a "pendiente".
+
+Varios workers de gunicorn pueden compartir la misma base; cada trabajo
+se reclama dentro de una transacción BEGIN IMMEDIATE.
+"""
+from __future__ import annotations
+import json, os, sqlite3, threading, time, traceback, uuid
+from typing import Any, Callable, Dict, Optional
+
+PENDIENTE, PROCESANDO, LISTO, ERROR = "pendiente", "procesando", "listo", "error"
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    job_id      TEXT PRIMARY KEY,
+    estado      TEXT NOT NULL,
+    creado      REAL NOT NULL,
+    actualizado REAL NOT NULL,
+    intentos    INTEGER NOT NULL DEFAULT 0,
+    user_meta   TEXT NOT NULL,
+    base_url    TEXT NOT NULL,
+    resultado   TEXT,
+    error       TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_trabajos_estado ON trabajos (estado, creado);
+"""
+
+
+class Reintentar(Exception):
+    """La función de procesamiento pide devolver el trabajo a la cola (p. ej. ColaLlena)."""
+
+
+class ColaTrabajos:
+    """
+    `procesar(ruta_pdf, user_meta, base_url) -> dict` hace el trabajo real
+    con el PDF del spool y devuelve un resultado serializable a JSON.
+    """
+
+    def __init__(self, ruta_db: str, spool_dir: str,
+                 procesar: Callable[[str, Dict[str, Any], str], Dict[str, Any]],
+                 hilos: int = 1, concesion: float = 600.0, max_intentos: int = 3,
+                 retencion: float = 7 * 24 * 3600):
+        self.ruta_db = ruta_db
+        self.spool_dir = spool_dir
+        self.procesar = procesar
+        self.hilos = max(hilos, 1)
+        self.concesion = concesion
+        self.max_intentos = max_intentos
+        self.retencion = retencion
+        self._local = threading.local()
+        self._aviso = threading.Event()
+        self._parar = threading.Event()
+        self._hilos: list = []
+        os.makedirs(spool_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(ruta_db)), exist_ok=True)
+        self._conexion().executescript(_ESQUEMA)
+
+    def _conexion(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            # isolation_level=None: las transacciones se abren a mano
+            con = sqlite3.connect(self.ruta_db, timeout=30, isolation_level=None)
+            con.row_factory = sqlite3.Row
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def _ruta_spool(self, job_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{job_id}.pdf")
+
+    # -------- API --------
+    def encolar(self, pdf, user_meta: Dict[str, Any], base_url: str) -> str:
+        """
+        `pdf` son los bytes del documento o la ruta de un archivo ya escrito
+        (se mueve al spool; debe estar en el mismo sistema de archivos).
+        """
+        job_id = str(uuid.uuid4())
+        ruta = self._ruta_spool(job_id)
+        if isinstance(pdf, (str, os.PathLike)):
+            os.replace(pdf, ruta)
+        else:
+            with open(ruta + ".tmp", "wb") as f:
+                f.write(pdf)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(ruta + ".tmp", ruta)
+
+        ahora = time.time()
+        self._conexion().execute(
+            "INSERT INTO trabajos (job_id, estado, creado, actualizado, user_meta, base_url) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, PENDIENTE, ahora, ahora, json.dumps(user_meta), base_url),
+        )
+        self._aviso.set()
+        return job_id
+
+    def obtener(self, job_id: str) -> Optional[Dict[str, Any]]:
+        fila = self._conexion().execute(
+            "SELECT job_id, estado, creado, actualizado, intentos, resultado, error "
+            "FROM trabajos WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if fila is None:
+            return None
+        datos = dict(fila)
+        datos["resultado"] = json.loads(datos["resultado"]) if datos["resultado"] else None
+        return datos
+
+    # -------- procesamiento --------
+    def _reclamar(self) -> Optional[sqlite3.Row]:
+        con = self._conexion()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            fila = con.execute(
+                "SELECT job_id, user_meta, base_url, intentos FROM trabajos "
+                "WHERE estado = ? OR (estado = ? AND actualizado < ?) "
+                "ORDER BY creado LIMIT 1",
+                (PENDIENTE, PROCESANDO, time.time() - self.concesion),
+            ).fetchone()
+            if fila is not None:
+                con.execute(
+                    "UPDATE trabajos SET estado = ?, actualizado = ?, intentos = intentos + 1 "
+                    "WHERE job_id = ?",
+                    (PROCESANDO, time.time(), fila["job_id"]),
+                )
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        return fila
+
+    def _terminar(self, job_id: str, estado: str, resultado=None, error=None) -> None:
+        self._conexion().execute(
+            "UPDATE trabajos SET estado = ?, actualizado = ?, resultado = ?, error = ? WHERE job_id = ?",
+            (estado, time.time(), json.dumps(resultado) if resultado is not None else None,
+             error, job_id),
+        )
+
+    def procesar_uno(self) -> bool:
+        """Toma y procesa un trabajo. Devuelve False si no había ninguno."""
+        fila = self._reclamar()
+        if fila is None:
+            return False
+        job_id = fila["job_id"]
+        ruta = self._ruta_spool(job_id)
+        try:
+            if fila["intentos"] >= self.max_intentos:
+                raise RuntimeError("Se agotaron los intentos")
+            resultado = self.procesar(ruta, json.loads(fila["user_meta"]), fila["base_url"])
+        except Reintentar:
+            self._conexion().execute(
+                "UPDATE trabajos SET estado = ?, intentos = intentos - 1 WHERE job_id = ?",
+                (PENDIENTE, job_id),
+            )
+            return False
+        except Exception as e:
+            traceback.print_exc()
+            self._terminar(job_id, ERROR, error=str(e) or e.__class__.__name__)
+        else:
+            self._terminar(job_id, LISTO, resultado=resultado)
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def purgar(self) -> int:
+        """Borra trabajos terminados más antiguos que `retencion`."""
+        limite = time.time() - self.retencion
+        cur = self._conexion().execute(
+            "DELETE FROM trabajos WHERE estado IN (?, ?) AND actualizado < ?",
+            (LISTO, ERROR, limite),
+        )
+        return cur.rowcount
+
+    def _bucle(self) -> None:
+        while not self._parar.is_set():
+            try:
+                hubo = self.procesar_uno()
+            except sqlite3.Error:
+                traceback.print_exc()
+                hubo = False
+            if not hubo:
+                # El aviso despierta a los hilos de este proceso; el timeout
+                # recoge trabajos encolados por otros workers.
+                self._aviso.wait(timeout=1.0)
+                self._aviso.clear()
+
+    def iniciar(self) -> None:
+        if self._hilos:
+            return
+        self.purgar()
+        for i in range(self.hilos):
+            hilo = threading.Thread(target=self._bucle, name=f"trabajos-{i}", daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+
+    def detener(self) -> None:
+        self._parar.set()
+        self._aviso.set()
+        for hilo in self._hilos:
+            hilo.join()
+        self._hilos = []
+        self._parar.clear()
@@ -1,15 +1,23 @@
 # sello_monarca/utils.py
 
-import base64
+import base64, binascii
+from io import BytesIO
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives.asymmetric import ec
 
 
-def calcular_hash(data_bytes: bytes) -> bytes:
-    """Devuelve el hash SHA-256 de un contenido en bytes"""
+def calcular_hash(data_bytes) -> bytes:
+    """
+    Devuelve el hash SHA-256 de un contenido en bytes, o de un iterable de
+    bloques (p. ej. memoria.bloques() sobre un mmap) sin juntarlos en memoria
+    """
     digest = hashes.Hash(hashes.SHA256())
-    digest.update(data_bytes)
+    if isinstance(data_bytes, (bytes, bytearray, memoryview)):
+        digest.update(data_bytes)
+    else:
+        for bloque in data_bytes:
+            digest.update(bloque)
     return digest.finalize()
 
 
@@ -42,3 +50,26 @@ def firma_a_base64(firma: bytes) -> str:
 def base64_a_firma(firma_b64: str) -> bytes:
     """Decodifica una firma de base64 a bytes"""
     return base64.b64decode(firma_b64)
+
+
+_BLANCOS_B64 = b" \t\r\n\f\v"
+
+
+def base64_a_bytes(texto_b64: str, bloque: int = 1 << 20) -> bytes:
+    """
+    Decodifica base64 por bloques: quita el prefijo "data:...;base64," y los
+    blancos de cada bloque sin copiar el texto completo (como haría re.sub).
+    Lanza binascii.Error / ValueError si el contenido no es base64 válido.
+    """
+    inicio = texto_b64.index(",") + 1 if texto_b64.startswith("data:") else 0
+    bloque -= bloque % 4
+    salida = BytesIO()
+    resto = b""
+    for i in range(inicio, len(texto_b64), bloque):
+        trozo = resto + texto_b64[i:i + bloque].encode("ascii").translate(None, _BLANCOS_B64)
+        corte = len(trozo) - len(trozo) % 4
+        salida.write(base64.b64decode(trozo[:corte], validate=True))
+        resto = trozo[corte:]
+    if resto:
+        raise binascii.Error("Longitud de base64 incorrecta")
+    return salida.getvalue()
@@ -0,0 +1,218 @@
+// static/verificar.js — /verify-ui: verifica uno o varios PDFs por su huella
+// y sube a /verify los que el servidor no conoce
+(() => {
+  const dropZone = document.getElementById('dropZone');
+  const resultDiv = document.getElementById('result');
+  const fileInput = document.getElementById('fileInput');
+  const apiURL = document.currentScript.dataset.api;
+  const apiHashURL = document.currentScript.dataset.apiHash;
+
+  // Web Crypto sólo existe en contextos seguros (HTTPS o localhost) y
+  // digest() necesita el archivo entero en memoria: archivos más grandes se suben
+  const MAX_HASH_BYTES = 512 * 1024 * 1024;
+  const HUELLAS_EN_PARALELO = 4;
+  // Los desconocidos se suben en lotes acotados; /verify responde NDJSON
+  const MAX_LOTE_ARCHIVOS = 50;
+  const MAX_LOTE_BYTES = 64 * 1024 * 1024;
+  let resumen = null;
+
+  const formatoFecha = new Intl.DateTimeFormat('es-MX', {
+    timeZone: 'America/Monterrey', day: 'numeric', month: 'long', year: 'numeric',
+    hour: '2-digit', minute: '2-digit', hourCycle: 'h23'
+  });
+
+  // "2025-05-30T23:12:35Z" -> "30 mayo 2025, 17:12 (MTY)" (igual que /v)
+  function fechaLegible(raw) {
+    const fecha = new Date(raw);
+    if (!raw || isNaN(fecha)) return raw || "—";
+    const p = Object.fromEntries(formatoFecha.formatToParts(fecha).map(x => [x.type, x.value]));
+    return `${p.day} ${p.month} ${p.year}, ${p.hour}:${p.minute} (MTY)`;
+  }
+
+  function escapar(texto) {
+    const div = document.createElement('div');
+    div.textContent = texto;
+    return div.innerHTML;
+  }
+
+  async function sha256Hex(file) {
+    const digest = await crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, "0")).join("");
+  }
+
+  // Resultado por huella, o null si no se pudo (huella desconocida, sin Web Crypto, error)
+  async function verificarPorHuella(file) {
+    if (!window.crypto || !crypto.subtle || file.size > MAX_HASH_BYTES) return null;
+    try {
+      const resp = await fetch(apiHashURL + await sha256Hex(file));
+      return resp.ok ? await resp.json() : null;
+    } catch (err) {
+      console.error(err);
+      return null;
+    }
+  }
+
+  function tablaMeta(meta) {
+    const campos = {
+      "Área": meta.area || "—",
+      "Document ID": meta.id || "—",
+      "Nombre original": meta.original_filename || "—",
+      "Subido por": meta.uploader || "—",
+      "Fecha": fechaLegible(meta.uploaded_at)
+    };
+    let html = "<table class='tabla-meta'><tbody>";
+    for (const [k, v] of Object.entries(campos)) {
+      html += `<tr><th>${k}</th><td>${escapar(String(v))}</td></tr>`;
+    }
+    return html + "</tbody></table>";
+  }
+
+  // Una fila por archivo; se llena cuando llega su resultado
+  function crearFila(file) {
+    const fila = document.createElement('div');
+    fila.className = 'resultado';
+    fila.innerHTML = `<div class='archivo'>${escapar(file.name)}</div><div class='detalle'>Verificando…</div>`;
+    resultDiv.appendChild(fila);
+    return { file, fila, listo: false };
+  }
+
+  function mostrar(item, html) {
+    item.fila.querySelector('.detalle').innerHTML = html;
+    item.listo = true;
+    actualizarResumen();
+  }
+
+  function mostrarResultado(item, data, abierto) {
+    if (data.error) {
+      mostrarError(item, "No se pudo leer el PDF.");
+    } else if (data.valid) {
+      item.valido = true;
+      mostrar(item, `<details${abierto ? " open" : ""}><summary><span class='estado valido'>✅ VÁLIDO</span></summary>`
+        + tablaMeta(data.meta) + "</details>");
+    } else {
+      mostrar(item, "<span class='estado invalido'>❌ NO VÁLIDO</span>");
+    }
+  }
+
+  function mostrarError(item, texto) {
+    mostrar(item, `<p class='error'>${escapar(texto)}</p>`);
+  }
+
+  let items = [];
+  function actualizarResumen() {
+    if (items.length < 2) return;
+    const listos = items.filter(x => x.listo).length;
+    const validos = items.filter(x => x.valido).length;
+    resumen.textContent = `${listos} de ${items.length} verificados · ${validos} válidos`;
+  }
+
+  // Objetos de una respuesta NDJSON conforme van llegando
+  async function* lineasNDJSON(resp) {
+    const lector = resp.body.getReader();
+    const decodificador = new TextDecoder();
+    let resto = "";
+    for (;;) {
+      const { value, done } = await lector.read();
+      if (done) break;
+      resto += decodificador.decode(value, { stream: true });
+      const lineas = resto.split("\n");
+      resto = lineas.pop();
+      for (const linea of lineas) {
+        if (linea.trim()) yield JSON.parse(linea);
+      }
+    }
+    if (resto.trim()) yield JSON.parse(resto);
+  }
+
+  // Sube un lote a /verify (campo "files") y pinta cada resultado según llega
+  async function verificarSubiendo(lote, abierto) {
+    const formData = new FormData();
+    for (const item of lote) {
+      formData.append("files", item.file);
+      item.fila.querySelector('.detalle').textContent = "Subiendo…";
+    }
+    const resp = await fetch(apiURL, { method: "POST", body: formData });
+    if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+    for await (const data of lineasNDJSON(resp)) {
+      if (!data.done) mostrarResultado(lote[data.index], data, abierto);
+    }
+  }
+
+  function* lotes(pendientes) {
+    let lote = [], bytes = 0;
+    for (const item of pendientes) {
+      if (lote.length && (lote.length >= MAX_LOTE_ARCHIVOS || bytes + item.file.size > MAX_LOTE_BYTES)) {
+        yield lote;
+        lote = [];
+        bytes = 0;
+      }
+      lote.push(item);
+      bytes += item.file.size;
+    }
+    if (lote.length) yield lote;
+  }
+
+  function esPDF(file) {
+    return file.type === "application/pdf" || (!file.type && /\.pdf$/i.test(file.name));
+  }
+
+  // Primero por huella (sin subir nada); los que el servidor no conoce se suben por lotes
+  async function handleFiles(lista) {
+    const files = Array.from(lista || []);
+    resultDiv.innerHTML = "";
+    if (!files.length) return;
+    resumen = document.createElement('p');
+    resumen.className = 'resumen';
+    resultDiv.appendChild(resumen);
+    items = files.map(crearFila);
+    const abierto = items.length === 1;
+
+    const pdfs = [];
+    for (const item of items) {
+      if (esPDF(item.file)) pdfs.push(item);
+      else mostrarError(item, "No es un archivo PDF.");
+    }
+
+    // digest() carga el archivo completo: sólo unos cuantos a la vez
+    const pendientes = [];
+    let siguiente = 0;
+    async function porHuella() {
+      while (siguiente < pdfs.length) {
+        const item = pdfs[siguiente++];
+        const data = await verificarPorHuella(item.file);
+        if (data) mostrarResultado(item, data, abierto);
+        else pendientes.push(item);
+      }
+    }
+    await Promise.all(Array.from({ length: HUELLAS_EN_PARALELO }, porHuella));
+
+    for (const lote of lotes(pendientes)) {
+      try {
+        await verificarSubiendo(lote, abierto);
+      } catch (err) {
+        console.error(err);
+      }
+      for (const item of lote) {
+        if (!item.listo) mostrarError(item, "Error al conectar con el servidor.");
+      }
+    }
+  }
+
+  // Drag & drop: cambiar estilo al pasar archivo
+  dropZone.addEventListener('dragover', e => {
+    e.preventDefault();
+    dropZone.classList.add('dragover');
+  });
+  dropZone.addEventListener('dragleave', () => {
+    dropZone.classList.remove('dragover');
+  });
+  dropZone.addEventListener('drop', e => {
+    e.preventDefault();
+    dropZone.classList.remove('dragover');
+    handleFiles(e.dataTransfer.files);
+  });
+
+  // Al hacer clic en dropZone, abre fileInput
+  dropZone.addEventListener('click', () => fileInput.click());
+  fileInput.addEventListener('change', () => handleFiles(fileInput.files));
+})();
@@ -0,0 +1,77 @@
+# tests/conftest.py
+import importlib, io, json, os, sys
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Los generadores de PDFs de prueba viven en benchmarks/
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
+
+META = {"uploader": "ana", "area": "Calidad", "original_filename": "informe.pdf"}
+
+
+def sellar_en_app(cliente, pdf: bytes, meta: dict = META, **kwargs):
+    """POST /sign con `pdf` como archivo; kwargs pasa al cliente (headers...)."""
+    datos = {"file": (io.BytesIO(pdf), meta.get("original_filename", "doc.pdf")),
+             "meta": json.dumps(meta)}
+    return cliente.post("/sign", data=datos, **kwargs)
+
+
+def armar_pdf(objetos, trailer: bytes = b"/Root 1 0 R") -> bytes:
+    """PDF con tabla xref clásica a partir de [(num, generación, cuerpo)]; los huecos quedan libres."""
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for num, gen, cuerpo in objetos:
+        offsets[num] = (len(out), gen)
+        out += b"%d %d obj\n" % (num, gen) + cuerpo + b"\nendobj\n"
+    total = max(offsets) + 1
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % total
+    for num in range(1, total):
+        offset, gen = offsets.get(num, (0, 65535))
+        out += b"%010d %05d %s \n" % (offset, gen, b"n" if num in offsets else b"f")
+    out += b"trailer\n<</Size %d %s>>\nstartxref\n%d\n%%%%EOF\n" % (total, trailer, xref)
+    return bytes(out)
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "lento: pruebas de varios segundos (se omiten con -m 'not lento')")
+
+
+@pytest.fixture(scope="session")
+def llave():
+    return ec.generate_private_key(ec.SECP256R1())
+
+
+@pytest.fixture(scope="session")
+def pdf_original():
+    from bench_sello import pdf_sintetico
+    return pdf_sintetico(3)
+
+
+@pytest.fixture(scope="session")
+def servidor(tmp_path_factory):
+    """
+    Módulo app.py importado con una llave nueva y un STORAGE_DIR temporal
+    (app lee el entorno al importarse). Sella en el proceso (SELLO_WORKERS=0).
+    """
+    llave_app = ec.generate_private_key(ec.SECP256R1())
+    os.environ["PRIVATE_KEY_PEM"] = llave_app.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+        serialization.BestAvailableEncryption(b"secreto")).decode()
+    os.environ["PUBLIC_KEY_PEM"] = llave_app.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo).decode()
+    os.environ["STORAGE_DIR"] = str(tmp_path_factory.mktemp("storage"))
+    os.environ["SELLO_WORKERS"] = "0"
+    sys.path.insert(0, RAIZ)
+    modulo = importlib.import_module("app")
+    yield modulo
+    modulo.TRABAJOS.detener()
+    modulo.EJECUTOR.cerrar()
+
+
+@pytest.fixture
+def cliente(servidor):
+    return servidor.app.test_client()
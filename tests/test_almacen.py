@@ -0,0 +1,111 @@
+# tests/test_almacen.py
+"""AlmacenLocal: escritura atómica repartida y deduplicación del original (.sello)."""
+import io, os
+
+import pytest
+
+from sello_monarca.almacen import Almacen, AlmacenLocal
+from sello_monarca.sello import sell, verify
+
+from tests.conftest import META
+
+
+def _guardar_sellado(almacen, llave, pdf_original):
+    sellado, doc_id = sell(pdf_original, META, llave)
+    meta = verify(sellado, llave.public_key())[1]
+    almacen.guardar_bytes(doc_id, sellado, meta["content_sha256"], meta["content_length"])
+    return doc_id, sellado
+
+
+@pytest.fixture
+def almacen(tmp_path):
+    return AlmacenLocal(str(tmp_path / "storage"), sincronizar=False)
+
+
+def test_documento_completo(almacen, llave, pdf_original):
+    doc_id, sellado = _guardar_sellado(almacen, llave, pdf_original)
+
+    ruta = almacen.ruta_local(doc_id)
+    assert ruta.endswith(os.path.join(doc_id[:2], doc_id[2:4], doc_id + ".pdf"))
+    with almacen.abrir(doc_id) as f:
+        assert f.read() == sellado
+    assert almacen.tamano(doc_id) == len(sellado)
+    assert list(almacen.ids()) == [doc_id]
+    assert os.listdir(almacen._tmp) == []
+
+
+def test_mismo_original_se_guarda_una_vez(almacen, llave, pdf_original):
+    base, _ = _guardar_sellado(almacen, llave, pdf_original)
+    doc_id, sellado = _guardar_sellado(almacen, llave, pdf_original)
+
+    assert almacen.ruta_local(doc_id) is None
+    assert os.path.getsize(almacen._ruta(doc_id, ".sello")) < len(sellado) - len(pdf_original) + 200
+    assert almacen.tamano(doc_id) == len(sellado)
+    with almacen.abrir(doc_id) as f:
+        assert f.read() == sellado
+    with almacen.abrir(doc_id) as f:
+        assert verify(f, llave.public_key(), contenido=True) == verify(sellado, llave.public_key(), contenido=True)
+    assert sorted(almacen.ids()) == sorted([base, doc_id])
+    assert os.listdir(almacen._tmp) == []
+
+
+def test_lectura_con_seek_entre_tramos(almacen, llave, pdf_original):
+    _guardar_sellado(almacen, llave, pdf_original)
+    doc_id, sellado = _guardar_sellado(almacen, llave, pdf_original)
+    corte = len(pdf_original)
+
+    with almacen.abrir(doc_id) as f:
+        f.seek(corte - 10)
+        assert f.read(20) == sellado[corte - 10:corte + 10]
+        f.seek(-5, io.SEEK_END)
+        assert f.read() == sellado[-5:]
+        f.seek(0)
+        assert f.read(5) == b"%PDF-"
+
+
+def test_refirmar_la_base_no_rompe_los_deduplicados(almacen, llave, pdf_original):
+    base, _ = _guardar_sellado(almacen, llave, pdf_original)
+    doc_id, sellado = _guardar_sellado(almacen, llave, pdf_original)
+    with almacen.abrir(base) as f:
+        nuevo = f.read() + b"\n% re-firma\n"
+
+    almacen.guardar_bytes(base, nuevo)
+
+    with almacen.abrir(base) as f:
+        assert f.read() == nuevo
+    with almacen.abrir(doc_id) as f:
+        assert f.read() == sellado
+
+
+def test_documentos_planos_anteriores(almacen, llave, pdf_original):
+    sellado, doc_id = sell(pdf_original, META, llave)
+    with open(os.path.join(almacen.raiz, doc_id + ".pdf"), "wb") as f:
+        f.write(sellado)
+
+    assert almacen.ruta_local(doc_id) == os.path.join(almacen.raiz, doc_id + ".pdf")
+    assert almacen.migrar_planos() == 1
+    assert almacen.ruta_local(doc_id) == almacen._ruta(doc_id, ".pdf")
+    with almacen.abrir(doc_id) as f:
+        assert f.read() == sellado
+
+
+@pytest.mark.parametrize("doc_id", ["..", "../x", "a/b", "abc", ""])
+def test_doc_id_invalido(almacen, doc_id):
+    assert almacen.version(doc_id) is None
+    with pytest.raises(FileNotFoundError):
+        almacen.abrir(doc_id)
+    with pytest.raises(ValueError):
+        almacen.guardar_bytes(doc_id, b"%PDF-1.4")
+
+
+def test_backend_incompleto_falla_al_construirse():
+    class SinIds(Almacen):
+        def version(self, doc_id): return None
+        def tamano(self, doc_id): return 0
+        def ruta_local(self, doc_id): return None
+        def abrir(self, doc_id): raise FileNotFoundError(doc_id)
+        def temporal(self): raise NotImplementedError
+        def guardar(self, doc_id, ruta_tmp, content_sha256=None, content_length=None): pass
+
+    with pytest.raises(TypeError):
+        SinIds()
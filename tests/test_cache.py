@@ -0,0 +1,64 @@
+# tests/test_cache.py
+"""Caché de verificación: LRU, TTL y nivel compartido en SQLite."""
+import time
+
+from sello_monarca.cache import CacheVerificacion
+
+from tests.conftest import sellar_en_app
+
+
+def test_desaloja_la_menos_usada():
+    cache = CacheVerificacion(capacidad=2)
+    cache.guardar("a", 1)
+    cache.guardar("b", 2)
+    cache.obtener("a")
+    cache.guardar("c", 3)
+
+    assert cache.obtener("b") is None
+    assert (cache.obtener("a"), cache.obtener("c")) == (1, 3)
+    assert cache.estadisticas()["desalojados"] == 1
+
+
+def test_las_entradas_expiran():
+    cache = CacheVerificacion(ttl=0.05)
+    cache.guardar("a", [True, {}])
+    assert cache.obtener("a") == [True, {}]
+
+    time.sleep(0.1)
+
+    assert cache.obtener("a") is None
+    assert cache.estadisticas()["expirados"] == 1
+
+
+def test_obtener_o_calcular_calcula_una_vez():
+    cache = CacheVerificacion()
+    llamadas = []
+    calcular = lambda: llamadas.append(1) or [True, {"id": "x"}]
+
+    for _ in range(3):
+        assert cache.obtener_o_calcular("a", calcular) == [True, {"id": "x"}]
+
+    assert len(llamadas) == 1
+    assert cache.estadisticas()["hits_memoria"] == 2
+
+
+def test_nivel_en_disco_compartido(tmp_path):
+    ruta = str(tmp_path / "cache.sqlite3")
+    CacheVerificacion(ruta_disco=ruta).guardar("a", [True, {"id": "x"}])
+
+    otro = CacheVerificacion(ruta_disco=ruta)
+
+    assert otro.obtener("a") == [True, {"id": "x"}]
+    assert otro.estadisticas()["hits_disco"] == 1
+
+
+def test_v_reutiliza_la_verificacion(servidor, cliente, pdf_original):
+    doc_id = sellar_en_app(cliente, pdf_original).json["doc_id"]
+    cliente.get(f"/v/{doc_id}")
+    antes = cliente.get("/cache/stats").json
+
+    assert cliente.get(f"/v/{doc_id}").status_code == 200
+
+    despues = cliente.get("/cache/stats").json
+    assert despues["hits_memoria"] == antes["hits_memoria"] + 1
+    assert despues["misses"] == antes["misses"]
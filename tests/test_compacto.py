@@ -0,0 +1,130 @@
+# tests/test_compacto.py
+"""Perfil de salida compacto: misma página a página, menos bytes."""
+import json
+from io import BytesIO
+
+import pytest
+from PyPDF2 import PdfReader, PdfWriter
+
+from bench_sello import pdf_sintetico
+from sello_monarca import compacto
+from sello_monarca.sello import META_KEY, cuerpo_segun_perfil, sell, verify
+
+from tests.conftest import META, armar_pdf
+
+
+def _textos(pdf: bytes) -> list:
+    return [p.extract_text() for p in PdfReader(BytesIO(pdf)).pages]
+
+
+def _fuentes(pdf: bytes) -> set:
+    return {p["/Resources"]["/Font"].raw_get("/F1").idnum for p in PdfReader(BytesIO(pdf)).pages}
+
+
+def _unir(*pdfs: bytes) -> bytes:
+    writer = PdfWriter()
+    for pdf in pdfs:
+        for pagina in PdfReader(BytesIO(pdf)).pages:
+            writer.add_page(pagina)
+    out = BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def _pdf_con_contents(ref: bytes) -> bytes:
+    """Una página cuyo /Contents es `ref`; el stream de contenido es el objeto 4 de generación 1."""
+    texto = b"\n".join(b"BT /F1 10 Tf 20 %d Td (Linea %d del contenido) Tj ET" % (700 - 12 * i, i)
+                       for i in range(50))
+    return armar_pdf([
+        (1, 0, b"<</Type/Catalog/Pages 2 0 R>>"),
+        (2, 0, b"<</Type/Pages/Kids[3 0 R]/Count 1>>"),
+        (3, 0, b"<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]/Contents %s"
+               b"/Resources<</Font<</F1 5 0 R>>>>>>" % ref),
+        (4, 1, b"<</Length %d>>\nstream\n" % len(texto) + texto + b"\nendstream"),
+        (5, 0, b"<</Type/Font/Subtype/Type1/BaseFont/Helvetica>>"),
+    ])
+
+
+def test_compactar_conserva_las_paginas(pdf_original):
+    compactado = compacto.compactar(pdf_original)
+
+    assert len(compactado) < len(pdf_original)
+    assert _textos(compactado) == _textos(pdf_original)
+    assert PdfReader(BytesIO(compactado)).metadata == PdfReader(BytesIO(pdf_original)).metadata
+
+
+def test_compactar_es_determinista(pdf_original):
+    assert compacto.compactar(pdf_original) == compacto.compactar(pdf_original)
+
+
+def test_fusiona_fuentes_repetidas():
+    # Dos documentos unidos: cada uno trae su propio objeto /Helvetica
+    unido = _unir(pdf_sintetico(1), pdf_sintetico(1))
+    assert len(_fuentes(unido)) == 2
+
+    assert len(_fuentes(compacto.compactar(unido))) == 1
+
+
+def test_objeto_con_generacion_distinta_de_cero(llave):
+    original = _pdf_con_contents(b"4 1 R")
+
+    sellado, _ = sell(original, META, llave, perfil="compacto")
+
+    assert len(compacto.compactar(original)) < len(original)
+    assert _textos(sellado)[0] == _textos(original)[0]
+    assert "Linea 49 del contenido" in _textos(sellado)[0]
+    assert verify(sellado, llave.public_key(), contenido=True)[0]
+
+
+@pytest.mark.parametrize("ref", [b"9 0 R", b"4 0 R"])
+def test_referencia_colgante_sella_el_original(ref):
+    # 9 no existe; 4 existe pero con generación 1
+    original = _pdf_con_contents(ref)
+
+    with pytest.raises(ValueError):
+        compacto.compactar(original)
+    assert cuerpo_segun_perfil(original, "compacto") is original
+
+
+def test_pdf_cifrado(pdf_original):
+    writer = PdfWriter()
+    writer.append_pages_from_reader(PdfReader(BytesIO(pdf_original)))
+    writer.encrypt("clave")
+    cifrado = BytesIO()
+    writer.write(cifrado)
+
+    with pytest.raises(ValueError):
+        compacto.compactar(cifrado.getvalue())
+    assert cuerpo_segun_perfil(cifrado.getvalue(), "compacto") == cifrado.getvalue()
+
+
+def test_sell_compacto(llave, pdf_original):
+    incremental, _ = sell(pdf_original, META, llave)
+
+    sellado, doc_id = sell(pdf_original, META, llave, perfil="compacto")
+
+    assert len(sellado) < len(incremental)
+    assert len(PdfReader(BytesIO(sellado)).pages) == len(PdfReader(BytesIO(pdf_original)).pages) + 1
+    valido, meta = verify(sellado, llave.public_key(), contenido=True)
+    assert valido and meta["id"] == doc_id
+    assert meta["content_length"] == len(compacto.compactar(pdf_original))
+
+
+def test_el_cuerpo_compacto_se_deduplica(llave, pdf_original):
+    # El almacén deduplica por content_sha256: debe repetirse entre sellos
+    metas = [json.loads(PdfReader(BytesIO(sell(pdf_original, META, llave, perfil="compacto")[0]))
+                        .metadata[META_KEY]) for _ in range(2)]
+
+    assert metas[0]["content_sha256"] == metas[1]["content_sha256"]
+    assert metas[0]["id"] != metas[1]["id"]
+
+
+def test_cuerpo_segun_perfil(pdf_original, monkeypatch):
+    assert cuerpo_segun_perfil(pdf_original) is pdf_original
+    assert len(cuerpo_segun_perfil(pdf_original, "compacto")) < len(pdf_original)
+    with pytest.raises(ValueError):
+        cuerpo_segun_perfil(pdf_original, "minimo")
+
+    monkeypatch.setattr(compacto, "MAX_ENTRADA", len(pdf_original) - 1)
+
+    assert cuerpo_segun_perfil(pdf_original, "compacto") is pdf_original
@@ -0,0 +1,90 @@
+# tests/test_contenido.py
+"""Sello ligado al cuerpo original: content_sha256/content_length y verificación en modo contenido."""
+import io
+from hashlib import sha256
+
+import pytest
+
+from sello_monarca.incremental import ActualizacionIncremental
+from sello_monarca.sello import CLAVES_RESERVADAS, sell, verificar_contenido, verify
+
+from tests.conftest import META, sellar_en_app
+
+
+def test_el_sello_cubre_el_original(llave, pdf_original):
+    sellado, _ = sell(pdf_original, META, llave)
+
+    valido, meta = verify(sellado, llave.public_key(), contenido=True)
+
+    assert valido
+    assert meta["content_sha256"] == sha256(pdf_original).hexdigest()
+    assert meta["content_length"] == len(pdf_original)
+
+
+@pytest.mark.parametrize("posicion", [0.1, 0.5, 0.99])
+def test_byte_alterado_en_el_cuerpo(llave, pdf_original, posicion):
+    sellado, _ = sell(pdf_original, META, llave)
+    alterado = bytearray(sellado)
+    alterado[int(len(pdf_original) * posicion)] ^= 1
+
+    # La firma de /CM_META sigue siendo válida: sólo el modo contenido lo detecta
+    assert verify(bytes(alterado), llave.public_key())[0]
+    assert not verify(bytes(alterado), llave.public_key(), contenido=True)[0]
+
+
+def test_objeto_del_original_redefinido_despues_del_sello(llave, pdf_original):
+    sellado, _ = sell(pdf_original, META, llave)
+    act = ActualizacionIncremental(sellado)
+    act.agregar(1, b"<</X 1>>")
+    modificado = sellado + act.serializar()
+
+    assert not verify(modificado, llave.public_key(), contenido=True)[0]
+
+
+def test_sellado_truncado(llave, pdf_original):
+    sellado, _ = sell(pdf_original, META, llave)
+    _, meta = verify(sellado, llave.public_key())
+
+    assert not verificar_contenido(pdf_original, meta)
+    assert not verificar_contenido(sellado[:len(pdf_original) // 2], meta)
+
+
+def test_sha_del_archivo_guardado(llave, pdf_original):
+    sellado, _ = sell(pdf_original, META, llave)
+    _, meta = verify(sellado, llave.public_key())
+
+    assert verificar_contenido(sellado, meta, sha_archivo=sha256(sellado).hexdigest())
+    # Un sha que no coincide no acepta por sí solo: se revisa la sección anexada
+    assert verificar_contenido(sellado, meta, sha_archivo="00" * 32)
+
+
+def test_claves_reservadas_no_se_toman_del_usuario(llave, pdf_original):
+    usuario = dict(META, id="mio", signature="x", kid="k", verify_url="http://malo/",
+                   uploaded_at="2000-01-01", content_sha256="00" * 32, content_length=1,
+                   merkle={"root": "00" * 32, "proof": []})
+    assert CLAVES_RESERVADAS <= set(usuario)
+
+    sellado, doc_id = sell(pdf_original, usuario, llave)
+
+    valido, meta = verify(sellado, llave.public_key(), contenido=True)
+    assert valido
+    assert meta["id"] == doc_id != "mio"
+    assert "merkle" not in meta
+    assert meta["content_length"] == len(pdf_original)
+    assert not meta["verify_url"].startswith("http://malo/")
+
+
+def test_verify_http_en_modo_contenido(servidor, cliente, pdf_original):
+    doc_id = sellar_en_app(cliente, pdf_original).json["doc_id"]
+    sellado = cliente.get(f"/file/{doc_id}").get_data()
+    alterado = bytearray(sellado)
+    alterado[100] ^= 1
+
+    def verificar(pdf, modo):
+        return cliente.post(f"/verify?modo={modo}", data={"file": (io.BytesIO(pdf), "s.pdf")})
+
+    assert verificar(sellado, "contenido").json == {
+        "valid": True, "mode": "contenido", "meta": verify(sellado, servidor.PUBLIC_KEY)[1]}
+    assert verificar(bytes(alterado), "metadatos").json["valid"]
+    assert not verificar(bytes(alterado), "contenido").json["valid"]
+    assert verificar(sellado, "otro").status_code == 400
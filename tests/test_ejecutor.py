@@ -0,0 +1,69 @@
+# tests/test_ejecutor.py
+"""Sellado en el pool de procesos y en el proceso, con la cola acotada."""
+import os
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+
+from sello_monarca.ejecutor import ColaLlena, EjecutorSellado
+from sello_monarca.sello import verify
+
+from tests.conftest import META
+
+
+@pytest.fixture(scope="module")
+def llave_pem(llave):
+    return llave.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+        serialization.BestAvailableEncryption(b"secreto")).decode()
+
+
+@pytest.fixture(scope="module")
+def pool(llave_pem):
+    ejecutor = EjecutorSellado(llave_pem, password=b"secreto", workers=1)
+    yield ejecutor
+    ejecutor.cerrar()
+
+
+def test_sellar_archivo_en_el_pool(pool, llave, pdf_original, tmp_path):
+    entrada, salida = tmp_path / "entrada.pdf", tmp_path / "sellado.pdf"
+    entrada.write_bytes(pdf_original)
+
+    doc_id, _, pico_kb = pool.sellar_archivo(str(entrada), str(salida), META, "http://x/")
+
+    valido, meta = verify(str(salida), llave.public_key(), contenido=True)
+    assert valido and meta["id"] == doc_id
+    if os.path.exists("/proc/self/status"):
+        assert pico_kb > 0
+
+
+def test_sellar_bytes_en_el_pool(pool, llave, pdf_original):
+    sellado, doc_id = pool.sellar(pdf_original, META, "http://x/")
+
+    assert verify(sellado, llave.public_key())[1]["id"] == doc_id
+
+
+def test_sin_workers_sella_en_el_proceso_sin_medir(llave_pem, llave, pdf_original, tmp_path):
+    ejecutor = EjecutorSellado(llave_pem, password=b"secreto", workers=0)
+    entrada, salida = tmp_path / "entrada.pdf", tmp_path / "sellado.pdf"
+    entrada.write_bytes(pdf_original)
+
+    _, _, pico_kb = ejecutor.sellar_archivo(str(entrada), str(salida), META, "http://x/")
+
+    assert pico_kb is None
+    assert verify(str(salida), llave.public_key(), contenido=True)[0]
+
+
+def test_cola_llena(llave_pem, pdf_original):
+    ejecutor = EjecutorSellado(llave_pem, password=b"secreto", workers=0, cola_max=0)
+
+    with ejecutor._cupo():
+        with pytest.raises(ColaLlena):
+            ejecutor.sellar(pdf_original, META, "http://x/")
+
+
+def test_parametros_invalidos(llave_pem):
+    with pytest.raises(ValueError):
+        EjecutorSellado(llave_pem, workers=-1)
+    with pytest.raises(ValueError):
+        EjecutorSellado(llave_pem, perfil="otro")
@@ -0,0 +1,92 @@
+# tests/test_http.py
+"""/file y /download: ETag fuerte, 304, rangos de bytes y caché inmutable."""
+import pytest
+
+from tests.conftest import META, sellar_en_app
+
+
+@pytest.fixture(params=["completo", "deduplicado"])
+def documento(request, servidor, cliente, pdf_original):
+    """(doc_id, bytes sellados) guardado completo o como .sello sobre otro documento."""
+    sellar_en_app(cliente, pdf_original)
+    meta = META if request.param == "completo" else dict(META, area="Dirección")
+    doc_id = sellar_en_app(cliente, pdf_original, meta).json["doc_id"]
+    assert (servidor.ALMACEN.ruta_local(doc_id) is None) == (request.param == "deduplicado")
+    with servidor.ALMACEN.abrir(doc_id) as f:
+        return doc_id, f.read()
+
+
+def test_respuesta_completa(servidor, cliente, documento):
+    doc_id, sellado = documento
+
+    r = cliente.get(f"/file/{doc_id}")
+
+    assert r.status_code == 200
+    assert r.get_data() == sellado
+    assert r.mimetype == "application/pdf"
+    assert r.headers["ETag"] == f'"{servidor.INDICE.obtener(doc_id)["sha256"]}"'
+    assert r.headers["Accept-Ranges"] == "bytes"
+    assert r.cache_control.public and r.cache_control.immutable
+    assert r.cache_control.max_age == servidor.FILE_CACHE_MAX_AGE
+
+
+def test_revalidacion_304(cliente, documento):
+    doc_id, _ = documento
+    etag = cliente.get(f"/file/{doc_id}").headers["ETag"]
+
+    r = cliente.get(f"/file/{doc_id}", headers={"If-None-Match": etag})
+
+    assert r.status_code == 304
+    assert r.get_data() == b""
+    assert r.headers["ETag"] == etag
+    assert cliente.get(f"/file/{doc_id}", headers={"If-None-Match": '"otro"'}).status_code == 200
+
+
+@pytest.mark.parametrize("rango,inicio,fin", [
+    ("bytes=100-199", 100, 200),
+    ("bytes=-50", -50, None),
+    ("bytes=0-0", 0, 1),
+])
+def test_rangos_206(cliente, documento, rango, inicio, fin):
+    doc_id, sellado = documento
+
+    r = cliente.get(f"/file/{doc_id}", headers={"Range": rango})
+
+    assert r.status_code == 206
+    assert r.get_data() == sellado[inicio:fin]
+    primero = inicio % len(sellado)
+    ultimo = (fin if fin is not None else len(sellado)) - 1
+    assert r.headers["Content-Range"] == f"bytes {primero}-{ultimo}/{len(sellado)}"
+
+
+def test_rango_fuera_del_archivo(cliente, documento):
+    doc_id, sellado = documento
+
+    r = cliente.get(f"/file/{doc_id}", headers={"Range": f"bytes={len(sellado) + 10}-"})
+
+    assert r.status_code == 416
+
+
+def test_download_con_nombre_amigable(cliente, documento):
+    doc_id, sellado = documento
+
+    r = cliente.get(f"/download/{doc_id}")
+
+    assert r.status_code == 200
+    assert r.get_data() == sellado
+    assert r.headers["Content-Disposition"] == "attachment; filename=informe_sellado.pdf"
+    assert cliente.get(f"/download/{doc_id}", headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
+
+
+def test_head(cliente, documento):
+    doc_id, sellado = documento
+
+    r = cliente.head(f"/file/{doc_id}")
+
+    assert r.status_code == 200
+    assert r.content_length == len(sellado)
+
+
+@pytest.mark.parametrize("ruta", ["/file/no-existe", "/download/no-existe", "/file/..", "/download/zz%2F.."])
+def test_documento_inexistente(cliente, ruta):
+    assert cliente.get(ruta).status_code == 404
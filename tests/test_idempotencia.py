@@ -0,0 +1,136 @@
+# tests/test_idempotencia.py
+"""Sellado idempotente: registro de claves, esperas concurrentes y reintentos de /sign y /sign-json."""
+import time, uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from sello_monarca.idempotencia import ClaveReutilizada, EnCurso, RegistroIdempotencia, huella_peticion
+
+from tests.conftest import META, sellar_en_app
+
+
+@pytest.fixture
+def registro(tmp_path):
+    return RegistroIdempotencia(str(tmp_path / "idempotencia.sqlite3"), espera=5, sondeo=0.05)
+
+
+def test_clave_nueva_terminada_y_reutilizada(registro):
+    assert registro.reclamar("k", "h1") is None
+    registro.completar("k", {"doc_id": "d1"})
+
+    assert registro.reclamar("k", "h1") == {"doc_id": "d1"}
+    with pytest.raises(ClaveReutilizada):
+        registro.reclamar("k", "h2")
+
+
+def test_liberar_y_olvidar(registro):
+    registro.reclamar("k", "h")
+    registro.liberar("k")
+    assert registro.reclamar("k", "h") is None
+
+    registro.completar("k", {"job_id": "j1"})
+    registro.olvidar("k", {"job_id": "otro"})           # ya no es el guardado: no borra
+    assert registro.reclamar("k", "h") == {"job_id": "j1"}
+    registro.olvidar("k", {"job_id": "j1"})
+    assert registro.reclamar("k", "h") is None
+
+
+def test_en_curso_tras_la_espera(tmp_path):
+    registro = RegistroIdempotencia(str(tmp_path / "i.sqlite3"), espera=0.1, sondeo=0.02)
+    registro.reclamar("k", "h")
+
+    with pytest.raises(EnCurso):
+        registro.reclamar("k", "h")
+
+
+def test_reserva_abandonada_y_ventana_vencida(tmp_path):
+    registro = RegistroIdempotencia(str(tmp_path / "i.sqlite3"), ventana=3600, concesion=0, espera=1)
+    registro.reclamar("k", "h")
+    time.sleep(0.01)
+    assert registro.reclamar("k", "h") is None          # el worker que la tenía murió
+
+    vencido = RegistroIdempotencia(str(tmp_path / "i.sqlite3"), ventana=0)
+    vencido.completar("k", {"doc_id": "d1"})
+    time.sleep(0.01)
+    assert vencido.reclamar("k", "otra huella") is None
+    assert vencido.purgar() == 0                        # la reserva nueva sigue en curso
+
+
+def test_esperas_concurrentes(registro):
+    sellados = []
+    def peticion(_):
+        resultado = registro.reclamar("k", "h")
+        if resultado is None:
+            time.sleep(0.2)                             # sellando
+            sellados.append(1)
+            resultado = {"doc_id": "d1"}
+            registro.completar("k", resultado)
+        return resultado
+
+    with ThreadPoolExecutor(8) as ex:
+        resultados = list(ex.map(peticion, range(8)))
+
+    assert sellados == [1]
+    assert resultados == [{"doc_id": "d1"}] * 8
+
+
+def test_huella_depende_del_pdf_y_los_metadatos(tmp_path):
+    ruta = tmp_path / "a.pdf"
+    ruta.write_bytes(b"%PDF-1.4 a")
+
+    assert huella_peticion(str(ruta), {"a": 1, "b": 2}) == huella_peticion(str(ruta), {"b": 2, "a": 1})
+    assert huella_peticion(str(ruta), {"a": 1}) != huella_peticion(str(ruta), {"a": 2})
+
+
+def test_sign_con_idempotency_key(cliente, pdf_original):
+    clave = {"Idempotency-Key": str(uuid.uuid4())}
+    meta = dict(META, area="Idempotencia")
+
+    primero = sellar_en_app(cliente, pdf_original, meta, headers=clave)
+    repetido = sellar_en_app(cliente, pdf_original, meta, headers=clave)
+
+    assert primero.headers["Idempotent-Replayed"] == "false"
+    assert repetido.headers["Idempotent-Replayed"] == "true"
+    assert repetido.json["doc_id"] == primero.json["doc_id"]
+    otro_pdf = sellar_en_app(cliente, pdf_original + b"\n", meta, headers=clave)
+    assert otro_pdf.status_code == 422
+    assert sellar_en_app(cliente, pdf_original, meta, headers={"Idempotency-Key": "x" * 256}).status_code == 400
+
+
+def test_sign_sin_clave_usa_la_huella(cliente, pdf_original):
+    meta = dict(META, area="Huella")
+    primero = sellar_en_app(cliente, pdf_original, meta).json["doc_id"]
+
+    assert sellar_en_app(cliente, pdf_original, meta).json["doc_id"] == primero
+    assert sellar_en_app(cliente, pdf_original, dict(meta, uploader="eva")).json["doc_id"] != primero
+
+
+def test_sign_concurrente_sella_una_vez(servidor, pdf_original):
+    meta = dict(META, area=f"Concurrente {uuid.uuid4()}")
+    def peticion(_):
+        return sellar_en_app(servidor.app.test_client(), pdf_original, meta).json["doc_id"]
+
+    with ThreadPoolExecutor(4) as ex:
+        doc_ids = set(ex.map(peticion, range(4)))
+
+    assert len(doc_ids) == 1
+
+
+def test_trabajo_fallido_no_se_repite(cliente):
+    query = dict(META, area=f"Fallido {uuid.uuid4()}", **{"async": "1"})
+    def encolar():
+        return cliente.post("/sign-json", query_string=query, data=b"esto no es un PDF",
+                            content_type="application/pdf")
+
+    primero = encolar()
+    job_id = primero.json["job_id"]
+    fin = time.monotonic() + 30
+    while cliente.get(f"/jobs/{job_id}").json["estado"] != "error":
+        assert time.monotonic() < fin
+        time.sleep(0.05)
+
+    reintento = encolar()
+
+    assert reintento.headers["Idempotent-Replayed"] == "false"
+    assert reintento.json["job_id"] != job_id
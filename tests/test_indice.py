@@ -0,0 +1,58 @@
+# tests/test_indice.py
+"""Índice SQLite de documentos: escrito al sellar y completado al leer documentos anteriores."""
+import json, uuid
+
+from sello_monarca.indice import IndiceDocumentos, hash_archivo, reconstruir
+from sello_monarca.sello import sell
+
+from tests.conftest import META, sellar_en_app
+
+
+def test_sign_registra_el_documento(servidor, cliente, pdf_original):
+    doc_id = sellar_en_app(cliente, pdf_original).json["doc_id"]
+
+    fila = servidor.INDICE.obtener(doc_id)
+
+    with servidor.ALMACEN.abrir(doc_id) as f:
+        assert fila["sha256"] == hash_archivo(f.read())
+    assert fila["uploader"] == META["uploader"]
+    assert json.loads(fila["meta_json"])["id"] == doc_id
+
+
+def test_documento_anterior_al_indice(servidor, cliente, pdf_original):
+    sellado, doc_id = sell(pdf_original, META, servidor.PRIVATE_KEY)
+    servidor.ALMACEN.guardar_bytes(doc_id, sellado)
+    assert servidor.INDICE.obtener(doc_id) is None
+
+    r = cliente.get(f"/v/{doc_id}")
+
+    assert r.status_code == 200
+    assert "NO VÁLIDO" not in r.text
+    assert servidor.INDICE.obtener(doc_id)["sha256"] == hash_archivo(sellado)
+
+
+def test_documento_sin_sello(servidor, cliente, pdf_original):
+    doc_id = uuid.uuid4().hex
+    servidor.ALMACEN.guardar_bytes(doc_id, pdf_original)
+
+    r = cliente.get(f"/v/{doc_id}")
+
+    assert r.status_code == 200
+    assert "NO VÁLIDO" in r.text
+    assert cliente.get(f"/download/{doc_id}").status_code == 404
+    assert cliente.get(f"/file/{doc_id}").status_code == 404
+    assert servidor.INDICE.obtener(doc_id) is None
+
+
+def test_reconstruir_omite_documentos_sin_sello(servidor, cliente, pdf_original, tmp_path):
+    doc_id = sellar_en_app(cliente, pdf_original).json["doc_id"]
+    sin_sello = uuid.uuid4().hex
+    servidor.ALMACEN.guardar_bytes(sin_sello, pdf_original)
+    indice = IndiceDocumentos(str(tmp_path / "indice.sqlite3"))
+
+    escritas = reconstruir(indice, servidor.ALMACEN, workers=1)
+
+    assert escritas == len(indice.ids())
+    assert indice.obtener(doc_id) == servidor.INDICE.obtener(doc_id)
+    assert sin_sello not in indice.ids()
+    assert all(json.loads(indice.obtener(d)["meta_json"])["id"] == d for d in indice.ids())
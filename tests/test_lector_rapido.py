@@ -0,0 +1,103 @@
+# tests/test_lector_rapido.py
+"""La lectura de /Info desde la cola del PDF coincide con la de PdfReader."""
+from io import BytesIO
+
+import pytest
+from PyPDF2 import PdfReader, generic
+from PyPDF2.errors import PyPdfError
+
+from sello_monarca import compacto, sello
+from sello_monarca.incremental import serializar
+from sello_monarca.lector_rapido import leer_info, leer_meta
+from sello_monarca.sello import META_KEY, leer_meta_json, sell, verify
+
+from tests.conftest import META
+
+
+def _info_pypdf(pdf: bytes) -> dict:
+    return {k: str(v) for k, v in PdfReader(BytesIO(pdf)).metadata.items()}
+
+
+def _info_en_objstm(info: bytes, largo: bytes = b"6 0 R") -> bytes:
+    """/Info (objeto 5) dentro de un object stream (4) con /Length indirecto (objeto 6)."""
+    out = bytearray(b"%PDF-1.5\n")
+    offsets = {}
+
+    def objeto(num: int, cuerpo: bytes) -> None:
+        offsets[num] = len(out)
+        out.extend(b"%d 0 obj\n" % num + cuerpo + b"\nendobj\n")
+
+    datos = b"5 0 " + info
+    objeto(1, b"<</Type/Catalog/Pages 2 0 R>>")
+    objeto(2, b"<</Type/Pages/Kids[3 0 R]/Count 1>>")
+    objeto(3, b"<</Type/Page/Parent 2 0 R/MediaBox[0 0 200 200]>>")
+    objeto(4, b"<</Type/ObjStm/N 1/First 4/Length %s>>\nstream\n" % largo + datos + b"\nendstream")
+    objeto(6, b"%d" % len(datos))
+    xref = len(out)
+    filas = b"\x00\x00\x00\x00\x00\xff\xff"
+    for num in range(1, 8):
+        tipo, campo = (2, 4) if num == 5 else (1, offsets.get(num, xref))
+        filas += bytes([tipo]) + campo.to_bytes(4, "big") + b"\x00\x00"
+    out += b"7 0 obj\n<</Type/XRef/Size 8/W[1 4 2]/Root 1 0 R/Info 5 0 R/Length %d>>\nstream\n" % len(filas)
+    out += filas + b"\nendstream\nendobj\nstartxref\n%d\n%%%%EOF\n" % xref
+    return bytes(out)
+
+
+def _info_sellada(llave, pdf_original) -> bytes:
+    sellado, _ = sell(pdf_original, META, llave)
+    meta = generic.TextStringObject(_info_pypdf(sellado)[META_KEY])
+    return b"<</Title(Informe)/CM_META " + serializar(meta) + b">>"
+
+
+def test_info_con_tabla_xref_clasica(llave, pdf_original):
+    sellado, _ = sell(pdf_original, META, llave)
+
+    info = leer_info(sellado)
+
+    assert {k: str(v) for k, v in info.items()} == _info_pypdf(sellado)
+    assert leer_meta(sellado, META_KEY) == _info_pypdf(sellado)[META_KEY]
+
+
+def test_info_con_xref_stream_y_object_streams(pdf_original):
+    # compactar() escribe xref stream y guarda /Info dentro de un object stream
+    compactado = compacto.compactar(pdf_original)
+
+    info = leer_info(compactado)
+
+    assert info
+    assert {k: str(v) for k, v in info.items()} == _info_pypdf(compactado)
+
+
+def test_object_stream_con_length_indirecto(llave, pdf_original):
+    pdf = _info_en_objstm(_info_sellada(llave, pdf_original))
+
+    assert {k: str(v) for k, v in leer_info(pdf).items()} == _info_pypdf(pdf)
+    assert verify(pdf, llave.public_key())[0]
+
+
+def test_length_circular():
+    # El /Length del object stream es el propio object stream
+    pdf = _info_en_objstm(b"<</Title(Informe)>>", largo=b"4 0 R")
+
+    with pytest.raises((ValueError, PyPdfError)):
+        leer_info(pdf)
+
+
+def test_cualquier_falla_de_la_via_rapida_usa_pdfreader(llave, pdf_original, monkeypatch):
+    sellado, _ = sell(pdf_original, META, llave)
+
+    def falla(*_):
+        raise AttributeError("vía rápida rota")
+
+    monkeypatch.setattr(sello, "leer_meta", falla)
+
+    assert leer_meta_json(sellado) == _info_pypdf(sellado)[META_KEY]
+
+
+def test_clave_ausente(pdf_original):
+    assert leer_meta(pdf_original, META_KEY) is None
+
+
+def test_archivo_que_no_es_pdf():
+    with pytest.raises((ValueError, PyPdfError)):
+        leer_info(b"esto no es un PDF" * 100)
@@ -0,0 +1,56 @@
+# tests/test_llaves.py
+"""kid de las llaves y registro de llaves públicas para la rotación."""
+from hashlib import sha256
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from sello_monarca.llaves import RegistroLlaves, cargar_llave_publica, generar_llaves, kid
+
+
+def test_kid_igual_para_la_privada_y_la_publica(llave):
+    otra = ec.generate_private_key(ec.SECP256R1())
+
+    assert kid(llave) == kid(llave.public_key())
+    assert len(kid(llave)) == 16 and int(kid(llave), 16) >= 0
+    assert kid(llave) != kid(otra)
+
+
+def test_kid_no_depende_del_objeto(llave):
+    pem = llave.public_key().public_bytes(serialization.Encoding.PEM,
+                                          serialization.PublicFormat.SubjectPublicKeyInfo)
+
+    assert kid(serialization.load_pem_public_key(pem)) == kid(llave)
+
+
+def test_kid_de_llaves_temporales():
+    # Las llaves se liberan en cada vuelta y CPython reutiliza sus id()
+    for _ in range(50):
+        publica = ec.generate_private_key(ec.SECP256R1()).public_key()
+        der = publica.public_bytes(serialization.Encoding.DER,
+                                   serialization.PublicFormat.SubjectPublicKeyInfo)
+        assert kid(publica) == sha256(der).hexdigest()[:16]
+
+
+def test_candidatas_por_kid(llave):
+    otra = ec.generate_private_key(ec.SECP256R1()).public_key()
+    registro = RegistroLlaves([llave.public_key()])
+
+    k = registro.agregar(otra)
+
+    assert len(registro) == 2 and k in registro
+    assert registro.obtener(k) is otra
+    assert registro.candidatas({"kid": k}) == [otra]
+    assert registro.candidatas({"kid": "0" * 16}) == []
+    # Sellos anteriores a los kid: todas las llaves
+    assert len(registro.candidatas({})) == 2
+
+
+def test_cargar_directorio(tmp_path):
+    for nombre in ("a", "b"):
+        generar_llaves(str(tmp_path / f"{nombre}.key"), str(tmp_path / f"{nombre}.pem"))
+    (tmp_path / "notas.txt").write_text("no es una llave")
+    registro = RegistroLlaves()
+
+    assert registro.cargar_directorio(str(tmp_path)) == 2
+    assert set(registro.kids()) == {kid(cargar_llave_publica(str(tmp_path / f"{n}.pem"))) for n in "ab"}
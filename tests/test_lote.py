@@ -0,0 +1,117 @@
+# tests/test_lote.py
+"""Sellado por lotes: árbol de Merkle, pruebas de inclusión y /sign-batch."""
+import io, json, zipfile
+from hashlib import sha256
+
+import pytest
+
+from sello_monarca import merkle
+from sello_monarca.sello import sell_batch, verificar_meta, verify
+
+from tests.conftest import META
+
+
+@pytest.mark.parametrize("n", range(1, 10))
+def test_cada_prueba_lleva_a_la_raiz(n):
+    hojas = [merkle.hash_hoja(b"doc %d" % i) for i in range(n)]
+
+    raiz, pruebas = merkle.construir(hojas)
+
+    assert len(pruebas) == n
+    assert all(merkle.raiz_desde_prueba(h, p) == raiz for h, p in zip(hojas, pruebas))
+    otra = merkle.hash_hoja(b"otro")
+    assert all(merkle.raiz_desde_prueba(otra, p) != raiz for p in pruebas)
+
+
+def test_nodo_sin_pareja_no_se_duplica():
+    hojas = [merkle.hash_hoja(b"doc %d" % i) for i in range(3)]
+
+    assert merkle.construir(hojas)[0] != merkle.construir(hojas + hojas[-1:])[0]
+
+
+def test_hoja_y_nodo_no_se_confunden():
+    a, b = merkle.hash_hoja(b"a"), merkle.hash_hoja(b"b")
+
+    assert merkle.hash_hoja(a + b) != merkle.hash_nodo(a, b)
+    assert merkle.hash_hoja(b"a") != sha256(b"a").digest()
+
+
+def test_lote_vacio_y_prueba_mal_formada():
+    with pytest.raises(ValueError):
+        merkle.construir([])
+    with pytest.raises(ValueError):
+        merkle.raiz_desde_prueba(merkle.hash_hoja(b"a"), ["X:" + "00" * 32])
+
+
+def test_sell_batch_una_firma_y_documentos_verificables(llave, pdf_original):
+    metas_usuario = [dict(META, original_filename=f"doc{i}.pdf") for i in range(5)]
+
+    sellados = sell_batch([(pdf_original, m) for m in metas_usuario], llave)
+
+    metas = []
+    for (pdf, doc_id), meta_usuario in zip(sellados, metas_usuario):
+        valido, meta = verify(pdf, llave.public_key(), contenido=True)
+        assert valido
+        assert meta["id"] == doc_id
+        assert meta["original_filename"] == meta_usuario["original_filename"]
+        metas.append(meta)
+    assert len({m["signature"] for m in metas}) == 1
+    assert len({m["merkle"]["root"] for m in metas}) == 1
+    assert {m["merkle"]["batch_size"] for m in metas} == {5}
+
+
+def test_prueba_de_otro_documento_no_verifica(llave, pdf_original):
+    sellados = sell_batch([(pdf_original, META), (pdf_original, META)], llave)
+    (_, meta0), (_, meta1) = (verify(pdf, llave.public_key()) for pdf, _ in sellados)
+
+    meta0["merkle"]["proof"] = meta1["merkle"]["proof"]
+    assert not verificar_meta(meta0, llave.public_key())
+
+    meta1["merkle"]["root"] = "00" * 32
+    assert not verificar_meta(meta1, llave.public_key())
+
+
+def test_metadatos_alterados_en_el_lote(llave, pdf_original):
+    (pdf, _), _ = sell_batch([(pdf_original, META), (pdf_original, META)], llave)
+    _, meta = verify(pdf, llave.public_key())
+
+    meta["uploader"] = "eva"
+
+    assert not verificar_meta(meta, llave.public_key())
+
+
+def test_sign_batch(servidor, cliente, pdf_original):
+    archivos = [(io.BytesIO(pdf_original), f"f{i}.pdf") for i in range(3)]
+
+    r = cliente.post("/sign-batch", data={"files": archivos, "meta": json.dumps(META)})
+
+    assert r.status_code == 200
+    assert r.json["count"] == 3
+    for i, doc in enumerate(r.json["documents"]):
+        assert doc["original_filename"] == f"f{i}.pdf"
+        valido, meta = verify(cliente.get(f"/file/{doc['doc_id']}").get_data(),
+                              servidor.PUBLIC_KEY, contenido=True)
+        assert valido and meta["merkle"]["batch_size"] == 3
+        assert "NO VÁLIDO" not in cliente.get(f"/v/{doc['doc_id']}").text
+
+
+def test_sign_batch_con_zip(cliente, pdf_original):
+    datos = io.BytesIO()
+    with zipfile.ZipFile(datos, "w") as zf:
+        zf.writestr("carpeta/a.pdf", pdf_original)
+        zf.writestr("b.PDF", pdf_original)
+        zf.writestr("leeme.txt", "no es un PDF")
+        zf.writestr("__MACOSX/carpeta/._a.pdf", b"")
+    datos.seek(0)
+
+    r = cliente.post("/sign-batch", data={"zip": (datos, "lote.zip"), "meta": json.dumps(META)})
+
+    assert r.status_code == 200
+    assert [d["original_filename"] for d in r.json["documents"]] == ["a.pdf", "b.PDF"]
+
+
+def test_sign_batch_sin_pdfs(cliente):
+    r = cliente.post("/sign-batch", data={"meta": json.dumps(META)})
+
+    assert r.status_code == 400
+    assert "error" in r.json
@@ -0,0 +1,85 @@
+# tests/test_masivo.py
+"""Sellado masivo fuera de línea: árbol de PDFs, errores y reanudación."""
+import pytest
+from cryptography.hazmat.primitives import serialization
+
+from sello_monarca import masivo
+from sello_monarca.almacen import AlmacenLocal
+from sello_monarca.indice import IndiceDocumentos
+from sello_monarca.sello import verify
+
+
+@pytest.fixture
+def ruta_llave(llave, tmp_path):
+    ruta = tmp_path / "privada.pem"
+    ruta.write_bytes(llave.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+        serialization.BestAvailableEncryption(b"secreto")))
+    return str(ruta)
+
+
+@pytest.fixture
+def origen(tmp_path, pdf_original):
+    raiz = tmp_path / "legado"
+    (raiz / "a" / "b").mkdir(parents=True)
+    (raiz / "a" / "1.pdf").write_bytes(pdf_original)
+    (raiz / "a" / "b" / "2.PDF").write_bytes(pdf_original)
+    (raiz / "roto.pdf").write_bytes(b"esto no es un PDF")
+    (raiz / "leeme.txt").write_text("no se sella")
+    return raiz
+
+
+def _sellar(origen, storage, ruta_llave, **kwargs):
+    kwargs.setdefault("workers", 0)
+    return masivo.sellar_arbol(str(origen), str(storage), {"uploader": "migracion", "area": "Archivo"},
+                               "http://x/v/", ruta_llave=ruta_llave, password=b"secreto",
+                               sincronizar=False, reporte=0, **kwargs)
+
+
+def test_buscar_pdfs_en_orden(origen):
+    assert [r for _, r in masivo.buscar_pdfs(str(origen))] == ["roto.pdf", "a/1.pdf", "a/b/2.PDF"]
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_sella_el_arbol_e_indexa(origen, tmp_path, ruta_llave, llave, workers):
+    storage = tmp_path / "storage"
+
+    resultado = _sellar(origen, storage, ruta_llave, workers=workers)
+
+    assert (resultado["sellados"], resultado["errores"], resultado["omitidos"]) == (2, 1, 0)
+    indice = IndiceDocumentos(str(storage / "indice.sqlite3"))
+    almacen = AlmacenLocal(str(storage))
+    assert indice.ids() == set(almacen.ids())
+    rutas = set()
+    for doc_id in indice.ids():
+        with almacen.abrir(doc_id) as f:
+            valido, meta = verify(f.read(), llave.public_key(), contenido=True)
+        assert valido and meta["area"] == "Archivo"
+        rutas.add(meta["original_path"])
+    assert rutas == {"a/1.pdf", "a/b/2.PDF"}
+    progreso = masivo.Progreso(str(storage / "masivo.sqlite3"))
+    assert progreso.resumen() == {masivo.LISTO: 2, masivo.ERROR: 1}
+
+
+def test_reanuda_y_reintenta_errores(origen, tmp_path, ruta_llave, pdf_original):
+    storage = tmp_path / "storage"
+    _sellar(origen, storage, ruta_llave)
+
+    assert _sellar(origen, storage, ruta_llave)["sellados"] == 0
+    (origen / "roto.pdf").write_bytes(pdf_original)
+    assert _sellar(origen, storage, ruta_llave)["omitidos"] == 3
+
+    resultado = _sellar(origen, storage, ruta_llave, reintentar_errores=True)
+
+    assert (resultado["sellados"], resultado["omitidos"]) == (1, 2)
+    assert len(IndiceDocumentos(str(storage / "indice.sqlite3")).ids()) == 3
+
+
+def test_cli(origen, tmp_path, ruta_llave, capsys):
+    storage = tmp_path / "storage"
+
+    masivo.main([str(origen), "--storage", str(storage), "--llave", ruta_llave, "--workers", "0",
+                 "--reporte", "0", "--sin-fsync", "--area", "Archivo"])
+
+    assert capsys.readouterr().out.startswith("2 sellados, 1 errores, 0 ya hechos")
+    assert len(IndiceDocumentos(str(storage / "indice.sqlite3")).ids()) == 2
@@ -0,0 +1,68 @@
+# tests/test_memoria.py
+"""El sellado de archivo a archivo no carga el PDF en memoria, con ningún perfil."""
+import mmap, os, shutil, subprocess, sys
+from hashlib import sha256
+
+import pytest
+
+from sello_monarca.memoria import bloques
+from sello_monarca.sello import sellar_en, verify
+
+from tests.conftest import META, RAIZ, sellar_en_app
+
+import bench_memoria
+
+MB_ENTRADA = int(os.getenv("SELLO_TEST_MB", "500"))
+LIMITE_MB = 200
+
+
+@pytest.mark.lento
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="VmHWM sólo existe en Linux")
+@pytest.mark.parametrize("modo", ["archivo", "compacto"])
+def test_pico_acotado_con_pdf_grande(tmp_path, modo):
+    if shutil.disk_usage(tmp_path).free < 3 * MB_ENTRADA * 1024 * 1024:
+        pytest.skip("no hay espacio para el PDF de prueba")
+    entrada, salida = tmp_path / "grande.pdf", tmp_path / "sellado.pdf"
+    bench_memoria.pdf_grande(str(entrada), MB_ENTRADA)
+
+    # Proceso nuevo: el pico no incluye lo que haya cargado pytest
+    r = subprocess.run(
+        [sys.executable, bench_memoria.__file__, "--medir", modo, str(entrada), str(salida)],
+        capture_output=True, text=True, check=True, cwd=RAIZ,
+    )
+    pico_kb, _, _, valido = r.stdout.split()
+
+    assert valido == "1"
+    assert os.path.getsize(salida) > os.path.getsize(entrada)
+    assert int(pico_kb) / 1024 < LIMITE_MB
+
+
+def test_bloques_de_un_mmap(tmp_path):
+    datos = os.urandom(3 * 1024 + 5)
+    ruta = tmp_path / "datos.bin"
+    ruta.write_bytes(datos)
+
+    with open(ruta, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        assert b"".join(bytes(b) for b in bloques(m, 1024)) == datos
+        assert b"".join(bytes(b) for b in bloques(m, 1024, fin=2000)) == datos[:2000]
+
+
+def test_sellar_de_archivo_a_archivo(llave, pdf_original, tmp_path):
+    entrada, salida = tmp_path / "entrada.pdf", tmp_path / "sellado.pdf"
+    entrada.write_bytes(pdf_original)
+
+    with open(salida, "wb") as f:
+        doc_id, sha_archivo = sellar_en(str(entrada), f, META, llave)
+
+    assert sha_archivo == sha256(salida.read_bytes()).hexdigest()
+    valido, meta = verify(str(salida), llave.public_key(), contenido=True)
+    assert valido and meta["id"] == doc_id
+
+
+def test_sign_no_deja_temporales(servidor, cliente, pdf_original):
+    antes = set(os.listdir(servidor.SPOOL_DIR))
+
+    assert sellar_en_app(cliente, pdf_original, dict(META, area="Spool")).status_code == 200
+
+    assert set(os.listdir(servidor.SPOOL_DIR)) == antes
+    assert os.listdir(os.path.join(servidor.STORAGE_DIR, "tmp")) == []
@@ -0,0 +1,58 @@
+# tests/test_metricas.py
+"""Histogramas por etapa: desactivados no miden; activados se suman entre procesos."""
+import subprocess, sys
+
+from sello_monarca import metricas
+
+from tests.conftest import RAIZ
+
+_PROCESO = """
+import sys
+from sello_monarca import metricas
+metricas.activar(sys.argv[1], intervalo=3600)
+metricas.observar("sello_entrada_bytes", 20000, operacion="sellar")
+metricas.observar("sello_entrada_bytes", 50000, operacion="sellar")
+with metricas.etapa("portada"):
+    pass
+"""
+
+_EXPORTAR = """
+import sys
+from sello_monarca import metricas
+metricas.activar(sys.argv[1], intervalo=3600)
+print(metricas.exportar())
+"""
+
+
+def test_desactivadas_no_miden(cliente):
+    assert not metricas.activo()
+    assert metricas.etapa("portada") is metricas.etapa("firma")
+    metricas.observar("sello_entrada_bytes", 1)
+    assert metricas._DATOS == {}
+    assert cliente.get("/metrics").status_code == 404
+
+
+def test_suma_de_varios_procesos(tmp_path):
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", _PROCESO, str(tmp_path)], cwd=RAIZ, check=True)
+
+    texto = subprocess.run([sys.executable, "-c", _EXPORTAR, str(tmp_path)], cwd=RAIZ, check=True,
+                           capture_output=True, text=True).stdout
+
+    lineas = set(texto.splitlines())
+    assert "# TYPE sello_entrada_bytes histogram" in lineas
+    assert 'sello_entrada_bytes_bucket{operacion="sellar",le="10000"} 0' in lineas
+    assert 'sello_entrada_bytes_bucket{operacion="sellar",le="100000"} 4' in lineas
+    assert 'sello_entrada_bytes_bucket{operacion="sellar",le="+Inf"} 4' in lineas
+    assert 'sello_entrada_bytes_sum{operacion="sellar"} 140000' in lineas
+    assert 'sello_etapa_segundos_count{etapa="portada"} 2' in lineas
+
+
+def test_archivo_de_otra_version_se_ignora(tmp_path):
+    (tmp_path / "metricas-1.json").write_text('[["sello_paginas", {}, [1, 2]]]')
+    (tmp_path / "metricas-2.json").write_text("{roto")
+
+    texto = subprocess.run([sys.executable, "-c", _EXPORTAR, str(tmp_path)], cwd=RAIZ, check=True,
+                           capture_output=True, text=True).stdout
+
+    assert "sello_paginas_count" not in texto
@@ -0,0 +1,69 @@
+# tests/test_paginas.py
+"""Páginas públicas: /v con ETag y gzip, /verify-ui y recursos versionados en /assets."""
+import gzip, re
+
+import pytest
+
+from sello_monarca.paginas import RecursosEstaticos, fecha_legible
+
+from tests.conftest import META, sellar_en_app
+
+
+def test_fecha_legible():
+    assert fecha_legible("2025-05-30T23:12:35Z") == "30 mayo 2025, 17:12 (MTY)"
+    assert fecha_legible("ayer") == "ayer"
+
+
+def test_recursos_fuera_del_directorio(tmp_path):
+    (tmp_path / "a.css").write_text("body {}")
+    recursos = RecursosEstaticos(str(tmp_path))
+
+    assert recursos.obtener("a.css").mimetype == "text/css; charset=utf-8"
+    for nombre in ("../a.css", "sub/a.css", "no.css"):
+        with pytest.raises(FileNotFoundError):
+            recursos.obtener(nombre)
+
+
+def test_pagina_de_verificacion(cliente, pdf_original):
+    doc_id = sellar_en_app(cliente, pdf_original).json["doc_id"]
+
+    r = cliente.get(f"/v/{doc_id}")
+
+    assert r.status_code == 200
+    assert "VÁLIDO" in r.text and "NO VÁLIDO" not in r.text
+    assert META["original_filename"] in r.text and doc_id in r.text
+    assert r.cache_control.max_age is not None
+    revalidada = cliente.get(f"/v/{doc_id}", headers={"If-None-Match": r.headers["ETag"]})
+    assert revalidada.status_code == 304
+    assert revalidada.get_data() == b""
+
+
+def test_pagina_comprimida(cliente, pdf_original):
+    doc_id = sellar_en_app(cliente, pdf_original).json["doc_id"]
+    plano = cliente.get(f"/v/{doc_id}")
+
+    r = cliente.get(f"/v/{doc_id}", headers={"Accept-Encoding": "gzip"})
+
+    assert r.content_encoding == "gzip"
+    assert gzip.decompress(r.get_data()) == plano.get_data()
+    assert "Accept-Encoding" in r.vary
+
+
+def test_documento_inexistente(cliente):
+    assert cliente.get("/v/no-existe").status_code == 404
+
+
+def test_verify_ui_y_recursos_versionados(cliente):
+    r = cliente.get("/verify-ui")
+    assert r.status_code == 200
+    assert cliente.get("/verify-ui", headers={"If-None-Match": r.headers["ETag"]}).status_code == 304
+
+    urls = re.findall(r'/assets/[^"?]+\?v=[0-9a-f]+', r.text)
+    assert urls
+    for url in urls:
+        recurso = cliente.get(url)
+        assert recurso.status_code == 200
+        assert recurso.cache_control.immutable
+        sin_version = cliente.get(url.split("?")[0])
+        assert not sin_version.cache_control.immutable
+    assert cliente.get("/assets/../app.py").status_code == 404
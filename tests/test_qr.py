@@ -0,0 +1,51 @@
+# tests/test_qr.py
+"""Portada QR: plantilla en caché y QR vectorial o raster."""
+from io import BytesIO
+
+import pytest
+from PyPDF2 import PdfReader
+
+from sello_monarca.qr_handler import MODOS_QR, generar_pagina_qr_bytes
+
+URL = "https://mi-app.com/v/abc123"
+
+
+def _pagina(pdf: bytes):
+    reader = PdfReader(BytesIO(pdf))
+    assert len(reader.pages) == 1
+    return reader.pages[0]
+
+
+@pytest.mark.parametrize("modo", MODOS_QR)
+def test_portada_de_una_pagina_con_enlace(modo):
+    pagina = _pagina(generar_pagina_qr_bytes(URL, "abc123", modo))
+
+    [anotacion] = [a.get_object() for a in pagina["/Annots"]]
+    assert anotacion["/A"]["/URI"] == URL
+    texto = pagina.extract_text()
+    assert URL in texto and "ID del documento: abc123" in texto
+
+
+def test_qr_vectorial_sin_imagen():
+    xobjects = _pagina(generar_pagina_qr_bytes(URL, "abc123", "vector"))["/Resources"]["/XObject"]
+
+    assert list(xobjects) == ["/Plantilla"]
+
+
+def test_qr_raster_como_imagen():
+    xobjects = _pagina(generar_pagina_qr_bytes(URL, "abc123", "raster"))["/Resources"]["/XObject"]
+
+    assert xobjects["/QR"].get_object()["/Subtype"] == "/Image"
+
+
+def test_la_plantilla_se_comparte_entre_portadas():
+    una, otra = (generar_pagina_qr_bytes(f"{URL}{i}", f"doc{i}") for i in range(2))
+
+    assert una != otra
+    plantilla = lambda pdf: _pagina(pdf)["/Resources"]["/XObject"]["/Plantilla"].get_object().get_data()
+    assert plantilla(una) == plantilla(otra)
+
+
+def test_modo_desconocido():
+    with pytest.raises(ValueError):
+        generar_pagina_qr_bytes(URL, modo_qr="svg")
@@ -0,0 +1,100 @@
+# tests/test_refirma.py
+"""Re-firma de sellos con una llave nueva (rotación)."""
+import json
+from hashlib import sha256
+from io import BytesIO
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from sello_monarca import masivo, refirma
+from sello_monarca.almacen import AlmacenLocal
+from sello_monarca.indice import IndiceDocumentos
+from sello_monarca.llaves import RegistroLlaves, kid
+from sello_monarca.sello import refirmar_en, sell, sell_batch, verify
+
+from tests.conftest import META
+
+
+@pytest.fixture(scope="module")
+def llave_nueva():
+    return ec.generate_private_key(ec.SECP256R1())
+
+
+def _refirmar(sellado: bytes, llave_nueva, publica):
+    salida = BytesIO()
+    meta, sha = refirmar_en(sellado, salida, llave_nueva, publica)
+    return salida.getvalue(), meta, sha
+
+
+def test_el_sello_refirmado_verifica_con_la_llave_nueva(llave, llave_nueva, pdf_original):
+    sellado, doc_id = sell(pdf_original, META, llave)
+
+    refirmado, meta, sha = _refirmar(sellado, llave_nueva, llave.public_key())
+
+    assert refirmado.startswith(sellado)
+    assert meta["id"] == doc_id and meta["kid"] == kid(llave_nueva)
+    assert sha == sha256(refirmado).hexdigest()
+    assert verify(refirmado, llave_nueva.public_key(), contenido=True)[0]
+    assert not verify(refirmado, llave.public_key())[0]
+    # Con las dos llaves en el registro, verifican el original y el refirmado
+    registro = RegistroLlaves([llave.public_key(), llave_nueva.public_key()])
+    assert verify(sellado, registro)[0] and verify(refirmado, registro)[0]
+
+
+def test_el_sello_de_lote_queda_individual(llave, llave_nueva, pdf_original):
+    [(sellado, _)] = sell_batch([(pdf_original, META)], llave)
+
+    refirmado, meta, _ = _refirmar(sellado, llave_nueva, llave.public_key())
+
+    assert "merkle" not in meta
+    assert verify(refirmado, llave_nueva.public_key(), contenido=True)[0]
+
+
+def test_no_refirma_un_sello_alterado(llave, llave_nueva, pdf_original):
+    sellado, _ = sell(pdf_original, META, llave)
+    alterado = sellado.replace(b'"uploader":"ana"', b'"uploader":"eva"')
+
+    with pytest.raises(ValueError):
+        _refirmar(alterado, llave_nueva, llave.public_key())
+    with pytest.raises(ValueError):
+        _refirmar(sellado, llave_nueva, llave_nueva.public_key())
+
+
+def _pem_privada(llave, ruta):
+    ruta.write_bytes(llave.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+        serialization.BestAvailableEncryption(b"secreto")))
+    return str(ruta)
+
+
+def test_refirmar_almacen(llave, llave_nueva, pdf_original, tmp_path):
+    origen, storage, publicas = tmp_path / "origen", tmp_path / "storage", tmp_path / "publicas"
+    origen.mkdir()
+    publicas.mkdir()
+    for i in range(3):
+        (origen / f"{i}.pdf").write_bytes(pdf_original)
+    masivo.sellar_arbol(str(origen), str(storage), {"area": "Archivo"}, "http://x/v/",
+                        ruta_llave=_pem_privada(llave, tmp_path / "vieja.key"), password=b"secreto",
+                        workers=0, sincronizar=False, reporte=0)
+    (publicas / "vieja.pem").write_bytes(llave.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo))
+    ruta_nueva = _pem_privada(llave_nueva, tmp_path / "nueva.key")
+    indice = IndiceDocumentos(str(storage / "indice.sqlite3"))
+    assert len(indice.ids_sin_kid(kid(llave_nueva))) == 3
+
+    r = refirma.refirmar_almacen(str(storage), ruta_nueva, b"secreto", str(publicas), workers=1,
+                                 nice=0, reporte=0, sincronizar=False)
+
+    assert (r["kid"], r["refirmados"], r["errores"]) == (kid(llave_nueva), 3, 0)
+    assert indice.ids_sin_kid(kid(llave_nueva)) == []
+    almacen = AlmacenLocal(str(storage))
+    for doc_id in almacen.ids():
+        with almacen.abrir(doc_id) as f:
+            valido, meta = verify(f.read(), llave_nueva.public_key(), contenido=True)
+        assert valido and meta["area"] == "Archivo"
+        assert json.loads(indice.obtener(doc_id)["meta_json"])["kid"] == kid(llave_nueva)
+    # Una segunda corrida no tiene nada pendiente
+    assert refirma.refirmar_almacen(str(storage), ruta_nueva, b"secreto", str(publicas), workers=1,
+                                    nice=0, reporte=0, sincronizar=False)["refirmados"] == 0
@@ -0,0 +1,66 @@
+# tests/test_roles.py
+"""SELLO_ROLE=verify: réplica sin llave privada, sin trabajos y sin el stack de la portada."""
+import json, os, subprocess, sys
+
+from tests.conftest import RAIZ, sellar_en_app
+
+_REPLICA = """
+import io, json, sys
+import app
+c = app.app.test_client()
+print(json.dumps({
+    "reportlab": "reportlab" in sys.modules or "qrcode" in sys.modules,
+    "llave": app.PRIVATE_KEY is not None,
+    "trabajos": app.TRABAJOS is not None,
+    "idempotencia": app.IDEMPOTENCIA is not None,
+    "spool": __import__("os").path.exists(app.SPOOL_DIR),
+    "sign": c.post("/sign").status_code,
+    "sign_json": c.post("/sign-json", json={}).status_code,
+    "sign_batch": c.post("/sign-batch").status_code,
+    "jobs": c.get("/jobs/x").status_code,
+    "health": c.get("/health").status_code,
+    "verify": c.post("/verify", data={"file": (io.BytesIO(open(sys.argv[1], "rb").read()), "s.pdf")}).json["valid"],
+}))
+"""
+
+
+def _entorno(servidor, tmp_path, **extra):
+    """Entorno de `servidor` (llaves) con otro STORAGE_DIR y sin la llave privada."""
+    entorno = dict(os.environ, STORAGE_DIR=str(tmp_path / "storage"), **extra)
+    entorno.pop("PRIVATE_KEY_PEM")
+    return entorno
+
+
+def test_replica_de_verificacion(servidor, cliente, pdf_original, tmp_path):
+    doc_id = sellar_en_app(cliente, pdf_original).json["doc_id"]
+    sellado = tmp_path / "sellado.pdf"
+    sellado.write_bytes(cliente.get(f"/file/{doc_id}").get_data())
+
+    r = subprocess.run([sys.executable, "-c", _REPLICA, str(sellado)], cwd=RAIZ,
+                       env=_entorno(servidor, tmp_path, SELLO_ROLE="verify"),
+                       capture_output=True, text=True)
+
+    assert r.returncode == 0, r.stderr
+    assert json.loads(r.stdout.splitlines()[-1]) == {
+        "reportlab": False, "llave": False, "trabajos": False, "idempotencia": False, "spool": False,
+        "sign": 404, "sign_json": 404, "sign_batch": 404, "jobs": 404, "health": 200, "verify": True,
+    }
+
+
+def test_rol_desconocido(servidor, tmp_path):
+    r = subprocess.run([sys.executable, "-c", "import app"], cwd=RAIZ,
+                       env=_entorno(servidor, tmp_path, SELLO_ROLE="sellar"),
+                       capture_output=True, text=True)
+
+    assert r.returncode != 0
+    assert "SELLO_ROLE" in r.stderr
+
+
+def test_sellar_no_importa_reportlab_al_arrancar(servidor, tmp_path):
+    codigo = "import sys, app; print(int('reportlab' in sys.modules))"
+    entorno = dict(os.environ, STORAGE_DIR=str(tmp_path / "storage"))
+
+    r = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, env=entorno,
+                       capture_output=True, text=True, check=True)
+
+    assert r.stdout.split()[-1] == "0"
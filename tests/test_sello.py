@@ -0,0 +1,60 @@
+# tests/test_sello.py
+"""Sellado por actualización incremental y verificación de /CM_META."""
+import json
+from io import BytesIO
+
+from cryptography.hazmat.primitives.asymmetric import ec
+from PyPDF2 import PdfReader
+
+from sello_monarca.sello import META_KEY, sell, verify
+
+from tests.conftest import META
+
+
+def test_el_sellado_anexa_al_original(llave, pdf_original):
+    sellado, doc_id = sell(pdf_original, META, llave)
+
+    assert sellado.startswith(pdf_original)
+    reader = PdfReader(BytesIO(sellado))
+    assert len(reader.pages) == len(PdfReader(BytesIO(pdf_original)).pages) + 1
+    meta = json.loads(reader.metadata[META_KEY])
+    assert meta["id"] == doc_id
+    assert meta["verify_url"].endswith(doc_id)
+
+
+def test_sell_y_verify_en_modo_metadatos(llave, pdf_original):
+    sellado, doc_id = sell(pdf_original, META, llave)
+
+    valido, meta = verify(sellado, llave.public_key())
+
+    assert valido
+    assert meta["id"] == doc_id
+    assert {k: meta[k] for k in META} == META
+
+
+def test_verify_acepta_archivos_y_bytes(llave, pdf_original, tmp_path):
+    sellado, _ = sell(pdf_original, META, llave)
+    ruta = tmp_path / "sellado.pdf"
+    ruta.write_bytes(sellado)
+
+    assert verify(str(ruta), llave.public_key())[0]
+    with open(ruta, "rb") as f:
+        assert verify(f, llave.public_key())[0]
+
+
+def test_metadatos_alterados_no_verifican(llave, pdf_original):
+    sellado, _ = sell(pdf_original, META, llave)
+    # Mismo largo: sólo cambia el uploader dentro de /CM_META
+    alterado = sellado.replace(b'"uploader":"ana"', b'"uploader":"eva"')
+    assert alterado != sellado
+
+    valido, meta = verify(alterado, llave.public_key())
+
+    assert not valido
+    assert meta["uploader"] == "eva"
+
+
+def test_otra_llave_no_verifica(llave, pdf_original):
+    sellado, _ = sell(pdf_original, META, llave)
+
+    assert not verify(sellado, ec.generate_private_key(ec.SECP256R1()).public_key())[0]
@@ -0,0 +1,149 @@
+# tests/test_sharepoint.py
+"""Bandeja de salida a SharePoint: destino local, reintentos y ClienteGraph contra un Graph falso."""
+import json, os, threading
+
+import pytest
+
+from sello_monarca.sharepoint import (ClienteGraph, DestinoArchivos, DestinoGraph, ErrorSharePoint,
+                                      SalidaSharePoint, ERROR, LISTA, LISTO)
+
+from bench_sharepoint import GraphFalso
+
+
+def _fila(doc_id):
+    return {"doc_id": doc_id, "original_filename": f"{doc_id}.pdf", "uploader": "ana",
+            "area": "Calidad", "sha256": "x", "meta_json": json.dumps({"verify_url": f"http://x/v/{doc_id}"})}
+
+
+@pytest.fixture
+def documentos():
+    return {f"doc{i:04d}": os.urandom(2048) for i in range(3)}
+
+
+def _salida(tmp_path, destino, documentos, **kwargs):
+    def abrir(doc_id):
+        ruta = tmp_path / f"{doc_id}.bin"
+        ruta.write_bytes(documentos[doc_id])
+        return open(ruta, "rb"), len(documentos[doc_id])
+    kwargs.setdefault("espera_base", 0)
+    return SalidaSharePoint(str(tmp_path / "salida.sqlite3"), destino, abrir, **kwargs)
+
+
+def test_destino_archivos(tmp_path, documentos):
+    destino = DestinoArchivos(str(tmp_path / "sp"))
+    salida = _salida(tmp_path, destino, documentos)
+    salida.encolar([_fila(d) for d in documentos])
+
+    assert salida.procesar_lote() == 3
+
+    assert salida.estado() == {LISTO: 3}
+    for doc_id, datos in documentos.items():
+        assert (tmp_path / "sp" / "biblioteca" / f"{doc_id}.pdf").read_bytes() == datos
+    with open(tmp_path / "sp" / "lista.jsonl", encoding="utf-8") as f:
+        campos = [json.loads(l)["fields"] for l in f]
+    assert sorted(c["DocId"] for c in campos) == sorted(documentos)
+    assert all(c["VerifyUrl"].endswith(c["DocId"]) and c["ArchivoUrl"].startswith("file://") for c in campos)
+
+
+class _ListaFallaUnaVez(DestinoArchivos):
+    subidas = 0
+    fallo = False
+
+    def subir(self, nombre, archivo, tamano):
+        self.subidas += 1
+        return super().subir(nombre, archivo, tamano)
+
+    def crear_elementos(self, filas):
+        if not self.fallo:
+            self.fallo = True
+            return ["503 saturado"] * len(filas)
+        return super().crear_elementos(filas)
+
+
+def test_fallo_de_la_lista_no_vuelve_a_subir(tmp_path, documentos):
+    destino = _ListaFallaUnaVez(str(tmp_path / "sp"))
+    salida = _salida(tmp_path, destino, documentos)
+    salida.encolar([_fila(d) for d in documentos])
+
+    salida.procesar_lote()
+    assert salida.estado() == {LISTA: 3}
+    salida.procesar_lote()
+
+    assert salida.estado() == {LISTO: 3}
+    assert destino.subidas == 3
+
+
+def test_se_agotan_los_intentos(tmp_path, documentos):
+    destino = DestinoArchivos(str(tmp_path / "sp"), fallos=1.0)
+    salida = _salida(tmp_path, destino, documentos, max_intentos=3)
+    salida.encolar([_fila(d) for d in documentos])
+
+    for _ in range(3):
+        salida.procesar_lote()
+
+    assert salida.estado() == {ERROR: 3}
+    assert salida.procesar_lote() == 0
+
+
+def test_encolar_dos_veces_no_duplica(tmp_path, documentos):
+    salida = _salida(tmp_path, DestinoArchivos(str(tmp_path / "sp")), documentos)
+    salida.encolar([_fila(d) for d in documentos])
+    salida.encolar([_fila(d) for d in documentos])
+
+    assert salida.estado() == {"subir": 3}
+
+
+@pytest.fixture
+def graph():
+    servidor = GraphFalso(fallos=0.0, latencia=0.0)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    cliente = ClienteGraph("t", "c", "s", base_url=servidor.url + "/v1.0",
+                           token_url=servidor.url + "/token", espera_base=0, reintentos=2)
+    yield servidor, cliente
+    cliente.cerrar()
+    servidor.shutdown()
+    servidor.server_close()
+
+
+@pytest.mark.parametrize("tamano", [1000, 700 * 1024])
+def test_destino_graph_sube_y_crea_elementos(tmp_path, graph, tamano):
+    servidor, cliente = graph
+    documentos = {"doc0001": os.urandom(tamano)}
+    # Más de 512 KiB va por sesión de carga en trozos de 320 KiB
+    destino = DestinoGraph(cliente, "sitio", "biblioteca", "lista",
+                           subida_simple_max=512 * 1024, trozo=320 * 1024)
+    salida = _salida(tmp_path, destino, documentos)
+    salida.encolar([_fila("doc0001")])
+
+    salida.procesar_lote()
+
+    assert salida.estado() == {LISTO: 1}
+    assert servidor.archivos["doc0001.pdf"] == documentos["doc0001"]
+    assert servidor.elementos == {"doc0001": 1}
+    assert cliente.estadisticas["conexiones"] == 1
+
+
+def test_graph_reintenta_y_desiste(graph):
+    servidor, cliente = graph
+    servidor.fallos = 1.0
+
+    with pytest.raises(ErrorSharePoint):
+        cliente.json("POST", "/$batch", {"requests": []})
+
+    assert cliente.estadisticas["reintentos"] == 2
+    assert servidor.respuestas[429] == 3
+
+
+def test_contadores_con_varios_hilos(graph):
+    servidor, cliente = graph
+    def peticiones():
+        for _ in range(20):
+            cliente.json("POST", "/$batch", {"requests": []})
+    hilos = [threading.Thread(target=peticiones) for _ in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert cliente.estadisticas["peticiones"] == sum(servidor.respuestas.values())
+    assert servidor.respuestas[200] >= 160
@@ -0,0 +1,76 @@
+# tests/test_sign_json.py
+"""/sign-json con PDF en base64 (JSON) o binario, y la decodificación por bloques."""
+import base64, binascii
+from urllib.parse import quote
+
+import pytest
+
+from sello_monarca.sello import verify
+from sello_monarca.utils import base64_a_bytes
+
+from tests.conftest import META
+
+
+@pytest.mark.parametrize("bloque", [4, 7, 64, 1 << 20])
+def test_base64_por_bloques(bloque, pdf_original):
+    texto = base64.encodebytes(pdf_original).decode()        # con saltos de línea
+
+    assert base64_a_bytes(texto, bloque) == pdf_original
+    assert base64_a_bytes("data:application/pdf;base64," + texto, bloque) == pdf_original
+
+
+def test_base64_invalido():
+    with pytest.raises((binascii.Error, ValueError)):
+        base64_a_bytes("no*es*base64")
+
+
+def _sellado_valido(servidor, r):
+    assert r.status_code == 200
+    assert r.mimetype == "application/pdf"
+    valido, meta = verify(r.get_data(), servidor.PUBLIC_KEY, contenido=True)
+    assert valido and meta["id"] == r.headers["X-Doc-ID"]
+    return meta
+
+
+def test_json_con_base64(servidor, cliente, pdf_original):
+    cuerpo = dict(META, file_base64=base64.b64encode(pdf_original).decode())
+
+    meta = _sellado_valido(servidor, cliente.post("/sign-json", json=cuerpo))
+
+    assert meta["original_filename"] == META["original_filename"]
+
+
+def test_binario_con_query(servidor, cliente, pdf_original):
+    r = cliente.post("/sign-json", query_string=META, data=pdf_original,
+                     content_type="application/pdf")
+
+    meta = _sellado_valido(servidor, r)
+    assert meta["uploader"] == META["uploader"]
+
+
+def test_binario_con_cabeceras(servidor, cliente, pdf_original):
+    cabeceras = {"X-Uploader": quote("José Núñez"), "X-Area": "Calidad",
+                 "X-Original-Filename": quote("informe año.pdf")}
+
+    r = cliente.post("/sign-json", headers=cabeceras, data=pdf_original,
+                     content_type="application/octet-stream")
+
+    meta = _sellado_valido(servidor, r)
+    assert (meta["uploader"], meta["original_filename"]) == ("José Núñez", "informe año.pdf")
+
+
+@pytest.mark.parametrize("cuerpo,query", [
+    (b"", META),                                        # cuerpo vacío
+    (b"%PDF-1.4", {"uploader": "ana", "area": "x"}),    # falta original_filename
+])
+def test_binario_invalido(cliente, cuerpo, query):
+    r = cliente.post("/sign-json", query_string=query, data=cuerpo, content_type="application/pdf")
+
+    assert r.status_code == 400
+    assert "error" in r.json
+
+
+def test_tipo_no_soportado(cliente):
+    r = cliente.post("/sign-json", data="hola", content_type="text/plain")
+
+    assert r.status_code == 400
@@ -0,0 +1,54 @@
+# tests/test_suite.py
+"""Suite de benchmarks: resumen de mediciones y comparación contra una corrida base."""
+import json, subprocess, sys
+
+import suite
+
+from tests.conftest import RAIZ
+
+
+def _r(mediana_ms, pico_mb=10.0, **extra):
+    return {"mediana_ms": mediana_ms, "pico_mb": pico_mb, **extra}
+
+
+def test_resumen():
+    r = suite._resumen([0.010, 0.020, 0.030], 2 * 1024 * 1024, 1.26)
+
+    assert r["mediana_ms"] == 20.0
+    assert r["docs_s"] == 50.0
+    assert r["mb_s"] == 100.0
+    assert (r["pico_mb"], r["repeticiones"]) == (1.3, 3)
+
+
+def test_comparar_marca_solo_lo_que_empeora():
+    base = {"a": _r(10), "b": _r(10), "c": _r(10, salida_kb=100), "d": _r(10, pico_mb=100), "e": _r(10, pico_mb=1)}
+    actual = {
+        "a": _r(11.9),                      # dentro del umbral
+        "b": _r(12.1),                      # tiempo
+        "c": _r(10, salida_kb=121),         # tamaño de salida
+        "d": _r(10, pico_mb=121),           # memoria
+        "e": _r(10, pico_mb=5),             # sube menos de min_mb
+        "nueva": _r(1000),                  # sin base
+    }
+
+    regresiones = suite.comparar(actual, base, umbral=0.2, min_mb=5)
+
+    assert [(clave, metrica) for clave, metrica, _, _ in regresiones] == [
+        ("b", "mediana_ms"), ("c", "salida_kb"), ("d", "pico_mb")]
+
+
+def test_corrida_y_comparacion(tmp_path):
+    salida = tmp_path / "resultados.json"
+    comando = [sys.executable, "benchmarks/suite.py", "--etapas", "sellado", "verificacion",
+               "--paginas", "1", "--tipos", "texto", "--repeticiones", "2"]
+
+    subprocess.run(comando + ["--salida", str(salida)], cwd=RAIZ, check=True, capture_output=True)
+    informe = json.loads(salida.read_text(encoding="utf-8"))
+    assert set(informe["resultados"]) == {
+        "sellado/texto-1", "sellado_compacto/texto-1",
+        "verificacion_metadatos/texto-1", "verificacion_contenido/texto-1"}
+
+    r = subprocess.run(comando + ["--base", str(salida), "--umbral", "100", "--min-mb", "1000"],
+                       cwd=RAIZ, capture_output=True, text=True)
+    assert r.returncode == 0, r.stderr
+    assert "sin regresiones" in r.stdout
@@ -0,0 +1,113 @@
+# tests/test_trabajos.py
+"""Cola de trabajos asíncronos: resultados, errores, reintentos y concesiones vencidas."""
+import base64, os, time
+
+import pytest
+
+from sello_monarca.sello import verify
+from sello_monarca.trabajos import ColaTrabajos, Reintentar, ERROR, LISTO, PENDIENTE
+
+from tests.conftest import META
+
+
+def _cola(tmp_path, procesar, **kwargs):
+    return ColaTrabajos(str(tmp_path / "trabajos.sqlite3"), str(tmp_path / "spool"), procesar, **kwargs)
+
+
+def test_trabajo_listo(tmp_path):
+    recibidos = []
+    def procesar(ruta, user_meta, base_url):
+        with open(ruta, "rb") as f:
+            recibidos.append((f.read(), user_meta, base_url))
+        return {"doc_id": "abc"}
+    cola = _cola(tmp_path, procesar)
+    job_id = cola.encolar(b"%PDF-1.4", META, "http://x/")
+
+    assert cola.obtener(job_id)["estado"] == PENDIENTE
+    assert cola.procesar_uno()
+
+    trabajo = cola.obtener(job_id)
+    assert (trabajo["estado"], trabajo["resultado"]) == (LISTO, {"doc_id": "abc"})
+    assert recibidos == [(b"%PDF-1.4", META, "http://x/")]
+    assert os.listdir(tmp_path / "spool") == []
+    assert not cola.procesar_uno()
+
+
+def test_trabajo_con_error(tmp_path):
+    def procesar(ruta, user_meta, base_url):
+        raise ValueError("PDF dañado")
+    cola = _cola(tmp_path, procesar)
+    job_id = cola.encolar(b"%PDF-1.4", META, "http://x/")
+
+    cola.procesar_uno()
+
+    trabajo = cola.obtener(job_id)
+    assert (trabajo["estado"], trabajo["error"]) == (ERROR, "PDF dañado")
+
+
+def test_reintentar_devuelve_el_trabajo_a_la_cola(tmp_path):
+    respuestas = [Reintentar(), {"doc_id": "abc"}]
+    def procesar(ruta, user_meta, base_url):
+        r = respuestas.pop(0)
+        if isinstance(r, Exception):
+            raise r
+        return r
+    cola = _cola(tmp_path, procesar, max_intentos=1)
+    job_id = cola.encolar(b"%PDF-1.4", META, "http://x/")
+
+    assert not cola.procesar_uno()
+    assert cola.obtener(job_id)["estado"] == PENDIENTE
+    assert cola.obtener(job_id)["intentos"] == 0
+
+    cola.procesar_uno()
+    assert cola.obtener(job_id)["estado"] == LISTO
+
+
+def test_concesion_vencida_agota_los_intentos(tmp_path):
+    cola = _cola(tmp_path, lambda *a: {"doc_id": "abc"}, concesion=0, max_intentos=2)
+    job_id = cola.encolar(b"%PDF-1.4", META, "http://x/")
+
+    # Dos workers lo toman y mueren sin terminarlo
+    for _ in range(2):
+        assert cola._reclamar()["job_id"] == job_id
+        time.sleep(0.01)
+    cola.procesar_uno()
+
+    trabajo = cola.obtener(job_id)
+    assert (trabajo["estado"], trabajo["error"]) == (ERROR, "Se agotaron los intentos")
+
+
+def test_purgar_terminados(tmp_path):
+    cola = _cola(tmp_path, lambda *a: {}, retencion=0)
+    listo = cola.encolar(b"%PDF-1.4", META, "http://x/")
+    cola.procesar_uno()
+    pendiente = cola.encolar(b"%PDF-1.4", META, "http://x/")
+
+    assert cola.purgar() == 1
+    assert cola.obtener(listo) is None
+    assert cola.obtener(pendiente) is not None
+
+
+def _esperar_trabajo(cliente, job_id, limite=30.0):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        r = cliente.get(f"/jobs/{job_id}")
+        if r.status_code != 202:
+            return r
+        time.sleep(0.05)
+    pytest.fail(f"el trabajo {job_id} no terminó")
+
+
+def test_sign_json_async(servidor, cliente, pdf_original):
+    cuerpo = dict(META, file_base64=base64.b64encode(pdf_original).decode())
+
+    r = cliente.post("/sign-json?async=1", json=cuerpo)
+
+    assert r.status_code == 202
+    assert r.headers["Location"] == r.json["status_url"]
+    r = _esperar_trabajo(cliente, r.json["job_id"])
+    assert r.json["estado"] == LISTO
+    pdf = cliente.get(f"/jobs/{r.json['job_id']}?formato=pdf")
+    assert pdf.headers["X-Doc-ID"] == r.json["doc_id"]
+    assert verify(pdf.get_data(), servidor.PUBLIC_KEY, contenido=True)[0]
+    assert cliente.get("/jobs/no-existe").status_code == 404
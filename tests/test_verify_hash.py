@@ -0,0 +1,34 @@
+# tests/test_verify_hash.py
+"""/verify-hash: verificación por el SHA-256 del archivo sellado, sin subirlo."""
+from hashlib import sha256
+
+import pytest
+
+from tests.conftest import sellar_en_app
+
+
+def test_huella_conocida(cliente, pdf_original):
+    doc_id = sellar_en_app(cliente, pdf_original).json["doc_id"]
+    huella = sha256(cliente.get(f"/file/{doc_id}").get_data()).hexdigest()
+
+    r = cliente.get(f"/verify-hash/{huella}")
+
+    assert r.status_code == 200
+    assert r.json["valid"] and r.json["known"]
+    assert r.json["mode"] == "hash"
+    assert r.json["meta"]["id"] == doc_id
+    assert cliente.get(f"/verify-hash/{huella.upper()}").json["meta"]["id"] == doc_id
+
+
+def test_el_original_no_es_el_sellado(cliente, pdf_original):
+    sellar_en_app(cliente, pdf_original)
+
+    r = cliente.get(f"/verify-hash/{sha256(pdf_original).hexdigest()}")
+
+    assert r.status_code == 404
+    assert r.json["known"] is False
+
+
+@pytest.mark.parametrize("huella", ["abc", "z" * 64, "0" * 65])
+def test_huella_mal_formada(cliente, huella):
+    assert cliente.get(f"/verify-hash/{huella}").status_code == 400
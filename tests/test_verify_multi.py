@@ -0,0 +1,69 @@
+# tests/test_verify_multi.py
+"""/verify con varios PDFs: una línea NDJSON por archivo y un resumen final."""
+import io, json, zipfile
+
+import pytest
+
+from tests.conftest import META, sellar_en_app
+
+
+def _lineas(r):
+    assert r.status_code == 200
+    assert r.mimetype == "application/x-ndjson"
+    lineas = [json.loads(l) for l in r.get_data(as_text=True).splitlines()]
+    resultados = sorted(lineas[:-1], key=lambda l: l["index"])
+    return resultados, lineas[-1]
+
+
+@pytest.fixture
+def archivos(cliente, pdf_original):
+    """(nombre, bytes): dos sellados válidos, uno alterado en el cuerpo y uno que no es PDF."""
+    doc_id = sellar_en_app(cliente, pdf_original).json["doc_id"]
+    sellado = cliente.get(f"/file/{doc_id}").get_data()
+    alterado = bytearray(sellado)
+    alterado[200] ^= 1
+    return [("a.pdf", sellado), ("b.pdf", sellado), ("alterado.pdf", bytes(alterado)),
+            ("roto.pdf", b"esto no es un PDF")]
+
+
+@pytest.mark.parametrize("modo,validos", [("metadatos", [True, True, True, False]),
+                                          ("contenido", [True, True, False, False])])
+def test_varios_archivos(cliente, archivos, modo, validos):
+    datos = {"files": [(io.BytesIO(pdf), nombre) for nombre, pdf in archivos], "modo": modo}
+
+    resultados, fin = _lineas(cliente.post("/verify", data=datos))
+
+    assert [r["filename"] for r in resultados] == [n for n, _ in archivos]
+    assert [r["valid"] for r in resultados] == validos
+    assert all(r["mode"] == modo for r in resultados)
+    assert resultados[0]["meta"]["uploader"] == META["uploader"]
+    assert "error" in resultados[3]
+    assert fin == {"done": True, "total": 4, "valid": sum(validos)}
+
+
+def test_zip(cliente, archivos):
+    datos = io.BytesIO()
+    with zipfile.ZipFile(datos, "w") as zf:
+        for nombre, pdf in archivos:
+            zf.writestr(f"carpeta/{nombre}", pdf)
+        zf.writestr("leeme.txt", "no es un PDF")
+    datos.seek(0)
+
+    resultados, fin = _lineas(cliente.post("/verify", data={"zip": (datos, "lote.zip")}))
+
+    assert [r["filename"] for r in resultados] == [n for n, _ in archivos]
+    assert fin["total"] == 4 and fin["valid"] == 3
+
+
+def test_file_repetido_es_multiple(cliente, archivos):
+    datos = {"file": [(io.BytesIO(pdf), nombre) for nombre, pdf in archivos[:2]]}
+
+    _, fin = _lineas(cliente.post("/verify", data=datos))
+
+    assert fin == {"done": True, "total": 2, "valid": 2}
+
+
+def test_zip_invalido(cliente):
+    r = cliente.post("/verify", data={"zip": (io.BytesIO(b"no es zip"), "lote.zip")})
+
+    assert r.status_code == 400